@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# bench_reader.py
+#
+# Compare the throughput of the chunked subprocess reader against the
+# per-line select/readline loop of mycommunicate in pynfdump 0.5.0.
+#
+# usage: python benchmarks/bench_reader.py [rows]
+
+import os
+import sys
+import time
+import select
+import tempfile
+from subprocess import Popen, PIPE
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pynfdump import nfdump
+
+LINE = "2|1235500152|664|1235500152|676|6|0|0|0|1234567890|1672|0|0|0|1122112211|80|0|0|5|7|17|0|2|80\n"
+
+def readline_communicate(cmds):
+    """mycommunicate as released in pynfdump 0.5.0, kept here for comparison"""
+    pipe = Popen(cmds, stdout=PIPE,stderr=PIPE)
+    read_set = [pipe.stderr, pipe.stdout]
+    while read_set:
+        rlist, wlist, xlist = select.select(read_set, [], [])
+
+        if pipe.stdout in rlist:
+            data = pipe.stdout.readline()
+            if data == "":
+                pipe.stdout.close()
+                read_set.remove(pipe.stdout)
+            else:
+                yield nfdump.STDOUT, data
+
+        if pipe.stderr in rlist:
+            data = os.read(pipe.stderr.fileno(), 1024)
+            if data == "":
+                pipe.stderr.close()
+                read_set.remove(pipe.stderr)
+            else:
+                yield nfdump.STDERR, data
+    pipe.wait()
+
+def bench(name, func, cmds, rows):
+    start = time.time()
+    count = 0
+    for fd, data in func(cmds):
+        count += 1
+    elapsed = time.time() - start
+    assert count == rows, (name, count)
+    print "%-16s %8.3fs %12d rows/sec" % (name, elapsed, rows / elapsed)
+
+def main():
+    rows = 1000000
+    if len(sys.argv) > 1:
+        rows = int(sys.argv[1])
+
+    fd, fn = tempfile.mkstemp()
+    try:
+        f = os.fdopen(fd, 'w')
+        f.write(LINE * rows)
+        f.close()
+        cmds = ['cat', fn]
+        bench("0.5.0 readline", readline_communicate, cmds, rows)
+        bench("chunked", nfdump.mycommunicate, cmds, rows)
+    finally:
+        os.unlink(fn)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# compare.py
+#
+# Compare two result files written by run.py.
+#
+# usage: python benchmarks/compare.py [-t 0.1] old.json new.json
+#
+# Exits non-zero if any benchmark lost more than the threshold in rows/sec
+# or grew more than the threshold in peak RSS.
+
+import sys
+import json
+from optparse import OptionParser
+
+def compare(old, new, threshold):
+    regressions = []
+    print "%-20s %14s %14s %7s %10s %10s %7s" % ('benchmark', 'old rows/s', 'new rows/s', 'change', 'old KB', 'new KB', 'change')
+    for name in sorted(new['results']):
+        if name not in old['results']:
+            continue
+        o = old['results'][name]
+        n = new['results'][name]
+        speed = n['rows_per_sec'] / o['rows_per_sec'] - 1
+        rss = float(n['peak_rss_kb']) / o['peak_rss_kb'] - 1
+        flag = ""
+        if speed < -threshold or rss > threshold:
+            flag = " REGRESSION"
+            regressions.append(name)
+        print "%-20s %14d %14d %+6.1f%% %10d %10d %+6.1f%%%s" % (name, o['rows_per_sec'], n['rows_per_sec'],
+            speed * 100, o['peak_rss_kb'], n['peak_rss_kb'], rss * 100, flag)
+    return regressions
+
+def main():
+    parser = OptionParser(usage="%prog [options] old.json new.json")
+    parser.add_option("-t", "--threshold", dest="threshold", action="store", type="float", default=0.1,
+        help="allowed fractional change")
+    (options, args) = parser.parse_args()
+    if len(args) != 2:
+        parser.error("specify two result files")
+    old, new = [json.load(open(fn)) for fn in args]
+    if compare(old, new, options.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# run.py
+#
+# Measure pynfdump throughput and memory use against benchmarks/fake_nfdump.
+#
+# usage: python benchmarks/run.py [-r rows] [-o results.json] [-l label] [name ...]
+#
+# Each benchmark runs in its own process so the peak RSS it reports is its
+# own.  Results are written as JSON, compare two runs with compare.py.
+
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import tempfile
+import subprocess
+from optparse import OptionParser, SUPPRESS_HELP
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TOP = os.path.dirname(HERE)
+FAKE_NFDUMP = os.path.join(HERE, "fake_nfdump")
+sys.path.insert(0, TOP)
+
+import pynfdump
+from pynfdump import nfdump
+
+BENCHMARKS = []
+def benchmark(func):
+    BENCHMARKS.append(func.__name__)
+    return func
+
+def fake_env(rows, **extra):
+    env = dict(os.environ)
+    env["FAKE_NFDUMP_ROWS"] = str(rows)
+    env["PYTHONPATH"] = TOP
+    for k, v in extra.items():
+        env["FAKE_NFDUMP_" + k.upper()] = str(v)
+    return env
+
+def fake_output(rows, *args):
+    """Return the lines fake_nfdump prints for args"""
+    cmd = [sys.executable, FAKE_NFDUMP] + list(args)
+    out = subprocess.Popen(cmd, stdout=subprocess.PIPE, env=fake_env(rows)).communicate()[0]
+    return out.splitlines(True)
+
+def fake_dumper(**kw):
+    return pynfdump.Dumper(executable_path=FAKE_NFDUMP, **kw)
+
+def run_script(rows, name, *args):
+    """Run one of the scripts with fake_nfdump installed as nfdump"""
+    bindir = tempfile.mkdtemp()
+    try:
+        os.symlink(FAKE_NFDUMP, os.path.join(bindir, "nfdump"))
+        env = fake_env(rows)
+        env["PATH"] = bindir + os.pathsep + env.get("PATH", "")
+        devnull = open(os.devnull, 'w')
+        try:
+            subprocess.check_call([sys.executable, os.path.join(TOP, "scripts", name)] + list(args),
+                stdout=devnull, env=env)
+        finally:
+            devnull.close()
+    finally:
+        os.unlink(os.path.join(bindir, "nfdump"))
+        os.rmdir(bindir)
+    return rows
+
+#each benchmark takes a row count, does its setup, and returns a function
+#that does the measured work and returns the number of rows it handled
+
+@benchmark
+def parse_search(rows):
+    lines = fake_output(rows, "-q", "-o", "pipe")
+    d = fake_dumper()
+    def work():
+        n = 0
+        for r in d.parse_search(lines):
+            r.bytes
+            n += 1
+        return n
+    return work
+
+@benchmark
+def parse_search_fields(rows):
+    lines = fake_output(rows, "-q", "-o", "pipe")
+    d = fake_dumper()
+    def work():
+        n = 0
+        for r in d.parse_search(lines):
+            r['first'], r['srcip'], r['dstip'], r['prot']
+            n += 1
+        return n
+    return work
+
+@benchmark
+def parse_stats(rows):
+    lines = fake_output(rows, "-s", "ip/bytes", "-n", str(rows))
+    d = fake_dumper()
+    def work():
+        n = 0
+        for r in d.parse_stats(lines, 'ip'):
+            r['ip']
+            n += 1
+        return n
+    return work
+
+@benchmark
+def parse_flow_stats(rows):
+    lines = fake_output(rows, "-I")
+    d = fake_dumper()
+    iterations = max(1, rows // 10)
+    def work():
+        for i in xrange(iterations):
+            d.parse_flow_stats(lines)
+        return iterations
+    return work
+
+@benchmark
+def mycommunicate(rows):
+    cmd = [sys.executable, FAKE_NFDUMP, "-q", "-o", "pipe"]
+    os.environ.update(fake_env(rows))
+    def work():
+        n = 0
+        for fd, line in nfdump.mycommunicate(cmd):
+            n += 1
+        return n
+    return work
+
+@benchmark
+def search(rows):
+    os.environ.update(fake_env(rows))
+    d = fake_dumper()
+    def work():
+        n = 0
+        for r in d.search():
+            r.bytes
+            n += 1
+        return n
+    return work
+
+@benchmark
+def csv_export(rows):
+    def work():
+        return run_script(rows, "nfdump-csv-export", "-d", "/data", "-o", "src", "-s", "2009-02-24 13:00")
+    return work
+
+@benchmark
+def top_talkers(rows):
+    def work():
+        return run_script(rows, "nfdump-top-talkers", "-d", "/data", "-o", "src", "-s", "2009-02-24 13:00")
+    return work
+
+def run_child(name, rows):
+    """Run a single benchmark in this process and print its result"""
+    work = globals()[name](rows)
+    start = time.time()
+    handled = work()
+    elapsed = time.time() - start
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    json.dump({
+        'rows': handled,
+        'seconds': elapsed,
+        'rows_per_sec': handled / elapsed if elapsed else 0,
+        'peak_rss_kb': rss,
+    }, sys.stdout)
+
+def run(names, rows):
+    results = {}
+    for name in names:
+        out = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", name, "-r", str(rows)],
+            stdout=subprocess.PIPE).communicate()[0]
+        results[name] = r = json.loads(out)
+        sys.stderr.write("%-20s %10.3fs %12d rows/sec %8d KB\n" % (name, r['seconds'], r['rows_per_sec'], r['peak_rss_kb']))
+    return results
+
+def main():
+    parser = OptionParser(usage="%prog [options] [benchmark ...]")
+    parser.add_option("-r", "--rows",   dest="rows",   action="store", type="int", default=100000, help="rows per benchmark")
+    parser.add_option("-o", "--output", dest="output", action="store", help="write JSON results to this file")
+    parser.add_option("-l", "--label",  dest="label",  action="store", help="label for this run, like a version")
+    parser.add_option("--child",        dest="child",  action="store", help=SUPPRESS_HELP)
+    (options, args) = parser.parse_args()
+
+    if options.child:
+        return run_child(options.child, options.rows)
+
+    names = args or BENCHMARKS
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark %s, choose from %s" % (name, ", ".join(BENCHMARKS)))
+
+    doc = {
+        'label': options.label,
+        'python': platform.python_version(),
+        'time': int(time.time()),
+        'rows': options.rows,
+        'results': run(names, options.rows),
+    }
+    if options.output:
+        f = open(options.output, 'w')
+        json.dump(doc, f, indent=2, sort_keys=True)
+        f.close()
+    else:
+        json.dump(doc, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+
+if __name__ == "__main__":
+    main()
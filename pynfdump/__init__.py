@@ -1 +1 @@
-from nfdump import Dumper, NFDumpError, search_file
+from nfdump import Dumper, NFDumpError, search_file, export_file
@@ -0,0 +1,442 @@
+# aggregate.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+Compute nfdump style statistics from flow records in python
+"""
+
+import os
+import heapq
+import shutil
+import tempfile
+import cPickle as pickle
+
+from IPy import IP
+
+from pynfdump.nfdump import NFDumpError, AF_INET6, _words_to_int
+from pynfdump.merge import StatTotal, top_stats, DEFAULT_STAT_ORDER
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def _addr(start):
+    end = start + 4
+    return lambda p: (p[0], tuple(p[start:end]))
+
+def _field(idx):
+    return lambda p: (0, (p[idx],))
+
+#for each nfdump -s statistic, the functions that extract its objects
+#from the parts of a FlowRecord.  Objects are (af, fields) tuples.
+STAT_KEYS = {
+    'srcip':    [_addr(6)],
+    'dstip':    [_addr(11)],
+    'ip':       [_addr(6), _addr(11)],
+    'srcport':  [_field(10)],
+    'dstport':  [_field(15)],
+    'port':     [_field(10), _field(15)],
+    'srcas':    [_field(16)],
+    'dstas':    [_field(17)],
+    'as':       [_field(16), _field(17)],
+    'inif':     [_field(18)],
+    'outif':    [_field(19)],
+    'proto':    [_field(5)],
+}
+
+#for each nfdump -s statistic, the nfdump filter matching one of its objects
+STAT_FILTERS = {
+    'srcip':    'src host %s',
+    'dstip':    'dst host %s',
+    'ip':       'host %s',
+    'srcport':  'src port %s',
+    'dstport':  'dst port %s',
+    'port':     'port %s',
+    'srcas':    'src as %s',
+    'dstas':    'dst as %s',
+    'as':       'as %s',
+    'inif':     'in if %s',
+    'outif':    'out if %s',
+    'proto':    'proto %s',
+}
+
+def stat_filter(statistic, records):
+    """Return an nfdump filter matching the flows that count towards any of
+    the statistics records"""
+    try:
+        expr = STAT_FILTERS[statistic]
+    except KeyError:
+        raise NFDumpError("Unsupported statistic %r" % statistic)
+    return " or ".join(expr % r.key for r in records)
+
+def stat_keys(statistic):
+    """Return a function that returns the list of statistics objects a flow
+    counts towards"""
+    try:
+        funcs = STAT_KEYS[statistic]
+    except KeyError:
+        raise NFDumpError("Unsupported statistic %r" % statistic)
+    if len(funcs) == 1:
+        f = funcs[0]
+        return lambda p: [f(p)]
+    a, b = funcs
+    def keys(p):
+        ka = a(p)
+        kb = b(p)
+        if ka == kb:
+            return [ka]
+        return [ka, kb]
+    return keys
+
+def parse_stat_spec(spec):
+    """Split 'ip/bytes' into ('ip', 'bytes')"""
+    if "/" in spec:
+        stat, order = spec.split("/", 1)
+    else:
+        stat, order = spec, DEFAULT_STAT_ORDER
+    return stat, order
+
+def _add(totals, key, rec):
+    t = totals.get(key)
+    if t is None:
+        af, fields = key
+        t = totals[key] = StatTotal((af, 0, fields), rec.first_ms, rec.last_ms)
+    t.add(rec.first_ms, rec.last_ms, 1, rec.packets, rec.bytes)
+
+class StatCounter(object):
+    """Count flows, packets and bytes per statistics object, like nfdump -s"""
+    def __init__(self, statistic):
+        self.statistic = statistic
+        self.keys = stat_keys(statistic)
+        self.totals = {}
+
+    def add(self, rec):
+        for k in self.keys(rec.parts):
+            _add(self.totals, k, rec)
+
+    def top(self, order=None, limit=None, protocols=None):
+        return top_stats(self.totals.itervalues(), self.statistic, order, limit, protocols)
+
+def _record_key(r):
+    p = r.parts
+    return (p[0], tuple(p[6:-6]))
+
+def drilldown(records, top, first, second, n, protocols=None):
+    """For each of the top objects of the first statistic, compute the top n
+    objects for the second statistic over the flows in records that involve
+    it.  Only the objects in top are counted, so memory use does not depend
+    on how many other objects the flows have.
+
+    top is the list of StatRecords for the first statistic, like the result
+    of a statistics search or :func:`StatCounter.top`.  first and second are
+    'statistic/order' strings like 'ip/bytes'.
+    Returns a list of (StatRecord, [StatRecord, ...]) tuples.
+    """
+    s1, o1 = parse_stat_spec(first)
+    s2, o2 = parse_stat_spec(second)
+    keys1 = stat_keys(s1)
+    keys2 = stat_keys(s2)
+    pairs = dict((_record_key(r), {}) for r in top)
+    for rec in records:
+        p = rec.parts
+        second_keys = None
+        for k1 in keys1(p):
+            sub = pairs.get(k1)
+            if sub is None:
+                continue
+            if second_keys is None:
+                second_keys = keys2(p)
+            for k2 in second_keys:
+                _add(sub, k2, rec)
+
+    return [(r, top_stats(pairs[_record_key(r)].itervalues(), s2, o2, n, protocols)) for r in top]
+
+class Net(tuple):
+    """A network address used as a group by key: (af, address, prefix length)"""
+    __slots__ = ()
+
+    def __new__(cls, af, addr, bits):
+        return tuple.__new__(cls, (af, addr, bits))
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+    def __str__(self):
+        af, addr, bits = self
+        if af == AF_INET6:
+            ip, full = IP(addr, ipversion=6), 128
+        else:
+            ip, full = IP(addr, ipversion=4), 32
+        if bits == full:
+            return str(ip)
+        return "%s/%d" % (ip, bits)
+
+    def __repr__(self):
+        return "Net(%r)" % str(self)
+
+def _mask(bits, width):
+    return ((1 << bits) - 1) << (width - bits)
+
+#columns of a FlowBatch that can be grouped on directly
+GROUP_COLUMNS = ('af', 'proto', 'srcport', 'dstport', 'srcas', 'dstas', 'input',
+                 'output', 'flags', 'tos')
+
+class _ColumnKey(object):
+    def __init__(self, name):
+        self.name = name
+        self.width = 1
+
+    def scalar(self, rec):
+        return getattr(rec, self.name)
+
+    def columns(self, batch):
+        return [getattr(batch, self.name).astype(numpy.uint64)]
+
+    def from_row(self, values):
+        return int(values[0])
+
+class _PrefixKey(object):
+    def __init__(self, field, bits4=32, bits6=128):
+        if field not in ('srcip', 'dstip'):
+            raise NFDumpError("Can not group %r by prefix" % field)
+        if not (0 <= bits4 <= 32 and 0 <= bits6 <= 128):
+            raise NFDumpError("Invalid prefix length %s/%s" % (bits4, bits6))
+        self.start = field == 'srcip' and 6 or 11
+        self.prefix = field == 'srcip' and 'src' or 'dst'
+        self.bits4 = bits4
+        self.bits6 = bits6
+        self.mask4 = _mask(bits4, 32)
+        self.mask6 = _mask(bits6, 128)
+        self.width = 3
+
+    def scalar(self, rec):
+        p = rec.parts
+        s = self.start
+        af = p[0]
+        addr = _words_to_int(af, p[s], p[s+1], p[s+2], p[s+3])
+        if af == AF_INET6:
+            return Net(af, addr & self.mask6, self.bits6)
+        return Net(af, addr & self.mask4, self.bits4)
+
+    def columns(self, batch):
+        u64 = numpy.uint64
+        hi = getattr(batch, self.prefix + '_hi')
+        lo = getattr(batch, self.prefix + '_lo')
+        v6 = batch.af == AF_INET6
+        hi = numpy.where(v6, hi & u64(self.mask6 >> 64), u64(0))
+        lo = numpy.where(v6, lo & u64(self.mask6 & 0xffffffffffffffff), lo & u64(self.mask4))
+        return [batch.af.astype(u64), hi, lo]
+
+    def from_row(self, values):
+        af, hi, lo = [int(v) for v in values]
+        if af == AF_INET6:
+            return Net(af, (hi << 64) | lo, self.bits6)
+        return Net(af, lo, self.bits4)
+
+class _TimeKey(object):
+    def __init__(self, field, seconds):
+        if field not in ('first', 'last'):
+            raise NFDumpError("Can not group %r by time" % field)
+        if seconds <= 0:
+            raise NFDumpError("Invalid time bucket %r" % seconds)
+        self.idx = field == 'first' and 1 or 3
+        self.field = field
+        self.seconds = seconds
+        self.width = 1
+
+    def scalar(self, rec):
+        t = rec.parts[self.idx]
+        return t - t % self.seconds
+
+    def columns(self, batch):
+        t = getattr(batch, self.field) // 1000
+        return [(t - t % self.seconds).astype(numpy.uint64)]
+
+    def from_row(self, values):
+        return int(values[0])
+
+class _FuncKey(object):
+    def __init__(self, func):
+        self.scalar = func
+        self.columns = None
+
+def cidr(field, bits4=32, bits6=128):
+    """Group by the srcip or dstip network, like cidr('srcip', 24)"""
+    return _PrefixKey(field, bits4, bits6)
+
+def time_bucket(seconds, field='first'):
+    """Group by the start of the seconds long interval containing first"""
+    return _TimeKey(field, seconds)
+
+def _key_part(spec):
+    if isinstance(spec, (_ColumnKey, _PrefixKey, _TimeKey, _FuncKey)):
+        return spec
+    if callable(spec):
+        return _FuncKey(spec)
+    parts = spec.split("/")
+    name, args = parts[0], [int(a) for a in parts[1:]]
+    if name in ('srcip', 'dstip'):
+        return _PrefixKey(name, *args)
+    if name in ('first', 'last'):
+        if len(args) != 1:
+            raise NFDumpError("Group by %s needs a bucket size, like %s/3600" % (name, name))
+        return _TimeKey(name, args[0])
+    if name in GROUP_COLUMNS and not args:
+        return _ColumnKey(name)
+    raise NFDumpError("Can not group by %r" % spec)
+
+SUM_ORDERS = ('flows', 'packets', 'bytes')
+
+class GroupBy(object):
+    """Sum flows, packets and bytes of flow records per key.
+
+    key is a field name like 'dstport', a network like 'srcip/24' (or
+    'srcip/24/64' to also mask IPv6 addresses), a time bucket like
+    'first/3600', the result of :func:`cidr` or :func:`time_bucket`, any
+    function of a :class:`pynfdump.nfdump.FlowRecord`, or a list of these to
+    group by a tuple.
+
+    :class:`pynfdump.nfdump.FlowBatch` objects passed to :func:`add_batch`
+    are grouped with numpy unless the key includes a function.
+
+    When more than max_keys groups are held, they are written out to
+    partition files in spill_dir (a temporary directory by default) and
+    merged one partition at a time when the results are read.
+    """
+    def __init__(self, key, max_keys=None, spill_dir=None, partitions=16):
+        self.is_tuple = isinstance(key, (list, tuple))
+        specs = self.is_tuple and key or [key]
+        self.parts = [_key_part(k) for k in specs]
+        self.vectorized = numpy is not None and all(p.columns for p in self.parts)
+        self.totals = {}
+        self.max_keys = max_keys
+        self.spill_dir = spill_dir
+        self.partitions = partitions
+        self.spill_files = None
+        self._tmpdir = None
+
+    def key(self, rec):
+        if self.is_tuple:
+            return tuple([p.scalar(rec) for p in self.parts])
+        return self.parts[0].scalar(rec)
+
+    def add(self, rec):
+        k = self.key(rec)
+        t = self.totals.get(k)
+        if t is None:
+            self.totals[k] = [1, rec.packets, rec.bytes]
+            if self.max_keys and len(self.totals) > self.max_keys:
+                self.spill()
+        else:
+            t[0] += 1
+            t[1] += rec.packets
+            t[2] += rec.bytes
+
+    def update(self, records):
+        for rec in records:
+            self.add(rec)
+
+    def add_batch(self, batch):
+        """Add every flow of a :class:`pynfdump.nfdump.FlowBatch`"""
+        if not len(batch):
+            return
+        if not self.vectorized:
+            return self.update(batch.records())
+        cols = []
+        for p in self.parts:
+            cols.extend(p.columns(batch))
+        rows, inverse = numpy.unique(numpy.column_stack(cols), axis=0, return_inverse=True)
+        n = len(rows)
+        flows = numpy.bincount(inverse, minlength=n)
+        packets = numpy.bincount(inverse, weights=batch.packets, minlength=n)
+        bytes = numpy.bincount(inverse, weights=batch.bytes, minlength=n)
+        totals = self.totals
+        for row, f, pk, b in zip(rows.tolist(), flows.tolist(), packets.tolist(), bytes.tolist()):
+            key = []
+            i = 0
+            for p in self.parts:
+                key.append(p.from_row(row[i:i+p.width]))
+                i += p.width
+            key = self.is_tuple and tuple(key) or key[0]
+            t = totals.get(key)
+            if t is None:
+                totals[key] = [f, int(pk), int(b)]
+            else:
+                t[0] += f
+                t[1] += int(pk)
+                t[2] += int(b)
+        if self.max_keys and len(totals) > self.max_keys:
+            self.spill()
+
+    def update_batches(self, batches):
+        for b in batches:
+            self.add_batch(b)
+
+    def spill(self):
+        """Append the groups in memory to the partition files"""
+        if self.spill_files is None:
+            self._tmpdir = tempfile.mkdtemp(prefix="pynfdump-groupby-", dir=self.spill_dir)
+            self.spill_files = [os.path.join(self._tmpdir, "part.%d" % i) for i in range(self.partitions)]
+        parts = [[] for f in self.spill_files]
+        for k, t in self.totals.iteritems():
+            parts[hash(k) % self.partitions].append((k, t))
+        for fn, items in zip(self.spill_files, parts):
+            if items:
+                f = open(fn, 'ab')
+                pickle.dump(items, f, pickle.HIGHEST_PROTOCOL)
+                f.close()
+        self.totals = {}
+
+    def _partitions(self):
+        if self.spill_files is None:
+            yield self.totals
+            return
+        self.spill()
+        for fn in self.spill_files:
+            if not os.path.exists(fn):
+                continue
+            totals = {}
+            f = open(fn, 'rb')
+            try:
+                while True:
+                    try:
+                        items = pickle.load(f)
+                    except EOFError:
+                        break
+                    for k, t in items:
+                        cur = totals.get(k)
+                        if cur is None:
+                            totals[k] = t
+                        else:
+                            cur[0] += t[0]
+                            cur[1] += t[1]
+                            cur[2] += t[2]
+            finally:
+                f.close()
+            yield totals
+
+    def groups(self):
+        """Yield (key, flows, packets, bytes) for every group, in no order"""
+        for totals in self._partitions():
+            for k, t in totals.iteritems():
+                yield k, t[0], t[1], t[2]
+
+    def top(self, n=10, order='bytes'):
+        """Return the n largest (key, flows, packets, bytes) groups by order"""
+        if order not in SUM_ORDERS:
+            raise NFDumpError("Unknown group order %r" % order)
+        idx = SUM_ORDERS.index(order) + 1
+        best = []
+        for totals in self._partitions():
+            items = ((k, t[0], t[1], t[2]) for k, t in totals.iteritems())
+            best = heapq.nlargest(n, best + heapq.nlargest(n, items, key=lambda g: g[idx]), key=lambda g: g[idx])
+        return best
+
+    def close(self):
+        """Remove the spill files"""
+        if self._tmpdir:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = self.spill_files = None
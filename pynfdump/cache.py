@@ -0,0 +1,198 @@
+# cache.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+On disk cache of nfdump output for queries over closed nfcapd files
+"""
+
+import os
+import time
+import errno
+import hashlib
+
+from pynfdump.nfdump import run_chunks, split_lines, READ_SIZE
+
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+#files modified more recently than this many seconds ago are never cached
+DEFAULT_MIN_AGE = 60
+
+class ResultCache(object):
+    """A size bounded, least recently used cache of nfdump output.
+
+    Entries are keyed on the full nfdump command line and the name, size and
+    modification time of every file the command reads, so a changed file is
+    never served from the cache.  The raw output is stored, hits are parsed
+    the same way as a fresh nfdump run.
+
+    :param path: directory to store the cached output in
+    :param max_size: total size of the cache in bytes
+    :param min_age: don't cache queries over files modified in the last
+        min_age seconds
+    """
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE, min_age=DEFAULT_MIN_AGE):
+        self.path = path
+        self.max_size = max_size
+        self.min_age = min_age
+        self.hits = self.misses = 0
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def key(self, cmd, files):
+        h = hashlib.sha1()
+        h.update(repr(list(cmd)))
+        h.update(repr(list(files)))
+        return h.hexdigest()
+
+    def cacheable(self, files):
+        """Return True if the output of a query over files can be cached.
+        files is a list of (filename, size, mtime) tuples"""
+        if not files:
+            return False
+        cutoff = time.time() - self.min_age
+        for fn, size, mtime in files:
+            if mtime > cutoff:
+                return False
+        return True
+
+    def _entry(self, key):
+        return os.path.join(self.path, key)
+
+    def lookup(self, key):
+        """Return the filename of the entry for key, or None"""
+        fn = self._entry(key)
+        try:
+            #the modification time records when the entry was last used
+            os.utime(fn, None)
+        except OSError, e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        return fn
+
+    def read_chunks(self, fn):
+        """Yield lists of lines from a cache entry"""
+        f = open(fn, 'rb')
+        try:
+            tail = ''
+            while True:
+                data = f.read(READ_SIZE)
+                if not data:
+                    break
+                lines, tail = split_lines(tail, data)
+                if lines:
+                    yield lines
+            if tail:
+                yield [tail]
+        finally:
+            f.close()
+
+    def begin(self, cmd, files, stats=None):
+        """Look up the output of cmd over files.  Returns the filename of the
+        entry on a hit, or a :class:`CacheWriter` to store the output in
+        when it can be cached, as a (filename, writer) tuple"""
+        if not self.cacheable(files):
+            return None, None
+        key = self.key(cmd, files)
+        fn = self.lookup(key)
+        if fn:
+            self.hits += 1
+            if stats is not None:
+                stats.cache_hit = True
+            return fn, None
+        self.misses += 1
+        return None, CacheWriter(self, key)
+
+    def run_chunks(self, cmd, files, stats=None, control=None):
+        """Like :func:`pynfdump.nfdump.run_chunks`, but serve the output from
+        the cache when possible and store it otherwise"""
+        fn, writer = self.begin(cmd, files, stats)
+        if fn:
+            return self.read_chunks(fn)
+        chunks = run_chunks(cmd, stats, control)
+        if writer is None:
+            return chunks
+        return writer.store(chunks)
+
+    def _store_chunks(self, key, chunks):
+        return CacheWriter(self, key).store(chunks)
+
+    def entries(self):
+        """Return a list of (last used time, size, filename) for each entry"""
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(".tmp"):
+                continue
+            fn = os.path.join(self.path, name)
+            try:
+                st = os.stat(fn)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, fn))
+        return entries
+
+    def size(self):
+        return sum(size for used, size, fn in self.entries())
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in
+        max_size"""
+        entries = sorted(self.entries())
+        total = sum(size for used, size, fn in entries)
+        for used, size, fn in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(fn)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for used, size, fn in self.entries():
+            os.unlink(fn)
+
+class CacheWriter(object):
+    """The output of one query on its way into a :class:`ResultCache`.  It
+    only becomes an entry if the whole output was written"""
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.fn = cache._entry(key)
+        self.tmp = "%s.%d.%d.tmp" % (self.fn, os.getpid(), id(self))
+        self.f = None
+        self.closed = False
+
+    def write(self, lines):
+        if self.f is None:
+            self.f = open(self.tmp, 'wb')
+        self.f.writelines(lines)
+
+    def close(self, complete):
+        """Turn the output into an entry if complete, otherwise drop it"""
+        if self.closed:
+            return
+        self.closed = True
+        if complete and self.f is None:
+            #empty output
+            self.f = open(self.tmp, 'wb')
+        if self.f is None:
+            return
+        self.f.close()
+        self.f = None
+        if complete:
+            os.rename(self.tmp, self.fn)
+            self.cache.evict()
+        else:
+            os.unlink(self.tmp)
+
+    def store(self, chunks):
+        """Write lists of lines as they pass through"""
+        complete = False
+        try:
+            for lines in chunks:
+                self.write(lines)
+                yield lines
+            complete = True
+        finally:
+            self.close(complete)
@@ -0,0 +1,172 @@
+# catalog.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+Cached listings of nfsen profiles and nfcapd files
+"""
+
+import os
+import time
+import datetime
+import threading
+from collections import namedtuple
+
+from pynfdump.nfdump import NFCAPD_RE, FILE_FMT, date_to_fn
+
+DEFAULT_TTL = 60
+
+#nfsen's SUBDIRLAYOUT settings, the directories nfcapd files are stored in
+SUBDIR_LAYOUTS = {
+    0: None,
+    1: "%Y/%m/%d",
+    2: "%Y/%m/%d/%H",
+    3: "%Y/%W/%u",
+    4: "%Y/%W/%u/%H",
+    5: "%Y/%j",
+    6: "%Y/%j/%H",
+    7: "%Y-%m-%d",
+    8: "%Y-%m-%d/%H",
+}
+
+HOUR = datetime.timedelta(hours=1)
+
+#a file a query will read.  rows is the number of flows from the file's
+#stat record, or None if it could not be read
+CatalogFile = namedtuple('CatalogFile', 'path name size rows')
+
+def fn_to_date(name):
+    return datetime.datetime.strptime(name[7:], FILE_FMT)
+
+def layout_dirs(layout, first, last):
+    """Return the subdirectories that hold the files from the first to the
+    last file name, for an nfsen subdirectory layout"""
+    fmt = SUBDIR_LAYOUTS[layout]
+    if fmt is None:
+        return ['']
+    t = fn_to_date(first).replace(minute=0)
+    end = fn_to_date(last)
+    dirs = []
+    while t <= end:
+        d = t.strftime(fmt)
+        if not dirs or dirs[-1] != d:
+            dirs.append(d)
+        t += HOUR
+    return dirs
+
+class Catalog(object):
+    """Remembers profile.dat contents, the nfcapd files in each source
+    directory and the row counts of each file.
+
+    Local entries are checked against the modification time of the file or
+    directory they came from and are reloaded once they are ttl seconds old.
+    Remote entries are only reloaded after ttl seconds.
+
+    :param ttl: the most seconds an entry is used for
+    :param layout: the nfsen SUBDIRLAYOUT of the source directories, used
+        to only list the subdirectories a query needs.  By default every
+        subdirectory is listed.
+    """
+    def __init__(self, ttl=DEFAULT_TTL, layout=None):
+        if layout is not None and layout not in SUBDIR_LAYOUTS:
+            raise ValueError("Unknown subdirectory layout %r" % layout)
+        self.ttl = ttl
+        self.layout = layout
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, stamp, load):
+        """Return the value stored under key, calling load() to compute it
+        if there is none, it is too old, or stamp changed"""
+        now = time.time()
+        self.lock.acquire()
+        try:
+            entry = self.entries.get(key)
+        finally:
+            self.lock.release()
+        if entry is not None:
+            loaded, old_stamp, value = entry
+            if old_stamp == stamp and now - loaded < self.ttl:
+                return value
+        value = load()
+        self.lock.acquire()
+        try:
+            self.entries[key] = (now, stamp, value)
+        finally:
+            self.lock.release()
+        return value
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+        finally:
+            self.lock.release()
+
+    def _mtime(self, path):
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def read_file(self, path):
+        return self.get(('file', path), self._mtime(path), lambda: open(path).read())
+
+    def listdir(self, path):
+        return self.get(('dir', path), self._mtime(path), lambda: os.listdir(path))
+
+    def _scan(self, path):
+        """Return the nfcapd files and subdirectories of path with the size
+        of each file"""
+        files = {}
+        subdirs = []
+        for f in os.listdir(path):
+            full = os.path.join(path, f)
+            if NFCAPD_RE.match(f):
+                try:
+                    files[f] = os.stat(full).st_size
+                except OSError:
+                    pass
+            elif os.path.isdir(full):
+                subdirs.append(f)
+        return files, subdirs
+
+    def _tree(self, path, recurse=True):
+        try:
+            files, subdirs = self.get(('scan', path), self._mtime(path), lambda: self._scan(path))
+        except OSError:
+            return
+        for f, size in files.iteritems():
+            yield f, os.path.join(path, f), size
+        if recurse:
+            for d in subdirs:
+                for entry in self._tree(os.path.join(path, d)):
+                    yield entry
+
+    def files(self, source_dir, first=None, last=None):
+        """Return (name, path, size) for each nfcapd file in source_dir and
+        its subdirectories from the first file name on, sorted by name.
+        Files after last may be included, so callers can tell if last has
+        been rotated."""
+        if self.layout is None or first is None or last is None:
+            entries = self._tree(source_dir)
+        else:
+            after = date_to_fn(fn_to_date(last) + HOUR)
+            dirs = layout_dirs(self.layout, first, after)
+            entries = (e for d in dirs for e in self._tree(os.path.join(source_dir, d), False))
+        return sorted(e for e in entries if first is None or e[0] >= first)
+
+    def rows(self, path, size):
+        """Return the number of flows in a file, from its stat record"""
+        from pynfdump.nffile import file_stats
+        def load():
+            try:
+                return file_stats(path)['flows']
+            except Exception:
+                return None
+        return self.get(('rows', path), (size, self._mtime(path)), load)
+
+    def remote(self, key, load):
+        """Return the value for a remote lookup, reloading it after ttl"""
+        return self.get(key, None, load)
@@ -0,0 +1,103 @@
+# dedup.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+Drop flows that were exported by more than one router
+"""
+
+from collections import deque
+
+#how far apart, in seconds of flow start time, two copies of a flow can be read
+DEFAULT_WINDOW = 600
+#how far apart two routers' clocks can be, in seconds
+DEFAULT_SKEW = 1
+#the most flows remembered at once
+DEFAULT_MAX_ENTRIES = 1000000
+
+class Deduplicator(object):
+    """Filter out copies of flows when several sources see the same traffic.
+
+    Two flows are copies when they have the same addresses, ports, protocol
+    and byte count, and their start and end times are within skew seconds
+    of each other.  Only flows that started in the last window seconds of
+    the stream are remembered, and never more than max_entries, so memory
+    use does not grow with the length of the search::
+
+        >>> d = pynfdump.Dumper("/data/nfsen/profiles", sources=['podium', 'gw'])
+        >>> dd = Deduplicator()
+        >>> total = sum(r.bytes for r in dd.filter(d.search()))
+        >>> dd.dropped
+        5123
+
+    ``seen`` is the number of flows checked, ``dropped`` the number of
+    copies removed and ``evicted`` the number of flows forgotten early
+    because max_entries was reached.
+    """
+    def __init__(self, window=DEFAULT_WINDOW, skew=DEFAULT_SKEW, max_entries=DEFAULT_MAX_ENTRIES):
+        self.window_ms = int(window * 1000)
+        self.skew_ms = int(skew * 1000)
+        self.max_entries = max_entries
+        #hash of the flow key -> list of (first_ms, last_ms)
+        self.recent = {}
+        #(first_ms, hash, entry) in the order flows were added
+        self.order = deque()
+        self.clock = 0
+        self.seen = self.dropped = self.evicted = 0
+
+    def __len__(self):
+        return len(self.order)
+
+    def _forget(self):
+        first, h, entry = self.order.popleft()
+        times = self.recent[h]
+        times.remove(entry)
+        if not times:
+            del self.recent[h]
+
+    def is_duplicate(self, rec):
+        """Check a :class:`pynfdump.nfdump.FlowRecord` against the recent
+        flows, and remember it if it is new"""
+        p = rec.parts
+        #af, proto, the source and destination address words and ports, bytes
+        h = hash((p[0], p[23]) + tuple(p[5:16]))
+        first, last = rec.first_ms, rec.last_ms
+        self.seen += 1
+
+        if first > self.clock:
+            self.clock = first
+            horizon = first - self.window_ms
+            order = self.order
+            while order and order[0][0] < horizon:
+                self._forget()
+
+        times = self.recent.get(h)
+        if times is None:
+            times = self.recent[h] = []
+        else:
+            skew = self.skew_ms
+            for f, l in times:
+                if abs(f - first) <= skew and abs(l - last) <= skew:
+                    self.dropped += 1
+                    return True
+
+        if first < self.clock - self.window_ms:
+            #too old to be remembered
+            if not times:
+                del self.recent[h]
+            return False
+        entry = (first, last)
+        times.append(entry)
+        self.order.append((first, h, entry))
+        if len(self.order) > self.max_entries:
+            self._forget()
+            self.evicted += 1
+        return False
+
+    def filter(self, records):
+        """Yield the records that are not copies of an earlier one"""
+        is_duplicate = self.is_duplicate
+        for rec in records:
+            if not is_duplicate(rec):
+                yield rec
@@ -0,0 +1,138 @@
+# enrich.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+Add information about addresses, like whois data, to exported flows
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+from pynfdump.nfdump import is_flow_line
+from pynfdump.export import srcip, dstip
+
+DEFAULT_CACHE_SIZE = 100000
+DEFAULT_TTL = 24 * 3600
+
+class LRUCache(object):
+    """A thread safe mapping that holds at most max_size entries, dropping
+    the least recently used, and forgets entries older than ttl seconds"""
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def get_many(self, keys):
+        """Return a dictionary of the keys that are cached"""
+        now = time.time()
+        found = {}
+        self.lock.acquire()
+        try:
+            for k in keys:
+                entry = self.data.pop(k, None)
+                if entry is None or (self.ttl and entry[1] < now):
+                    self.misses += 1
+                    continue
+                self.data[k] = entry
+                found[k] = entry[0]
+                self.hits += 1
+        finally:
+            self.lock.release()
+        return found
+
+    def put_many(self, items):
+        expires = time.time() + (self.ttl or 0)
+        self.lock.acquire()
+        try:
+            for k, v in items.iteritems():
+                self.data.pop(k, None)
+                self.data[k] = (v, expires)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+        finally:
+            self.lock.release()
+
+class CymruBackend(object):
+    """Look up addresses with the Team Cymru whois service, returns records
+    with asn, cc, owner and prefix attributes.  Requires cymruwhois"""
+    def __init__(self, client=None, **kwargs):
+        if client is None:
+            import cymruwhois
+            client = cymruwhois.Client(**kwargs)
+        self.client = client
+
+    def __call__(self, ips):
+        return self.client.lookupmany_dict(ips)
+
+class StubBackend(object):
+    """Look up addresses in a dictionary, for testing.  calls records the
+    list of addresses asked for in each lookup"""
+    def __init__(self, table, default=None):
+        self.table = table
+        self.default = default
+        self.calls = []
+
+    def __call__(self, ips):
+        self.calls.append(list(ips))
+        return dict((ip, self.table.get(ip, self.default)) for ip in ips)
+
+def _field(info, name):
+    if info is None:
+        return ''
+    if isinstance(info, dict):
+        return info.get(name, '')
+    return getattr(info, name, '')
+
+class Enricher(object):
+    """Resolve the addresses of a batch of flows with a single call to
+    backend, caching the answers.
+
+    :param backend: function taking a list of address strings and returning
+        a dictionary of address to information
+    :param cache: an :class:`LRUCache`, it may be shared between enrichers
+    :param address: which address to look up, 'srcip' or 'dstip'
+    :param batch_size: the most addresses passed to backend at once
+    """
+    def __init__(self, backend, cache=None, address='srcip', batch_size=10000):
+        self.backend = backend
+        if cache is None:
+            cache = LRUCache()
+        self.cache = cache
+        self.address = {'srcip': srcip, 'dstip': dstip}[address]
+        self.batch_size = batch_size
+
+    def lookup(self, ips):
+        """Return a dictionary of information for each address in ips"""
+        ips = set(ips)
+        found = self.cache.get_many(ips)
+        missing = sorted(ips.difference(found))
+        for i in range(0, len(missing), self.batch_size):
+            batch = missing[i:i+self.batch_size]
+            result = self.backend(batch)
+            result = dict((ip, result.get(ip)) for ip in batch)
+            self.cache.put_many(result)
+            found.update(result)
+        return found
+
+    def columns(self, chunks, fields):
+        """Look up every address in the lists of pipe output lines in chunks,
+        and return the extra columns for :func:`pynfdump.export.export_chunks`
+
+        :param fields: the names of the information to add, like ['asn', 'cc']
+        """
+        address = self.address
+        ips = set()
+        for lines in chunks:
+            for line in lines:
+                if is_flow_line(line):
+                    ips.add(address(line.rstrip("\n").split("|")))
+        info = self.lookup(ips)
+        return dict((f, lambda p, f=f: _field(info.get(address(p)), f)) for f in fields)
@@ -0,0 +1,211 @@
+# export.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+Write nfdump pipe output as csv, tsv or splunk key=value lines
+"""
+
+import csv
+import socket
+import struct
+import tempfile
+
+from pynfdump.nfdump import READ_SIZE, AF_INET6, NFDumpError, fromtimestamp, is_flow_line, _words_to_ip
+
+FORMATS = ('csv', 'tsv', 'splunk')
+DEFAULT_COLUMNS = 'first srcip srcport dstip dstport prot packets bytes flags'.split()
+
+#position of the plain numeric columns in a line of pipe output
+_INDEX = {
+    'af': 0, 'msec_first': 2, 'msec_last': 4, 'proto': 5, 'srcport': 10,
+    'dstport': 15, 'srcas': 16, 'dstas': 17, 'input': 18, 'output': 19,
+    'flags': 20, 'tos': 21, 'packets': 22, 'bytes': 23,
+}
+
+#every column export can format by itself
+COLUMNS = frozenset(_INDEX).union(['first', 'last', 'srcip', 'dstip', 'prot'])
+
+_pack = struct.Struct("!I").pack
+_ntoa = socket.inet_ntoa
+
+def _ip(parts, i):
+    if parts[0] == '10':
+        return str(_words_to_ip(AF_INET6, int(parts[i]), int(parts[i+1]), int(parts[i+2]), int(parts[i+3])))
+    return _ntoa(_pack(int(parts[i+3])))
+
+def srcip(parts):
+    """The source address of split pipe output as a string"""
+    return _ip(parts, 6)
+
+def dstip(parts):
+    """The destination address of split pipe output as a string"""
+    return _ip(parts, 11)
+
+class _Times(dict):
+    """Formatted timestamps, flows in the same file share a handful of
+    seconds so each one is only formatted once"""
+    def __missing__(self, sec):
+        if len(self) > 100000:
+            self.clear()
+        s = self[sec] = str(fromtimestamp(int(sec)))
+        return s
+
+def _column(name, protocols, times):
+    if name in _INDEX:
+        idx = _INDEX[name]
+        return lambda p: p[idx]
+    if name == 'first':
+        return lambda p: times[p[1]]
+    if name == 'last':
+        return lambda p: times[p[3]]
+    if name == 'srcip':
+        return srcip
+    if name == 'dstip':
+        return dstip
+    if name == 'prot':
+        names = dict((str(k), v) for k, v in (protocols or {}).items())
+        return lambda p: names.get(p[5], p[5])
+    raise NFDumpError("Unknown export column %r" % name)
+
+def formatters(columns, protocols=None, extra=None):
+    """Return a function for each column that formats it from a line of
+    pipe output split on '|'.
+
+    :param extra: dictionary of additional column names to functions of
+        the split line, for example to add whois information
+    """
+    times = _Times()
+    funcs = []
+    for c in columns:
+        if extra and c in extra:
+            funcs.append(extra[c])
+        else:
+            funcs.append(_column(c, protocols, times))
+    return funcs
+
+def _quote(val):
+    if ' ' in val or '"' in val or '=' in val or not val:
+        return '"%s"' % val.replace('"', '\\"')
+    return val
+
+class _Writer(object):
+    def __init__(self, fmt, columns, dest):
+        if fmt not in FORMATS:
+            raise NFDumpError("Unknown export format %r" % fmt)
+        self.columns = columns
+        self.dest = dest
+        if fmt == 'csv':
+            self.csv = csv.writer(dest)
+            self.write = self.csv.writerows
+        elif fmt == 'tsv':
+            self.write = self._tsv
+        else:
+            self.write = self._splunk
+            self.keys = ['%s=' % c for c in columns]
+
+    def header(self):
+        if hasattr(self, 'csv'):
+            self.csv.writerow(self.columns)
+        elif self.write == self._tsv:
+            self._tsv([self.columns])
+
+    def _tsv(self, rows):
+        self.dest.write(''.join(['\t'.join(map(str, r)) + '\n' for r in rows]))
+
+    def _splunk(self, rows):
+        keys = self.keys
+        out = []
+        for r in rows:
+            out.append(' '.join([k + _quote(str(v)) for k, v in zip(keys, r)]) + '\n')
+        self.dest.write(''.join(out))
+
+def export_chunks(chunks, fmt, columns, dest, protocols=None, header=False, extra=None):
+    """Write lists of nfdump -o pipe output lines to the file dest.
+
+    Only the selected columns are formatted, one batch of rows is written
+    per list of lines.  Returns the number of rows written.
+
+    :param fmt: one of 'csv', 'tsv' or 'splunk'
+    :param columns: list of column names, see :class:`pynfdump.nfdump.FlowRecord`
+    :param header: write the column names first (csv and tsv)
+    :param extra: additional columns, see :func:`formatters`
+    """
+    writer = _Writer(fmt, columns, dest)
+    funcs = formatters(columns, protocols, extra)
+    if header:
+        writer.header()
+    count = 0
+    for lines in chunks:
+        rows = []
+        for line in lines:
+            if not is_flow_line(line):
+                continue
+            p = line.rstrip("\n").split("|")
+            rows.append([f(p) for f in funcs])
+        if rows:
+            writer.write(rows)
+            count += len(rows)
+    return count
+
+def file_chunks(f, size=READ_SIZE):
+    """Read the open file f as lists of lines of about size bytes"""
+    while True:
+        lines = f.readlines(size)
+        if not lines:
+            break
+        yield lines
+
+def _spool(chunks, f):
+    for lines in chunks:
+        f.writelines(lines)
+        yield lines
+
+def render_file(filename, fmt, columns, query='', filterfile=None, header=False, enricher=None, dir=None):
+    """Export a single nfcapd file into a temporary file, for exporting many
+    files in parallel and writing the results in order.  Returns the
+    temporary file, positioned at its start, and the number of flows.  The
+    file is removed when it is closed.
+
+    :param enricher: a :class:`pynfdump.enrich.Enricher`.  The columns it
+        does not know about are looked up for every address in the file
+        with one call to its backend.  The nfdump output is kept in a
+        second temporary file until the lookup is done.
+    :param dir: directory for the temporary files
+    """
+    from pynfdump.nfdump import Dumper
+    d = Dumper()
+    d.set_where(filename=filename)
+    cmd = d._search_cmd(query, filterfile)
+    out = tempfile.TemporaryFile(dir=dir)
+    raw = None
+    try:
+        chunks = d._run_chunks(cmd)
+        extra = None
+        if enricher is not None:
+            raw = tempfile.TemporaryFile(dir=dir)
+            extra = enricher.columns(_spool(chunks, raw), [c for c in columns if c not in COLUMNS])
+            raw.seek(0)
+            chunks = file_chunks(raw)
+        count = export_chunks(chunks, fmt, columns, out, d.protocols, header, extra)
+        out.seek(0)
+    except:
+        out.close()
+        raise
+    finally:
+        if raw is not None:
+            raw.close()
+    return out, count
+
+def record_chunks(records, size=1024):
+    """Turn :class:`pynfdump.nfdump.FlowRecord` objects back into lists of
+    pipe output lines, for exporting flows from the native engine"""
+    lines = []
+    for rec in records:
+        lines.append('|'.join(map(str, rec.parts)))
+        if len(lines) == size:
+            yield lines
+            lines = []
+    if lines:
+        yield lines
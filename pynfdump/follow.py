@@ -0,0 +1,275 @@
+# follow.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+Process nfcapd files as nfcapd rotates them
+"""
+
+import os
+import time
+import errno
+import itertools
+import select
+import struct
+
+from pynfdump.nfdump import NFCAPD_RE
+from pynfdump.parallel import ordered_parallel
+
+DEFAULT_POLL_INTERVAL = 10
+
+class Checkpoint(object):
+    """The name of the last file processed in each directory.
+
+    Files are processed in name order, which is time order, so one name per
+    directory is enough to know what has been done.  Next to it is the
+    modification time the directory had when everything in it was done, so
+    a directory that hasn't changed since is not listed again.  The
+    checkpoint is written to a temporary file, synced and renamed over the
+    old one, so a crash leaves either the old or the new version.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.last = {}
+        self.mtimes = {}
+        self.load()
+
+    def load(self):
+        try:
+            f = open(self.path)
+        except IOError, e:
+            if e.errno == errno.ENOENT:
+                return
+            raise
+        try:
+            for line in f:
+                line = line.rstrip("\n")
+                if line:
+                    d, name, mtime = line.rsplit("\t", 2)
+                    if name:
+                        self.last[d] = name
+                    if mtime:
+                        self.mtimes[d] = float(mtime)
+        finally:
+            f.close()
+
+    def get(self, d):
+        return self.last.get(d)
+
+    def set(self, d, name):
+        self.last[d] = name
+        self.save()
+
+    def get_mtime(self, d):
+        return self.mtimes.get(d)
+
+    def set_mtime(self, d, mtime):
+        """Record that every file in d was done when its modification time
+        was mtime"""
+        self.mtimes[d] = mtime
+        self.save()
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        f = open(tmp, 'w')
+        try:
+            for d in sorted(set(self.last) | set(self.mtimes)):
+                mtime = self.mtimes.get(d)
+                f.write("%s\t%s\t%s\n" % (d, self.last.get(d, ''), mtime is not None and repr(mtime) or ''))
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        os.rename(tmp, self.path)
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        fd = os.open(dirname, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+class _Inotify(object):
+    """Wait for files to be renamed into directories using inotify"""
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_Q_OVERFLOW = 0x4000
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, dirs):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+        self.watches = {}
+        for d in dirs:
+            wd = libc.inotify_add_watch(self.fd, d, self.IN_MOVED_TO | self.IN_CREATE)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed for %s" % d)
+            self.watches[wd] = d
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds and return a dictionary of the names
+        that appeared in each directory, or None if events were lost"""
+        found = {}
+        rlist, wlist, xlist = select.select([self.fd], [], [], timeout)
+        if not rlist:
+            return found
+        data = os.read(self.fd, 65536)
+        size = self.EVENT.size
+        offset = 0
+        while offset + size <= len(data):
+            wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+            name = data[offset+size:offset+size+length].rstrip("\0")
+            offset += size + length
+            if mask & self.IN_Q_OVERFLOW:
+                return None
+            d = self.watches.get(wd)
+            if d is not None and name:
+                found.setdefault(d, []).append(name)
+        return found
+
+    def close(self):
+        os.close(self.fd)
+
+class Follower(object):
+    """Call callback once for each new nfcapd file in dirs, in time order.
+
+    Only rotated files (nfcapd.YYYYmmddHHMM) are processed, never the
+    nfcapd.current file nfcapd is writing.  After callback returns, the file
+    is recorded in the checkpoint, so a restarted Follower continues where
+    the last one stopped.  If callback raises, the file is not recorded and
+    the exception is raised from :func:`Follower.run_once` or
+    :func:`Follower.follow`.  A crash after callback finishes but before the
+    checkpoint is written means the file is processed again.
+
+    A directory is only listed again when its modification time differs
+    from the one in the checkpoint, and only the names after the last file
+    processed are sorted.  :func:`Follower.follow` lists the directories
+    once, then queues the files inotify reports where it is available and
+    checks every poll_interval seconds otherwise.
+
+    :param dirs: directories to watch
+    :param callback: function called with the full path of each file
+    :param checkpoint: a :class:`Checkpoint`, or the filename of one
+    :param poll_interval: seconds between checks when inotify isn't used
+    :param prepare: optional function called with the full path of each
+        file in up to workers threads at once.  callback is then called with
+        the path and the result of prepare, still one file at a time and in
+        order.
+    :param workers: number of files prepared at once
+    """
+    def __init__(self, dirs, callback, checkpoint, poll_interval=DEFAULT_POLL_INTERVAL, use_inotify=True,
+                 prepare=None, workers=4):
+        if isinstance(dirs, basestring):
+            dirs = [dirs]
+        self.dirs = [os.path.abspath(d) for d in dirs]
+        self.callback = callback
+        if isinstance(checkpoint, basestring):
+            checkpoint = Checkpoint(checkpoint)
+        self.checkpoint = checkpoint
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.prepare = prepare
+        self.workers = workers
+        #the files found in each directory that are not processed yet, in order
+        self.queued = {}
+
+    def _add(self, d, names):
+        """Queue the nfcapd files in names that come after the checkpoint"""
+        queued = self.queued.setdefault(d, [])
+        if queued:
+            last = queued[-1]
+        else:
+            last = self.checkpoint.get(d)
+        #comparing names is cheap, so most of a large listing is skipped
+        #before the pattern is checked or anything is sorted
+        queued.extend(sorted(f for f in names if (last is None or f > last) and NFCAPD_RE.match(f)))
+
+    def pending(self, d):
+        """Return the unprocessed files in d, oldest first"""
+        if d not in self.queued:
+            self._add(d, os.listdir(d))
+        return list(self.queued[d])
+
+    def run_once(self):
+        """Process the files that have appeared since the last call.
+        Returns the number of files processed"""
+        done = 0
+        for d in self.dirs:
+            mtime = os.stat(d).st_mtime
+            if self.checkpoint.get_mtime(d) == mtime and not self.queued.get(d):
+                continue
+            self._add(d, os.listdir(d))
+            done += self._process(d)
+            #only skip the directory once everything in it was processed
+            if self.checkpoint.get_mtime(d) != mtime:
+                self.checkpoint.set_mtime(d, mtime)
+        return done
+
+    def _process(self, d):
+        if self.prepare is not None:
+            return self._run_prepared(d)
+        queued = self.queued.get(d, [])
+        done = 0
+        while queued:
+            f = queued[0]
+            self.callback(os.path.join(d, f))
+            self.checkpoint.set(d, f)
+            queued.pop(0)
+            done += 1
+        return done
+
+    def _run_prepared(self, d):
+        queued = self.queued.get(d, [])
+        files = list(queued)
+        #prepared results are held until their turn, so only prepare a few
+        #files ahead of the one being written
+        window = self.workers * 2
+        for i in range(0, len(files), window):
+            batch = files[i:i+window]
+            funcs = [lambda f=f: [self.prepare(os.path.join(d, f))] for f in batch]
+            results = ordered_parallel(funcs, self.workers)
+            try:
+                for f, result in itertools.izip(batch, results):
+                    self.callback(os.path.join(d, f), result)
+                    self.checkpoint.set(d, f)
+                    queued.pop(0)
+            finally:
+                results.close()
+        return len(files)
+
+    def _waiter(self):
+        if self.use_inotify:
+            try:
+                return _Inotify(self.dirs)
+            except (OSError, AttributeError):
+                pass
+        return None
+
+    def follow(self, stop=None):
+        """Process files as they appear until stop() returns True"""
+        notify = self._waiter()
+        try:
+            self.run_once()
+            while not (stop and stop()):
+                if not notify:
+                    time.sleep(self.poll_interval)
+                    self.run_once()
+                    continue
+                found = notify.wait(self.poll_interval)
+                if found is None:
+                    #the event queue overflowed, list everything again
+                    self.run_once()
+                    continue
+                #the modification times are left alone, a file could have
+                #arrived after the events were read
+                for d, names in found.items():
+                    self._add(d, names)
+                    self._process(d)
+        finally:
+            if notify:
+                notify.close()
@@ -0,0 +1,247 @@
+# instrument.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+Timing and size statistics for Dumper queries
+"""
+
+import os
+import sys
+import time
+import errno
+import resource
+import threading
+
+#getrusage of only the calling thread, so the parse time of one query is
+#not charged with what other threads did meanwhile.  Linux has it as 1.
+RUSAGE_THREAD = getattr(resource, 'RUSAGE_THREAD',
+    sys.platform.startswith('linux') and 1 or resource.RUSAGE_SELF)
+
+def clock():
+    """Return the CPU seconds used by the calling thread"""
+    usage = resource.getrusage(RUSAGE_THREAD)
+    return usage.ru_utime + usage.ru_stime
+
+def wait(pipe):
+    """Wait for the subprocess.Popen pipe to exit and return the CPU seconds
+    it used, or None if it was already reaped"""
+    if pipe.returncode is None:
+        while True:
+            try:
+                pid, status, usage = os.wait4(pipe.pid, 0)
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno != errno.ECHILD:
+                    raise
+                break
+            if os.WIFSIGNALED(status):
+                pipe.returncode = -os.WTERMSIG(status)
+            else:
+                pipe.returncode = os.WEXITSTATUS(status)
+            return usage.ru_utime + usage.ru_stime
+    pipe.wait()
+    return None
+
+class QueryStats(object):
+    """What one :func:`Dumper.search` or :func:`Dumper.flow_stats` call cost.
+
+    Times are in seconds.  ``first_byte`` and ``wall_time`` are measured
+    from when the query started.  ``spawn_time`` is the time spent starting
+    nfdump (or ssh), summed over every process the query ran.
+    ``parse_cpu`` is the CPU time the calling thread spent reading and
+    parsing the output, ``child_cpu`` the CPU time used by nfdump (by ssh
+    for a remote query).  ``exit_status`` is the first non zero exit
+    status, negative if a signal killed the process, or 0.
+    """
+    def __init__(self, command):
+        self.command = command
+        self.start = time.time()
+        self.spawn_times = []
+        self.exit_statuses = []
+        self.first_byte = None
+        self.wall_time = None
+        self.bytes_read = 0
+        self.lines_read = 0
+        self.rows = 0
+        self.parse_cpu = 0.0
+        self.child_cpu = 0.0
+        self.cache_hit = False
+        self.error = None
+        #counts can be updated from the worker threads of a sharded query
+        self.lock = threading.Lock()
+
+    @property
+    def spawn_time(self):
+        return sum(self.spawn_times)
+
+    @property
+    def exit_status(self):
+        for s in self.exit_statuses:
+            if s:
+                return s
+        if self.exit_statuses:
+            return 0
+        return None
+
+    def spawned(self, seconds):
+        self.spawn_times.append(seconds)
+
+    def exited(self, status, cpu=None):
+        self.exit_statuses.append(status)
+        if cpu is not None:
+            self.child_cpu += cpu
+
+    def read(self, lines):
+        """Count the bytes and lines in a list of lines"""
+        size = sum(map(len, lines))
+        self.lock.acquire()
+        try:
+            if self.first_byte is None:
+                self.first_byte = time.time() - self.start
+            self.lines_read += len(lines)
+            self.bytes_read += size
+        finally:
+            self.lock.release()
+
+    def chunks(self, chunks):
+        """Count the bytes and lines in a stream of line lists"""
+        for lines in chunks:
+            self.read(lines)
+            yield lines
+
+    def timed(self, chunks, parse=list):
+        """Yield the items of parse(lines) for each list of lines in chunks,
+        adding the time spent reading and parsing each list to parse_cpu"""
+        it = iter(chunks)
+        while True:
+            c = clock()
+            try:
+                items = parse(it.next())
+            except StopIteration:
+                self.parse_cpu += clock() - c
+                break
+            self.parse_cpu += clock() - c
+            for item in items:
+                yield item
+
+    def records(self, records, hooks, size=None):
+        """Count the records of a query, and deliver the stats to hooks when
+        the query ends.  size returns the number of rows in a record, for
+        records that are batches of rows.  The parsing is timed where the
+        records are made, see :func:`QueryStats.timed`"""
+        it = iter(records)
+        try:
+            for rec in it:
+                if size is None:
+                    self.rows += 1
+                else:
+                    self.rows += size(rec)
+                yield rec
+        except GeneratorExit:
+            raise
+        except Exception:
+            self.error = sys.exc_info()[1]
+            raise
+        finally:
+            if hasattr(it, 'close'):
+                it.close()
+            self.finish(hooks)
+
+    def call(self, func, hooks, args=(), size=None):
+        """Time func(*args) as a query returning a single result.  size
+        returns the number of rows in the result, 1 by default"""
+        c = clock()
+        try:
+            ret = func(*args)
+            if size is None:
+                self.rows = 1
+            else:
+                self.rows = size(ret)
+            return ret
+        except Exception:
+            self.error = sys.exc_info()[1]
+            raise
+        finally:
+            self.parse_cpu += clock() - c
+            self.finish(hooks)
+
+    def finish(self, hooks):
+        self.wall_time = time.time() - self.start
+        for hook in hooks:
+            hook(self)
+
+    def as_dict(self):
+        return {
+            'command':      self.command,
+            'spawn_time':   self.spawn_time,
+            'first_byte':   self.first_byte,
+            'wall_time':    self.wall_time,
+            'bytes_read':   self.bytes_read,
+            'lines_read':   self.lines_read,
+            'rows':         self.rows,
+            'parse_cpu':    self.parse_cpu,
+            'child_cpu':    self.child_cpu,
+            'exit_status':  self.exit_status,
+            'cache_hit':    self.cache_hit,
+            'error':        self.error and str(self.error),
+        }
+
+    def __repr__(self):
+        return "<QueryStats %r>" % self.as_dict()
+
+class StatsAggregator(object):
+    """A hook that keeps running totals over all queries, for a long running
+    service to report.  Register it with :func:`Dumper.add_hook`."""
+
+    counters = ('queries', 'errors', 'cache_hits', 'rows', 'bytes_read', 'lines_read',
+                'spawn_time', 'first_byte', 'wall_time', 'parse_cpu', 'child_cpu')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.lock.acquire()
+        try:
+            self.totals = dict.fromkeys(self.counters, 0)
+            self.max_wall_time = 0.0
+            self.slowest = None
+        finally:
+            self.lock.release()
+
+    def __call__(self, stats):
+        self.lock.acquire()
+        try:
+            t = self.totals
+            t['queries'] += 1
+            if stats.error is not None or stats.exit_status:
+                t['errors'] += 1
+            if stats.cache_hit:
+                t['cache_hits'] += 1
+            t['rows'] += stats.rows
+            t['bytes_read'] += stats.bytes_read
+            t['lines_read'] += stats.lines_read
+            t['spawn_time'] += stats.spawn_time
+            t['first_byte'] += stats.first_byte or 0
+            t['wall_time'] += stats.wall_time
+            t['parse_cpu'] += stats.parse_cpu
+            t['child_cpu'] += stats.child_cpu
+            if stats.wall_time > self.max_wall_time:
+                self.max_wall_time = stats.wall_time
+                self.slowest = stats.command
+        finally:
+            self.lock.release()
+
+    def snapshot(self):
+        """Return a dictionary of the totals so far"""
+        self.lock.acquire()
+        try:
+            snap = dict(self.totals)
+            snap['max_wall_time'] = self.max_wall_time
+            snap['slowest_command'] = self.slowest
+            return snap
+        finally:
+            self.lock.release()
@@ -0,0 +1,127 @@
+# merge.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+Combine nfdump results that were computed over separate pieces of data
+"""
+
+import heapq
+
+from pynfdump.nfdump import FlowRecord, StatRecord, NFDumpError, STAT_FIELDS
+
+#nfdump's defaults for -s
+DEFAULT_STAT_ORDER = 'flows'
+DEFAULT_STAT_LIMIT = 10
+
+STAT_ORDERS = ('flows', 'packets', 'bytes', 'pps', 'bps', 'bpp')
+
+def stat_rates(first_ms, last_ms, packets, bytes):
+    """Return pps, bps and bpp the same way nfdump computes them"""
+    duration = (last_ms - first_ms) / 1000.0
+    if duration > 0:
+        pps = int(packets / duration)
+        bps = int(8 * bytes / duration)
+    else:
+        pps = bps = 0
+    if packets:
+        bpp = bytes // packets
+    else:
+        bpp = 0
+    return pps, bps, bpp
+
+class StatTotal(object):
+    """Running totals for a single statistics object"""
+    __slots__ = ('head', 'first_ms', 'last_ms', 'flows', 'packets', 'bytes')
+
+    def __init__(self, head, first_ms, last_ms):
+        #head is af, proto and the object fields of the first record seen
+        self.head = head
+        self.first_ms = first_ms
+        self.last_ms = last_ms
+        self.flows = self.packets = self.bytes = 0
+
+    def add(self, first_ms, last_ms, flows, packets, bytes):
+        if first_ms < self.first_ms:
+            self.first_ms = first_ms
+        if last_ms > self.last_ms:
+            self.last_ms = last_ms
+        self.flows += flows
+        self.packets += packets
+        self.bytes += bytes
+
+    def record(self, object_field, protocols=None):
+        af, proto, key = self.head
+        first_s, first_msec = divmod(self.first_ms, 1000)
+        last_s, last_msec = divmod(self.last_ms, 1000)
+        pps, bps, bpp = stat_rates(self.first_ms, self.last_ms, self.packets, self.bytes)
+        parts = [af, first_s, first_msec, last_s, last_msec, proto]
+        parts.extend(key)
+        parts.extend([self.flows, self.packets, self.bytes, pps, bps, bpp])
+        return StatRecord(parts, object_field, protocols)
+
+def top_stats(totals, object_field, order=None, limit=None, protocols=None):
+    """Turn a collection of :class:`StatTotal` into the top limit
+    :class:`StatRecord` objects sorted by order"""
+    order = order or DEFAULT_STAT_ORDER
+    if order not in STAT_ORDERS:
+        raise NFDumpError("Unknown statistics order %r" % order)
+    if limit is None:
+        limit = DEFAULT_STAT_LIMIT
+    records = (t.record(object_field, protocols) for t in totals)
+    key = lambda r: getattr(r, order)
+    if limit:
+        return heapq.nlargest(limit, records, key=key)
+    return sorted(records, key=key, reverse=True)
+
+def merge_stats(records, object_field, order=None, limit=None, protocols=None):
+    """Merge :class:`StatRecord` objects from several nfdump -s runs.
+
+    flows, packets and bytes are summed for each object, pps, bps and bpp are
+    recomputed from the totals, and the top limit objects by order are
+    returned.  For the result to be exact each run must have returned all of
+    its objects (-n 0).
+    """
+    totals = {}
+    for r in records:
+        p = r.parts
+        key_fields = p[6:-6]
+        k = (p[0], tuple(key_fields))
+        t = totals.get(k)
+        if t is None:
+            t = totals[k] = StatTotal((p[0], p[5], key_fields), r.first_ms, r.last_ms)
+        t.add(r.first_ms, r.last_ms, r.flows, r.packets, r.bytes)
+    return top_stats(totals.itervalues(), object_field, order, limit, protocols)
+
+#fields that are not part of the aggregation key of a -a record:
+#the times, tcp flags, tos, and the counters
+_AGGR_SKIP = frozenset([1, 2, 3, 4, 20, 21, 22, 23])
+
+def merge_aggregates(records, limit=None, protocols=None):
+    """Merge :class:`FlowRecord` objects from several nfdump -a runs.
+
+    nfdump zeroes the fields that are not part of the aggregation, so records
+    are combined when every other field matches.  packets and bytes are
+    summed, tcp flags are or'ed together and the times are widened.  The
+    result is ordered by the first seen time.
+    """
+    merged = {}
+    for r in records:
+        p = r.parts
+        k = tuple([v for i, v in enumerate(p) if i not in _AGGR_SKIP])
+        m = merged.get(k)
+        if m is None:
+            merged[k] = list(p)
+            continue
+        if (p[1], p[2]) < (m[1], m[2]):
+            m[1], m[2] = p[1], p[2]
+        if (p[3], p[4]) > (m[3], m[4]):
+            m[3], m[4] = p[3], p[4]
+        m[20] |= p[20]
+        m[22] += p[22]
+        m[23] += p[23]
+    rows = sorted(merged.itervalues(), key=lambda p: (p[1], p[2]))
+    if limit:
+        rows = rows[:limit]
+    return [FlowRecord(p, protocols) for p in rows]
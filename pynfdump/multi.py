@@ -0,0 +1,113 @@
+# multi.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+Search several collectors at once and merge the results
+"""
+
+import heapq
+import itertools
+
+from pynfdump.nfdump import Dumper, NFDumpError
+from pynfdump.merge import merge_stats, merge_aggregates
+from pynfdump.parallel import concurrent_streams
+
+#how many records each collector may read ahead of the merge
+QUEUE_SIZE = 1024
+
+class MultiDumper(object):
+    """Run the same search on several collectors concurrently.
+
+    collectors is a list of (remote_host, datadir, profile, sources) tuples
+    or of :class:`pynfdump.nfdump.Dumper` objects, the rest of the keyword
+    arguments are passed to each Dumper::
+
+        >>> md = MultiDumper([('glenn', '/data/nfsen/profiles', 'live', ['podium']),
+        ...                   ('lois', '/data/nfsen/profiles', 'live', ['gw'])])
+        >>> md.set_where(start='2009-03-23 10:00', end='2009-03-23 11:00')
+        >>> for r in md.search('host 1.2.3.4'):
+        ...     print r['first'], r['srcip'], r['dstip']
+
+    A collector that fails does not stop the search, the results are made
+    from the other collectors and the error is stored in ``errors`` under
+    the collector's index in collectors.
+    """
+    def __init__(self, collectors, **kwargs):
+        self.dumpers = []
+        for c in collectors:
+            if not isinstance(c, Dumper):
+                host, datadir, profile, sources = c
+                c = Dumper(datadir, profile, sources, remote_host=host, **kwargs)
+            self.dumpers.append(c)
+        self.errors = {}
+
+    def set_where(self, *args, **kwargs):
+        """Set the timeframe on every collector, see
+        :func:`pynfdump.nfdump.Dumper.set_where`"""
+        for d in self.dumpers:
+            d.set_where(*args, **kwargs)
+
+    def _collect(self, i, *args):
+        dumper = self.dumpers[i]
+        def func():
+            try:
+                for r in dumper.search(*args):
+                    yield r
+            except (NFDumpError, OSError, IOError), e:
+                self.errors[i] = e
+        return func
+
+    def search(self, query='', filterfile=None, aggregate=None, statistics=None, statistics_order=None, limit=None):
+        """Search every collector, see :func:`pynfdump.nfdump.Dumper.search`.
+
+        Flows are merged by their start time as they arrive, so only a few
+        records from each collector are held in memory.  Each nfdump returns
+        flows in the order they were stored, which is only roughly by start
+        time, and the merged result is in order to the same degree.
+
+        Statistics and aggregated flows are combined across the collectors
+        like a single nfdump run over all of the data would.  ``errors`` is
+        filled in as the results are read.
+        """
+        if aggregate and statistics:
+            raise NFDumpError("Specify only one of aggregate and statistics")
+        self.errors = {}
+        #statistics and aggregates need every object from every collector
+        host_limit = limit
+        if statistics:
+            host_limit = 0
+        elif aggregate:
+            host_limit = None
+        args = (query, filterfile, aggregate, statistics, statistics_order, host_limit)
+        funcs = [self._collect(i, *args) for i in range(len(self.dumpers))]
+        streams, stop = concurrent_streams(funcs, QUEUE_SIZE)
+        protocols = self.dumpers[0].protocols
+        if statistics:
+            try:
+                return iter(merge_stats(itertools.chain(*streams), statistics, statistics_order, limit, protocols))
+            finally:
+                stop()
+        if aggregate:
+            try:
+                return iter(merge_aggregates(itertools.chain(*streams), limit, protocols))
+            finally:
+                stop()
+        records = self._merge(streams, stop)
+        if limit:
+            records = itertools.islice(records, limit)
+        return records
+
+    def _merge(self, streams, stop):
+        try:
+            decorated = [_by_time(i, s) for i, s in enumerate(streams)]
+            for first_ms, i, r in heapq.merge(*decorated):
+                yield r
+        finally:
+            stop()
+
+def _by_time(i, records):
+    #i breaks ties so records themselves are never compared
+    for r in records:
+        yield r.first_ms, i, r
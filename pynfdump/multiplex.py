@@ -0,0 +1,270 @@
+# multiplex.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+Run many nfdump queries at once from a single thread
+"""
+
+import os
+import time
+import select
+from collections import deque
+
+from pynfdump.nfdump import NFDumpError, QueryCancelled, split_lines, _spawn, _kill, READ_SIZE
+from pynfdump.instrument import QueryStats, clock, wait
+from pynfdump.query import QueryControl
+
+DEFAULT_CONCURRENCY = 8
+
+class AsyncQuery(object):
+    """A query submitted to an :class:`AsyncDumper`.
+
+    After the query finishes ``done`` is True, ``records`` is the number of
+    records it returned and ``error`` is the :class:`NFDumpError` it failed
+    with, if any.  ``truncated`` is set when it stopped at max_rows or
+    max_bytes.
+    """
+    def __init__(self, dumper, cmd, parse, callback=None, control=None):
+        self.dumper = dumper
+        self.cmd = cmd
+        self.parse = parse
+        self.callback = callback
+        self.control = control or QueryControl()
+        self.stats = None
+        self.writer = None
+        self.pipe = None
+        self.open_fds = []
+        self.tail = ''
+        self.records = 0
+        self.error = None
+        self.done = False
+
+    truncated = property(lambda self: self.control.truncated)
+
+    def cancel(self):
+        """Stop the query, this may be called from any thread"""
+        self.control.cancel()
+
+    def __repr__(self):
+        return "<AsyncQuery %r>" % (self.cmd,)
+
+class AsyncDumper(object):
+    """Run several Dumper searches concurrently in one select loop.
+
+    Queries are queued with :func:`AsyncDumper.search`, then
+    :func:`AsyncDumper.run` starts up to max_concurrent nfdump processes at a
+    time and yields (query, record) pairs as output arrives from any of them::
+
+        >>> ad = AsyncDumper(d, max_concurrent=4)
+        >>> web = ad.search("dst port 80", statistics='ip', limit=5)
+        >>> dns = ad.search("dst port 53", statistics='ip', limit=5)
+        >>> for q, r in ad.run():
+        ...     print q is web, r['ip'], r['bytes']
+
+    Queries for different collectors can be mixed by passing dumper to
+    search.  Each query runs the way :func:`Dumper.search` would run it: the
+    result cache and the hooks of its Dumper are used, and a remote nfdump
+    is stopped along with its query.  A query that writes to stderr is
+    stopped and its error stored on the query, the other queries keep
+    running.
+    """
+    def __init__(self, dumper, max_concurrent=DEFAULT_CONCURRENCY):
+        self.dumper = dumper
+        self.max_concurrent = max_concurrent
+        self.pending = deque()
+        #the running queries, and the query each open file descriptor is for
+        self.active = set()
+        self.running = {}
+
+    def search(self, query='', filterfile=None, aggregate=None, statistics=None, statistics_order=None,limit=None,
+               dumper=None, callback=None, timeout=None, max_rows=None, max_bytes=None):
+        """Queue a search.  The options are the same as :func:`Dumper.search`.
+
+        :param dumper: the Dumper to run the search with, instead of the
+            one the AsyncDumper was created with
+        :param callback: function called with each record of this query
+
+        A query that runs past its timeout fails with
+        :class:`pynfdump.nfdump.QueryTimeout`, one cancelled with
+        :func:`AsyncQuery.cancel` with :class:`pynfdump.nfdump.QueryCancelled`.
+
+        Only nfdump -o pipe output is read here, a Dumper using the native
+        engine, or one that would search with the binary transport, raises
+        :class:`pynfdump.nfdump.NFDumpError`.
+        """
+        d = dumper or self.dumper
+        control = QueryControl(timeout, max_rows, max_bytes)
+        if d.engine != 'cli':
+            raise NFDumpError("AsyncDumper requires the nfdump executable, not the %s engine" % d.engine)
+        if d._use_binary(statistics, control):
+            raise NFDumpError("AsyncDumper can not use the binary transport")
+        cmd = d._search_cmd(query, filterfile, aggregate, statistics, statistics_order, limit)
+        if statistics:
+            parse = lambda lines: d.parse_stats(lines, statistics)
+        else:
+            parse = d.parse_search
+        q = AsyncQuery(d, cmd, parse, callback, control)
+        self.pending.append(q)
+        return q
+
+    def _start(self):
+        """Start queued queries until max_concurrent are running, and yield
+        the records of the ones answered from the result cache"""
+        while self.pending and len(self.active) < self.max_concurrent:
+            q = self.pending.popleft()
+            d = q.dumper
+            if d.hooks:
+                q.stats = QueryStats(q.cmd)
+            hit, q.writer = d._cached(q.cmd, stats=q.stats)
+            if hit:
+                for lines in d.cache.read_chunks(hit):
+                    for item in self._output(q, lines):
+                        yield item
+                    if q.done:
+                        break
+                if not q.done:
+                    self._finish(q)
+                continue
+            cmd, stdin = d._command(q.cmd)
+            try:
+                t = time.time()
+                q.pipe = _spawn(cmd, stdin)
+            except NFDumpError, e:
+                q.error = e
+                self._finish(q)
+                continue
+            if q.stats is not None:
+                q.stats.spawned(time.time() - t)
+            q.control.attach(q.pipe)
+            q.open_fds = [q.pipe.stdout.fileno(), q.pipe.stderr.fileno()]
+            for fd in q.open_fds:
+                self.running[fd] = q
+            self.active.add(q)
+
+    def _finish(self, q):
+        for fd in q.open_fds:
+            del self.running[fd]
+        q.open_fds = []
+        self.active.discard(q)
+        pipe = q.pipe
+        cpu = None
+        if pipe is not None:
+            if pipe.stdin:
+                #lets the watchdog of a remote query stop nfdump
+                pipe.stdin.close()
+            if q.error or q.control.truncated:
+                _kill(pipe)
+            pipe.stdout.close()
+            pipe.stderr.close()
+            cpu = wait(pipe)
+            q.control.detach(pipe)
+        if q.writer is not None:
+            q.writer.close(q.error is None and not q.control.truncated and pipe is not None and pipe.returncode == 0)
+        if q.stats is not None:
+            if pipe is not None:
+                q.stats.exited(pipe.returncode, cpu)
+            q.stats.error = q.error
+            q.stats.finish(q.dumper.hooks)
+        q.done = True
+
+    def _check(self, q):
+        """Stop a query that was cancelled or ran out of time"""
+        try:
+            q.control.check()
+        except NFDumpError, e:
+            q.error = e
+            self._finish(q)
+
+    def _timeout(self):
+        """Seconds until the first deadline of the running queries"""
+        deadlines = [q.control.remaining() for q in self.active if q.control.deadline is not None]
+        if not deadlines:
+            return None
+        return min(deadlines)
+
+    def _output(self, q, lines):
+        """Yield the records of lines of output of a query, stopping the
+        query at its max_bytes or max_rows"""
+        control = q.control
+        if control.max_bytes:
+            control.bytes += sum(map(len, lines))
+            if control.bytes > control.max_bytes:
+                control.truncated = True
+                self._finish(q)
+                return
+        if q.stats is not None:
+            q.stats.read(lines)
+        if q.writer is not None:
+            q.writer.write(lines)
+        c = clock()
+        records = list(q.parse(lines))
+        if q.stats is not None:
+            q.stats.parse_cpu += clock() - c
+        for rec in records:
+            q.records += 1
+            control.rows += 1
+            if q.stats is not None:
+                q.stats.rows += 1
+            if q.callback:
+                q.callback(rec)
+            yield q, rec
+            if control.max_rows and control.rows >= control.max_rows:
+                control.truncated = True
+                self._finish(q)
+                return
+
+    def run(self):
+        """Run the queued queries and yield (query, record) pairs"""
+        try:
+            while self.pending or self.active:
+                for item in self._start():
+                    yield item
+                for q in list(self.active):
+                    self._check(q)
+                if not self.active:
+                    continue
+                rlist, wlist, xlist = select.select(list(self.running), [], [], self._timeout())
+                for q in list(self.active):
+                    self._check(q)
+                for fd in rlist:
+                    q = self.running.get(fd)
+                    if q is None:
+                        continue
+                    data = os.read(fd, READ_SIZE)
+                    if fd == q.pipe.stderr.fileno():
+                        if data:
+                            q.error = NFDumpError(data)
+                            self._finish(q)
+                        else:
+                            q.open_fds.remove(fd)
+                            del self.running[fd]
+                    elif data:
+                        lines, q.tail = split_lines(q.tail, data)
+                        if lines:
+                            for item in self._output(q, lines):
+                                yield item
+                    else:
+                        q.open_fds.remove(fd)
+                        del self.running[fd]
+                        if q.tail:
+                            for item in self._output(q, [q.tail]):
+                                yield item
+                            q.tail = ''
+                    if q.pipe and not q.open_fds and not q.done:
+                        self._finish(q)
+        finally:
+            for q in list(self.active):
+                q.error = q.error or QueryCancelled("Query cancelled")
+                self._finish(q)
+
+    __iter__ = run
+
+    def wait(self):
+        """Run the queued queries and return a dictionary mapping each query
+        to the list of its records"""
+        results = {}
+        for q, rec in self.run():
+            results.setdefault(q, []).append(rec)
+        return results
@@ -8,6 +8,12 @@ Python frontend to the nfdump CLI
 """
 
 import os
+import io
+import re
+import time
+import atexit
+import weakref
+import itertools
 from dateutil.parser import parse as parse_date
 import datetime
 fromtimestamp = datetime.datetime.fromtimestamp
@@ -18,7 +24,31 @@ import commands
 
 from IPy import IP
 
+from pynfdump.instrument import QueryStats, wait
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 FILE_FMT = "%Y %m %d %H %M".replace(" ","")
+NFCAPD_RE = re.compile(r"^nfcapd\.\d{12}$")
+#nfcapd writes to nfcapd.current.<pid> and renames it when it rotates
+CURRENT_PREFIX = "nfcapd.current"
+
+#number of fields in a line of nfdump -o pipe output
+PIPE_FIELDS = 24
+DEFAULT_BATCH_SIZE = 65536
+#number of lines parse_search converts at once
+PARSE_CHUNK = 1024
+#length of each piece of a sharded search, in seconds
+DEFAULT_SHARD_INTERVAL = 3600
+#the ways Dumper can read flows: by running nfdump, or by reading the
+#nfcapd files itself
+ENGINES = ('cli', 'native')
+#how flows get back from a remote_host: as nfdump -o pipe text, or as
+#gzipped nfdump -w - binary output
+TRANSPORTS = ('pipe', 'binary')
 
 def load_protocols():
     #2.4 doesn't have socket.getprotocol by id
@@ -28,7 +58,7 @@ def load_protocols():
         line = line.strip("\n")
         if line:
             if line.startswith("#"): continue
-            proto, num, _ = line.split(maxsplit=2)
+            proto, num, _ = line.split(None, 2)
             protocols[int(num)] = proto
     protocols[0]='ip'
     f.close()
@@ -39,47 +69,193 @@ def date_to_fn(date):
 
 STDOUT = 1
 STDERR = 2
-def mycommunicate(cmds):
-    pipe = Popen(cmds, stdout=PIPE,stderr=PIPE)
-    read_set = [pipe.stderr, pipe.stdout]
+#size of the buffer stdout is read into
+READ_SIZE = 256 * 1024
+
+#processes that are still running, killed when the interpreter exits
+_live = weakref.WeakSet()
+
+def _spawn(cmds, stdin=None):
+    try:
+        pipe = Popen(cmds, stdin=stdin, stdout=PIPE, stderr=PIPE)
+    except OSError, e:
+        raise NFDumpError("Unable to run %s: %s" % (cmds[0], e))
+    _live.add(pipe)
+    return pipe
+
+def _kill(pipe):
+    """Stop a process if it is still running"""
+    if pipe.poll() is None:
+        try:
+            pipe.terminate()
+        except OSError:
+            pass
 
-    waited = False
+@atexit.register
+def _kill_all():
+    for pipe in list(_live):
+        _kill(pipe)
 
-    #from the subprocess module
-    try :
+def split_lines(tail, data):
+    """Split data into complete lines.  tail is the incomplete last line of
+    the previous block, returns the lines and the new tail"""
+    lines = (tail + data).splitlines(True)
+    if lines and not lines[-1].endswith("\n"):
+        return lines, lines.pop()
+    return lines, ''
+
+def mycommunicate_chunks(cmds, read_size=READ_SIZE, stats=None, control=None, stdin=None, split=True):
+    """Run cmds and yield (STDOUT, lines) and (STDERR, data) tuples.
+
+    stdout is read in large blocks into a reusable buffer and split into
+    lists of complete lines, stderr is drained as it arrives.  If stats is
+    a :class:`pynfdump.instrument.QueryStats` the spawn time and exit
+    status are recorded on it.  control is a :class:`pynfdump.query.QueryControl`
+    that can cancel the command or give it a deadline.
+
+    If the caller stops reading before the output ends, the process is
+    killed.  With stdin=PIPE, stdin is closed once stdout ends.  With
+    split=False stdout is yielded as blocks of bytes instead of lines.
+    """
+    if stats is None:
+        pipe = _spawn(cmds, stdin)
+    else:
+        t = time.time()
+        pipe = _spawn(cmds, stdin)
+        stats.spawned(time.time() - t)
+    if control is not None:
+        control.attach(pipe)
+    out_fd = pipe.stdout.fileno()
+    err_fd = pipe.stderr.fileno()
+    stdout = io.open(out_fd, 'rb', buffering=0, closefd=False)
+    buf = bytearray(read_size)
+    view = memoryview(buf)
+    tail = ''
+    read_set = [out_fd, err_fd]
+    timeout = None
+
+    try:
         while read_set:
-            rlist, wlist, xlist = select.select(read_set, [], [])
+            if control is not None:
+                control.check()
+                timeout = control.remaining()
+            rlist, wlist, xlist = select.select(read_set, [], [], timeout)
 
-            if pipe.stdout in rlist:
-                data = pipe.stdout.readline()
-                if data == "":
-                    pipe.stdout.close()
-                    read_set.remove(pipe.stdout)
+            if out_fd in rlist:
+                n = stdout.readinto(buf)
+                if not n:
+                    read_set.remove(out_fd)
+                    if pipe.stdin:
+                        pipe.stdin.close()
+                    if tail:
+                        yield STDOUT, [tail]
+                elif not split:
+                    yield STDOUT, view[:n].tobytes()
                 else:
-                    yield STDOUT, data
+                    lines, tail = split_lines(tail, view[:n].tobytes())
+                    if lines:
+                        yield STDOUT, lines
 
-            if pipe.stderr in rlist:
-                data = os.read(pipe.stderr.fileno(), 1024)
-                if data == "":
-                    pipe.stderr.close()
-                    read_set.remove(pipe.stderr)
+            if err_fd in rlist:
+                data = os.read(err_fd, 4096)
+                if not data:
+                    read_set.remove(err_fd)
                 else:
                     yield STDERR, data
-    #work around python2.4 issue:
-    #SyntaxError: 'yield' not allowed in a 'try' block with a 'finally' clause 
-    except:
-        pipe.wait()
-        waited = True
-    if not waited:
-        pipe.wait()
+        #a cancelled process may have exited cleanly, but its output is cut short
+        if control is not None and control.cancelled:
+            control.check()
+    finally:
+        if read_set:
+            #the consumer gave up early, don't wait for nfdump to finish
+            _kill(pipe)
+        if pipe.stdin:
+            pipe.stdin.close()
+        stdout.close()
+        pipe.stdout.close()
+        pipe.stderr.close()
+        cpu = wait(pipe)
+        _live.discard(pipe)
+        if control is not None:
+            control.detach(pipe)
+        if stats is not None:
+            stats.exited(pipe.returncode, cpu)
 
-def run(cmds):
-    #print (cmds)
-    for fd, data in mycommunicate(cmds):
+def mycommunicate(cmds):
+    """Run cmds and yield (STDOUT, line) and (STDERR, data) tuples"""
+    for fd, data in mycommunicate_chunks(cmds):
         if fd == STDERR:
-            raise NFDumpError(data)
+            yield fd, data
         else:
-            yield data
+            for line in data:
+                yield fd, line
+
+def run_chunks(cmds, stats=None, control=None, stdin=None, split=True):
+    """Run cmds and yield lists of output lines, or blocks of bytes when
+    split is False"""
+    for fd, data in mycommunicate_chunks(cmds, stats=stats, control=control, stdin=stdin, split=split):
+        if fd == STDERR:
+            raise NFDumpError(data)
+        yield data
+
+def _intervals(start, end, interval):
+    """Split start to end into (start, -R range) pairs of interval seconds"""
+    step = datetime.timedelta(seconds=interval)
+    #file names have a resolution of one minute
+    minute = datetime.timedelta(minutes=1)
+    shards = []
+    while start <= end:
+        last = min(start + step - minute, end)
+        shards.append((start, date_to_fn(start) + ":" + date_to_fn(last)))
+        start += step
+    return shards
+
+def flatten(chunks):
+    """Turn lists of lines into lines"""
+    for lines in chunks:
+        for line in lines:
+            yield line
+
+def group_lines(lines, size):
+    """Turn lines into lists of up to size lines"""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def run(cmds):
+    #print (cmds)
+    for lines in run_chunks(cmds):
+        for line in lines:
+            yield line
+
+def is_flow_line(line):
+    """Check if a line of nfdump -o pipe output is a flow"""
+    return line.count("|") == PIPE_FIELDS - 1
+
+def limit_batches(batches, n):
+    """Cut a stream of :class:`FlowBatch` objects off after n flows"""
+    for batch in batches:
+        if len(batch) >= n:
+            yield batch[:n]
+            return
+        n -= len(batch)
+        yield batch
+
+def parse_pipe_lines(lines, nfields):
+    """Convert lines of pipe output into lists of integers.
+    Uses numpy to convert the whole block at once if it is available"""
+    if not lines:
+        return []
+    if numpy is not None:
+        a = numpy.fromstring(" ".join(lines).replace("|", " "), dtype=numpy.int64, sep=" ")
+        if len(a) == len(lines) * nfields:
+            return a.reshape(-1, nfields).tolist()
+    return [map(int, line.split("|")) for line in lines]
 
 def maybe_int(val):
     try:
@@ -108,8 +284,378 @@ def flags_to_str(flags):
 class NFDumpError(Exception):
     pass
 
+class QueryTimeout(NFDumpError):
+    """A query ran longer than its timeout"""
+    pass
+
+class QueryCancelled(NFDumpError):
+    """A query was cancelled"""
+    pass
+
+class FlowBatch(object):
+    """A batch of flows stored as numpy column arrays.
+
+    Addresses are stored as two uint64 columns each (``src_hi``, ``src_lo``,
+    ``dst_hi``, ``dst_lo``), IPv4 addresses live in the low word.  ``first``
+    and ``last`` are int64 milliseconds since the epoch and ``packets`` and
+    ``bytes`` are uint64.
+
+    Batches can be filtered and sorted with numpy index arrays::
+
+        >>> web = batch[batch.dstport == 80]
+        >>> web.sum('bytes')
+        >>> top = web.sort('bytes', reverse=True)[:10]
+    """
+
+    columns = ('af', 'first', 'last', 'proto', 'src_hi', 'src_lo', 'srcport',
+               'dst_hi', 'dst_lo', 'dstport', 'srcas', 'dstas', 'input',
+               'output', 'flags', 'tos', 'packets', 'bytes')
+
+    def __init__(self, protocols=None, **columns):
+        self.protocols = protocols or {}
+        for c in self.columns:
+            setattr(self, c, columns[c])
+
+    @classmethod
+    def from_lines(cls, lines, protocols=None):
+        """Build a batch from lines of nfdump -o pipe output"""
+        text = " ".join(lines).replace("|", " ")
+        a = numpy.fromstring(text, dtype=numpy.uint64, sep=" ")
+        if len(a) != len(lines) * PIPE_FIELDS:
+            raise NFDumpError("Unable to parse nfdump output")
+        a = a.reshape(-1, PIPE_FIELDS)
+        return cls.from_array(a, protocols)
+
+    @classmethod
+    def from_records(cls, records, protocols=None):
+        """Build a batch from :class:`FlowRecord` objects"""
+        a = numpy.array([r.parts for r in records], dtype=numpy.uint64).reshape(-1, PIPE_FIELDS)
+        return cls.from_array(a, protocols)
+
+    @classmethod
+    def from_array(cls, a, protocols=None):
+        """Build a batch from an N x 24 uint64 array of pipe fields"""
+        u8, u16, u32, i64 = numpy.uint8, numpy.uint16, numpy.uint32, numpy.int64
+        shift = numpy.uint64(32)
+        return cls(protocols,
+            af      = a[:,0].astype(u8),
+            first   = a[:,1].astype(i64) * 1000 + a[:,2].astype(i64),
+            last    = a[:,3].astype(i64) * 1000 + a[:,4].astype(i64),
+            proto   = a[:,5].astype(u8),
+            src_hi  = (a[:,6] << shift) | a[:,7],
+            src_lo  = (a[:,8] << shift) | a[:,9],
+            srcport = a[:,10].astype(u16),
+            dst_hi  = (a[:,11] << shift) | a[:,12],
+            dst_lo  = (a[:,13] << shift) | a[:,14],
+            dstport = a[:,15].astype(u16),
+            srcas   = a[:,16].astype(u32),
+            dstas   = a[:,17].astype(u32),
+            input   = a[:,18].astype(u32),
+            output  = a[:,19].astype(u32),
+            flags   = a[:,20].astype(u8),
+            tos     = a[:,21].astype(u8),
+            packets = a[:,22].copy(),
+            bytes   = a[:,23].copy(),
+        )
+
+    @classmethod
+    def concatenate(cls, batches):
+        """Join several batches into one"""
+        batches = list(batches)
+        protocols = batches and batches[0].protocols or None
+        cols = dict((c, numpy.concatenate([getattr(b, c) for b in batches])) for c in cls.columns)
+        return cls(protocols, **cols)
+
+    def __len__(self):
+        return len(self.af)
+
+    def __getitem__(self, idx):
+        """Select rows using a slice, a boolean mask or an index array"""
+        cols = dict((c, getattr(self, c)[idx]) for c in self.columns)
+        return self.__class__(self.protocols, **cols)
+
+    def sum(self, column):
+        """Return the total of a column as a python integer"""
+        return int(getattr(self, column).sum())
+
+    def sort(self, column, reverse=False):
+        """Return a new batch ordered by column"""
+        order = numpy.argsort(getattr(self, column), kind='mergesort')
+        if reverse:
+            order = order[::-1]
+        return self[order]
+
+    def srcip(self, i):
+        return _make_ip(int(self.af[i]), int(self.src_hi[i]), int(self.src_lo[i]))
+
+    def dstip(self, i):
+        return _make_ip(int(self.af[i]), int(self.dst_hi[i]), int(self.dst_lo[i]))
+
+    def to_array(self):
+        """Return the batch as an N x 24 uint64 array of pipe fields"""
+        u64 = numpy.uint64
+        mask = u64(0xffffffff)
+        shift = u64(32)
+        first = self.first.astype(u64)
+        last = self.last.astype(u64)
+        thousand = u64(1000)
+        return numpy.column_stack([
+            self.af, first // thousand, first % thousand,
+            last // thousand, last % thousand, self.proto,
+            self.src_hi >> shift, self.src_hi & mask,
+            self.src_lo >> shift, self.src_lo & mask, self.srcport,
+            self.dst_hi >> shift, self.dst_hi & mask,
+            self.dst_lo >> shift, self.dst_lo & mask, self.dstport,
+            self.srcas, self.dstas, self.input, self.output,
+            self.flags, self.tos, self.packets, self.bytes,
+        ]).astype(u64)
+
+    def records(self):
+        """Iterate over the batch as :class:`FlowRecord` objects, like
+        :func:`Dumper.search`"""
+        protocols = self.protocols
+        for row in self.to_array().tolist():
+            yield FlowRecord(row, protocols)
+
+    __iter__ = records
+
+AF_INET6 = 10
+def _make_ip(af, hi, lo):
+    if af == AF_INET6:
+        return IP((hi << 64) | lo, ipversion=6)
+    return IP(lo, ipversion=4)
+
+def _words_to_int(af, w0, w1, w2, w3):
+    """Combine the four 32 bit address words nfdump prints into one integer"""
+    if af == AF_INET6:
+        return (w0 << 96) | (w1 << 64) | (w2 << 32) | w3
+    return w3
+
+def _words_to_ip(af, w0, w1, w2, w3):
+    if af == AF_INET6:
+        return IP((w0 << 96) | (w1 << 64) | (w2 << 32) | w3, ipversion=6)
+    return IP(w3, ipversion=4)
+
+def _part(idx, doc=None):
+    return property(lambda self: self.parts[idx], doc=doc)
+
+class _Record(object):
+    """Common dictionary-style access for :class:`FlowRecord` and
+    :class:`StatRecord`.
+
+    Fields are read with ``rec['bytes']`` or ``rec.bytes``.  Extra keys can be
+    stored with ``rec['asn'] = 123``, they are kept in a separate dictionary
+    that is only created when needed.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        extra = self.extra
+        if extra and key in extra:
+            return extra[key]
+        if key in self.fields:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if self.extra is None:
+            self.extra = {}
+        self.extra[key] = value
+
+    def __contains__(self, key):
+        return key in self.fields or bool(self.extra and key in self.extra)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        keys = list(self.fields)
+        if self.extra:
+            keys.extend(k for k in self.extra if k not in self.fields)
+        return keys
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def as_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.parts == other.parts
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "<%s %r>" % (self.__class__.__name__, self.as_dict())
+
+class FlowRecord(_Record):
+    """A single flow from nfdump -o pipe output.
+
+    The raw integers from nfdump are kept in ``parts``, IP addresses, dates
+    and protocol names are only created when those fields are read.  IPv6
+    addresses are decoded from all four address words.
+    """
+    #    snprintf(data_string, STRINGSIZE-1 ,"%i|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%llu|%llu",
+    #                0 af, 1 r->first, 2 r->msec_first ,3 r->last, 4 r->msec_last, 5 r->prot,
+    #                6 sa[0], 7 sa[1], 8 sa[2], 9 r->srcip, 10 r->srcport, 11 da[0], 12 da[1], 13 da[2], 14 r->dstip, 15 r->dstport,
+    #                16 r->srcas, 17 r->dstas, 18 r->input, 19 r->output,
+    #                20 r->tcp_flags, 21 r->tos, 22 (unsigned long long)r->dPkts, 23 (unsigned long long)r->dOctets);
+    __slots__ = ('parts', 'protocols', 'extra')
+
+    fields = ('af', 'first', 'last', 'prot', 'srcip', 'srcport', 'dstip',
+              'dstport', 'srcas', 'dstas', 'input', 'output', 'flags', 'tos',
+              'packets', 'bytes')
+
+    def __init__(self, parts, protocols=None):
+        self.parts = parts
+        self.protocols = protocols
+        self.extra = None
+
+    af          = _part(0)
+    msec_first  = _part(2)
+    msec_last   = _part(4)
+    proto       = _part(5, "protocol number")
+    srcport     = _part(10)
+    dstport     = _part(15)
+    srcas       = _part(16)
+    dstas       = _part(17)
+    input       = _part(18)
+    output      = _part(19)
+    flags       = _part(20)
+    tos         = _part(21)
+    packets     = _part(22)
+    bytes       = _part(23)
+
+    @property
+    def first(self):
+        return fromtimestamp(self.parts[1])
+
+    @property
+    def last(self):
+        return fromtimestamp(self.parts[3])
+
+    @property
+    def first_ms(self):
+        return self.parts[1] * 1000 + self.parts[2]
+
+    @property
+    def last_ms(self):
+        return self.parts[3] * 1000 + self.parts[4]
+
+    @property
+    def prot(self):
+        proto = self.parts[5]
+        if self.protocols is None:
+            return proto
+        return self.protocols.get(proto, proto)
+
+    @property
+    def src(self):
+        """The source address as an integer"""
+        p = self.parts
+        return _words_to_int(p[0], p[6], p[7], p[8], p[9])
+
+    @property
+    def dst(self):
+        """The destination address as an integer"""
+        p = self.parts
+        return _words_to_int(p[0], p[11], p[12], p[13], p[14])
+
+    @property
+    def srcip(self):
+        p = self.parts
+        return _words_to_ip(p[0], p[6], p[7], p[8], p[9])
+
+    @property
+    def dstip(self):
+        p = self.parts
+        return _words_to_ip(p[0], p[11], p[12], p[13], p[14])
+
+#possible field counts of a line of nfdump -s -o pipe output,
+#the object is either one field or four address words
+STAT_FIELDS = (13, 16)
+
+class StatRecord(_Record):
+    """A single line of nfdump -s -o pipe output.
+
+    The statistics object is available under the name of the statistic,
+    for example ``rec['srcip']``, or as ``rec.key``.
+    """
+    #    af|first|msec_first|last|msec_last|proto|object...|flows|packets|bytes|pps|bps|bpp
+    #    where object is either a single number or the four address words
+    __slots__ = ('parts', 'object_field', 'protocols', 'extra')
+
+    def __init__(self, parts, object_field, protocols=None):
+        self.parts = parts
+        self.object_field = object_field
+        self.protocols = protocols
+        self.extra = None
+
+    @property
+    def fields(self):
+        return ('af', 'first', 'last', 'prot', self.object_field, 'flows',
+                'packets', 'bytes', 'pps', 'bps', 'bpp')
+
+    af          = _part(0)
+    msec_first  = _part(2)
+    msec_last   = _part(4)
+    flows       = _part(-6)
+    packets     = _part(-5)
+    bytes       = _part(-4)
+    pps         = _part(-3)
+    bps         = _part(-2)
+    bpp         = _part(-1)
+
+    first       = FlowRecord.first
+    last        = FlowRecord.last
+    first_ms    = FlowRecord.first_ms
+    last_ms     = FlowRecord.last_ms
+    prot        = FlowRecord.prot
+
+    @property
+    def raw_key(self):
+        """The statistics object, addresses as integers"""
+        p = self.parts
+        if len(p) == STAT_FIELDS[1]:
+            return _words_to_int(p[0], p[6], p[7], p[8], p[9])
+        return p[6]
+
+    @property
+    def key(self):
+        """The statistics object, addresses as IPy.IP objects"""
+        p = self.parts
+        if len(p) == STAT_FIELDS[1]:
+            return _words_to_ip(p[0], p[6], p[7], p[8], p[9])
+        return p[6]
+
+    @property
+    def proto(self):
+        """protocol number, the statistics object for a proto statistic"""
+        if self.object_field == 'proto':
+            return self.key
+        return self.parts[5]
+
+    def __getitem__(self, key):
+        #the statistics object wins over a header field of the same name
+        if key == self.object_field and not (self.extra and key in self.extra):
+            return self.key
+        return _Record.__getitem__(self, key)
+
+    def __getattr__(self, name):
+        if name == self.object_field:
+            return self.key
+        raise AttributeError(name)
+
+#flow_stats fields that are not counters
+_NOT_SUMMED = frozenset(['ident', 'first', 'last', 'msec_first', 'msec_last'])
+
 class Dumper:
-    def __init__(self, datadir='/', profile='live',sources=None,remote_host=None,executable_path='nfdump'):
+    def __init__(self, datadir='/', profile='live',sources=None,remote_host=None,executable_path='nfdump',cache=None,
+                 ssh_pool=None, engine='cli', rollup=None, catalog=None, transport='pipe'):
         if not datadir.endswith("/"):
             datadir = datadir + '/'
         self.datadir = datadir
@@ -119,6 +665,17 @@ class Dumper:
         self.exec_path = executable_path
         if os.path.isdir(self.exec_path):
             self.exec_path = os.path.join(self.exec_path, "nfdump")
+        self.cache = cache
+        self.ssh_pool = ssh_pool
+        if engine not in ENGINES:
+            raise NFDumpError("Unknown engine %r" % engine)
+        self.engine = engine
+        if transport not in TRANSPORTS:
+            raise NFDumpError("Unknown transport %r" % transport)
+        self.transport = transport
+        self.rollup = rollup
+        self.catalog = catalog
+        self.hooks = []
         self.set_where()
         self.protocols = load_protocols()
 
@@ -161,6 +718,12 @@ class Dumper:
         if stdin:
             self.filename = '-'
 
+    def _ssh_cmd(self):
+        """Return the command prefix to run a command on the remote host"""
+        if self.ssh_pool:
+            return self.ssh_pool.command(self.remote_host)
+        return ['ssh', self.remote_host]
+
     def _arg_escape(self, arg):
         """Escape any arguments so that they can be passed over SSH"""
         if self.remote_host:
@@ -168,10 +731,10 @@ class Dumper:
         else:
             return arg
 
-    def _base_cmd(self):
+    def _base_cmd(self, where=None):
         cmd = []
         if self.remote_host:
-            cmd = ['ssh', self.remote_host]
+            cmd = self._ssh_cmd()
         cmd.extend([self.exec_path, '-q', '-o', 'pipe'])
 
         if self.datadir and self.sources and self.profile:
@@ -182,10 +745,319 @@ class Dumper:
         if self.filename:
             cmd.extend(['-r', self.filename])
         else:
-            cmd.extend(['-R', self._where])
+            cmd.extend(['-R', where or self._where])
         return cmd
 
-    def search(self, query='', filterfile=None, aggregate=None, statistics=None, statistics_order=None,limit=None):
+    def _source_dirs(self):
+        if self.datadir and self.sources and self.profile:
+            return [os.path.join(self.datadir, self.profile, s) for s in self.sources]
+        return []
+
+    def _catalog(self):
+        if self.catalog is None:
+            from pynfdump.catalog import Catalog
+            self.catalog = Catalog()
+        return self.catalog
+
+    def _where_range(self, where=None):
+        """Return the first and last file names of a -R range, either may be
+        None for an open range.  Raises ValueError for other ranges"""
+        where = where or self._where
+        if where == '.':
+            return None, None
+        if ':' in where:
+            first, last = where.split(":", 1)
+            if NFCAPD_RE.match(first) and NFCAPD_RE.match(last):
+                return first, last
+        elif NFCAPD_RE.match(where):
+            return where, None
+        raise ValueError(where)
+
+    def _range_files(self, where=None, closed=False):
+        """Return the names of the files a query reads, or None if they
+        can't be determined locally.  With closed, also return None if more
+        data may still be written to the range"""
+        if self.remote_host:
+            return None
+        if self.filename:
+            if self.filename == '-' or os.path.basename(self.filename).startswith(CURRENT_PREFIX):
+                return None
+            return [self.filename]
+
+        try:
+            first, last = self._where_range(where)
+        except ValueError:
+            return None
+        if closed and last is None:
+            return None
+
+        dirs = self._source_dirs()
+        if not dirs:
+            return None
+        catalog = self._catalog()
+        names = []
+        for d in dirs:
+            if not os.path.isdir(d):
+                return None
+            files = catalog.files(d, first, last)
+            #nfcapd is still writing the range until a later file exists
+            if closed and (not files or files[-1][0] < last):
+                return None
+            names.extend(path for f, path, size in files if last is None or f <= last)
+        return names
+
+    def _remote_files(self, d):
+        """List the nfcapd files under a directory on the remote host"""
+        def load():
+            cmd = self._ssh_cmd() + ['find', self._arg_escape(d), '-name', self._arg_escape('nfcapd.*'),
+                '-printf', self._arg_escape('%s %p\\n')]
+            files = []
+            for line in run(cmd):
+                size, path = line.rstrip("\n").split(" ", 1)
+                name = os.path.basename(path)
+                if NFCAPD_RE.match(name):
+                    files.append((name, path, int(size)))
+            return sorted(files)
+        return self._catalog().remote(('remote-files', self.remote_host, d), load)
+
+    def files(self):
+        """Return the files the current query will read as
+        :class:`pynfdump.catalog.CatalogFile` tuples, leaving out empty files.
+        rows is the number of flows in the file, or None when it isn't
+        known, such as for remote files."""
+        from pynfdump.catalog import CatalogFile
+        if self.filename:
+            if self.filename == '-':
+                raise NFDumpError("Can not list the files of stdin")
+            if self.remote_host:
+                return [CatalogFile(self.filename, os.path.basename(self.filename), None, None)]
+            try:
+                size = os.stat(self.filename).st_size
+            except OSError:
+                return []
+            return [CatalogFile(self.filename, os.path.basename(self.filename), size,
+                self._catalog().rows(self.filename, size))]
+        try:
+            first, last = self._where_range()
+        except ValueError:
+            raise NFDumpError("Can not list the files of %r" % self._where)
+        catalog = self._catalog()
+        result = []
+        for d in self._source_dirs():
+            if self.remote_host:
+                files = [f for f in self._remote_files(d) if first is None or f[0] >= first]
+            else:
+                files = catalog.files(d, first, last)
+            for name, path, size in files:
+                if (last is not None and name > last) or not size:
+                    continue
+                rows = None
+                if not self.remote_host:
+                    rows = catalog.rows(path, size)
+                result.append(CatalogFile(path, name, size, rows))
+        return result
+
+    def estimate_rows(self):
+        """Return the number of flows the current query will read before any
+        filtering, or None if it isn't known"""
+        total = 0
+        for f in self.files():
+            if f.rows is None:
+                return None
+            total += f.rows
+        return total
+
+    def _resolve_files(self, where=None):
+        """Return a (filename, size, mtime) tuple for every file a query
+        reads, or None if the files can't be determined or more data may
+        still be written to the range"""
+        names = self._range_files(where, closed=True)
+        if names is None:
+            return None
+        files = []
+        for fn in names:
+            try:
+                st = os.stat(fn)
+            except OSError:
+                return None
+            files.append((os.path.abspath(fn), st.st_size, st.st_mtime))
+        return files
+
+    def _native_files(self):
+        names = self._range_files()
+        if names is None:
+            raise NFDumpError("The native engine can only read local nfcapd files")
+        return names
+
+    def _search_native(self, query, filterfile, aggregate, statistics, statistics_order, limit,
+                       stats=None, control=None):
+        from pynfdump import nffile
+        if filterfile or query.strip() not in ('', 'any'):
+            raise NFDumpError("The native engine can not evaluate filter %r" % (filterfile or query))
+        if aggregate:
+            raise NFDumpError("The native engine does not support aggregation")
+        if control is not None and control.max_bytes:
+            raise NFDumpError("The native engine does not support max_bytes")
+        names = self._native_files()
+        if stats is not None:
+            stats.command = names
+        records = nffile.read_files(names, self.protocols)
+        if control is not None:
+            records = control.checked(records)
+        if statistics:
+            from pynfdump.aggregate import StatCounter
+            counter = StatCounter(statistics)
+            for rec in records:
+                counter.add(rec)
+            return iter(counter.top(statistics_order, limit, self.protocols))
+        if limit:
+            records = itertools.islice(records, limit)
+        return records
+
+    def _remote_watchdog(self, cmd, filter=None):
+        """Wrap the remote part of cmd so the remote nfdump is killed when
+        the ssh session ends.  nfdump runs in the background next to a
+        watcher that kills it once its stdin closes, which happens when we
+        close it or when ssh goes away.  The shell itself exits as soon as
+        nfdump does, so the output ends even if ssh left a parent shell
+        holding it.  filter is an optional remote command the output is
+        piped through."""
+        i = cmd.index(self.exec_path)
+        script = "exec 3<&0; " + " ".join(cmd[i:])
+        if filter:
+            script += " | " + filter
+        script += (" & pid=$!; (cat <&3; kill $pid) >/dev/null 2>&1 & w=$!;"
+                   " wait $pid; s=$?; kill $w 2>/dev/null; exit $s")
+        return cmd[:i] + ['sh', '-c', commands.mkarg(script)]
+
+    def _use_binary(self, statistics, control):
+        """Check if a search should use the binary remote transport"""
+        from pynfdump import transport
+        if self.transport != 'binary' or not self.remote_host or statistics or self.filename == '-':
+            return False
+        if control is not None and control.max_bytes:
+            return False
+        return transport.supported(self.remote_host) is not False
+
+    def _search_binary(self, cmd, stats=None, control=None):
+        """Run a remote search with nfdump -w - piped through gzip, and fall
+        back to the text output if the remote side can't do it"""
+        from pynfdump import transport
+        from pynfdump.nffile import read_stream
+        i = cmd.index('-o')
+        binary = self._remote_watchdog(cmd[:i] + ['-w', '-'] + cmd[i+2:], transport.COMPRESSOR)
+        reader = transport.GunzipReader(run_chunks(binary, stats, control, PIPE, split=False), stats)
+        records = read_stream(reader, self.protocols)
+        error = None
+        try:
+            try:
+                first = records.next()
+            except StopIteration:
+                transport.set_supported(self.remote_host, True)
+                return
+            except (QueryTimeout, QueryCancelled):
+                raise
+            except NFDumpError, e:
+                error = e
+            else:
+                transport.set_supported(self.remote_host, True)
+                yield first
+                for rec in records:
+                    yield rec
+        finally:
+            reader.close()
+        if error is None:
+            return
+
+        #a bad filter or missing file fails the same way with the text
+        #output, only give up on the binary output if the text output works
+        records = self.parse_search_chunks(self._chunks(cmd, stats=stats, control=control))
+        try:
+            first = records.next()
+        except StopIteration:
+            transport.set_supported(self.remote_host, False)
+            return
+        except (QueryTimeout, QueryCancelled):
+            raise
+        except NFDumpError:
+            raise error
+        transport.set_supported(self.remote_host, False)
+        yield first
+        for rec in records:
+            yield rec
+
+    def _command(self, cmd):
+        """Return the command line that runs cmd and what its stdin should
+        be.  Remote commands get the watchdog, which needs a pipe on stdin
+        that is closed when the query ends"""
+        if self.remote_host and self.filename != '-':
+            return self._remote_watchdog(cmd), PIPE
+        return cmd, None
+
+    def _cached(self, cmd, where=None, stats=None):
+        """Look up cmd in the result cache, see
+        :func:`pynfdump.cache.ResultCache.begin`"""
+        if self.cache is None:
+            return None, None
+        return self.cache.begin(cmd, self._resolve_files(where), stats)
+
+    def _run_chunks(self, cmd, where=None, stats=None, control=None):
+        """Run cmd, using the result cache if one is configured"""
+        hit, writer = self._cached(cmd, where, stats)
+        if hit:
+            return self.cache.read_chunks(hit)
+        cmd, stdin = self._command(cmd)
+        chunks = run_chunks(cmd, stats, control, stdin)
+        if writer is not None:
+            chunks = writer.store(chunks)
+        return chunks
+
+    def _chunks(self, cmd, where=None, stats=None, control=None):
+        chunks = self._run_chunks(cmd, where, stats, control)
+        if stats is not None:
+            chunks = stats.chunks(chunks)
+        if control is not None:
+            chunks = control.chunks(chunks)
+        return chunks
+
+    def _run(self, cmd, where=None, stats=None, control=None):
+        for lines in self._chunks(cmd, where, stats, control):
+            for line in lines:
+                yield line
+
+    def add_hook(self, hook):
+        """Call hook with a :class:`pynfdump.instrument.QueryStats` after
+        every search and flow_stats query finishes.  Queries are not timed
+        at all while no hooks are registered."""
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def _query(self, func, timeout=None, max_bytes=None, size=None):
+        """Run func(stats, control) as a query with a single result, with the
+        hooks, timeout and max_bytes of a search.  size returns the number
+        of rows in the result"""
+        control = None
+        if timeout or max_bytes:
+            from pynfdump.query import QueryControl
+            control = QueryControl(timeout, None, max_bytes)
+        try:
+            if not self.hooks:
+                return func(None, control)
+            stats = QueryStats(None)
+            return stats.call(func, self.hooks, (stats, control), size)
+        finally:
+            if control is not None:
+                control.kill()
+
+    def _time_shards(self, interval):
+        """Split the start and end date into -R ranges of interval seconds"""
+        return [where for start, where in _intervals(self.sd, self.ed, interval)]
+
+    def search(self, query='', filterfile=None, aggregate=None, statistics=None, statistics_order=None,limit=None,
+               workers=None, shard_interval=DEFAULT_SHARD_INTERVAL, timeout=None, max_rows=None, max_bytes=None,
+               handle=False):
         """Run nfdump with the following arguments
 
         :param query: The nfdump filter
@@ -221,10 +1093,375 @@ class Dumper:
             * pps       - Packers Per Second
             * bpp.      - Bytes Per Packet
 
-        :param limit: number of results
+        :param limit: number of results, 0 for all statistics results
+        :param workers: When searching a start and end date, split the range
+            into pieces of shard_interval seconds and run up to this many
+            nfdump processes at once.  The results are merged so they
+            match a single nfdump run.
+        :param shard_interval: the length of each piece in seconds
+        :param timeout: raise :class:`QueryTimeout` and stop nfdump if the
+            query takes longer than this many seconds
+        :param max_rows: stop after this many records
+        :param max_bytes: stop after reading this many bytes of nfdump output
+        :param handle: return a :class:`pynfdump.query.Query` even when none
+            of timeout, max_rows or max_bytes are given
+
+        When any of the last four options are used the result is a
+        :class:`pynfdump.query.Query`, which can be cancelled from another
+        thread and used in a with statement.
         """
+        control = None
+        if handle or timeout or max_rows or max_bytes:
+            from pynfdump.query import Query, QueryControl
+            control = QueryControl(timeout, max_rows, max_bytes)
+        stats = None
+        if self.hooks:
+            stats = QueryStats(None)
+        records = self._search(query, filterfile, aggregate, statistics, statistics_order, limit,
+            workers, shard_interval, stats, control)
+        if stats is not None:
+            records = stats.records(records, self.hooks)
+        if control is not None:
+            return Query(control, records)
+        return records
 
-        cmd = self._base_cmd()
+    def _search(self, query, filterfile, aggregate, statistics, statistics_order, limit,
+                workers, shard_interval, stats=None, control=None):
+        if self.engine == 'native':
+            return self._timed(self._search_native(query, filterfile, aggregate, statistics, statistics_order, limit,
+                stats, control), stats)
+
+        if workers and self.sd and self.ed and not self.filename:
+            return self._search_sharded(query, filterfile, aggregate, statistics, statistics_order, limit,
+                workers, shard_interval, stats, control)
+
+        cmd = self._search_cmd(query, filterfile, aggregate, statistics, statistics_order, limit)
+        if stats is not None:
+            stats.command = cmd
+        if self._use_binary(statistics, control):
+            return self._timed(self._search_binary(cmd, stats, control), stats)
+        return self._parse(self._chunks(cmd, stats=stats, control=control), statistics, stats)
+
+    def _parse(self, chunks, statistics=None, stats=None):
+        """Parse lists of output lines into records, timing each list when
+        there are stats"""
+        if stats is None:
+            if statistics:
+                return self.parse_stats(flatten(chunks), object_field=statistics)
+            return self.parse_search_chunks(chunks)
+        if statistics:
+            parse = lambda lines: list(self.parse_stats(lines, object_field=statistics))
+        else:
+            parse = lambda lines: list(self.parse_search_chunks([lines]))
+        return stats.timed(chunks, parse)
+
+    def _timed(self, records, stats=None, size=PARSE_CHUNK):
+        """Time making records size at a time when there are stats"""
+        if stats is None:
+            return records
+        return stats.timed(group_lines(records, size))
+
+    def _search_sharded(self, query, filterfile, aggregate, statistics, statistics_order, limit, workers, shard_interval,
+                        stats=None, control=None):
+        from pynfdump.merge import merge_stats, merge_aggregates
+
+        if aggregate and statistics:
+            raise NFDumpError("Specify only one of aggregate and statistics")
+
+        #statistics and aggregates need every object from every shard
+        shard_limit = limit
+        if statistics:
+            shard_limit = 0
+        elif aggregate:
+            shard_limit = None
+
+        chunks = self._shard_chunks(query, filterfile, aggregate, statistics, statistics_order, shard_limit,
+            workers, shard_interval, stats, control)
+        records = self._parse(chunks, statistics, stats)
+        if statistics:
+            return iter(merge_stats(records, statistics, statistics_order, limit, self.protocols))
+        elif aggregate:
+            return iter(merge_aggregates(records, limit, self.protocols))
+        if limit:
+            records = itertools.islice(records, limit)
+        return records
+
+    def _shard_chunks(self, query, filterfile, aggregate, statistics, statistics_order, limit, workers, shard_interval,
+                      stats=None, control=None):
+        """Run nfdump over each time shard, up to workers at once, and return
+        the output of all of them in time order"""
+        from pynfdump.parallel import ordered_parallel
+        funcs = []
+        cmds = []
+        for where in self._time_shards(shard_interval):
+            cmd = self._search_cmd(query, filterfile, aggregate, statistics, statistics_order, limit, where)
+            cmds.append(cmd)
+            funcs.append(lambda cmd=cmd, where=where: self._run_chunks(cmd, where, stats, control))
+
+        chunks = ordered_parallel(funcs, workers)
+        if stats is not None:
+            stats.command = cmds
+            chunks = stats.chunks(chunks)
+        if control is not None:
+            chunks = control.chunks(chunks)
+        return chunks
+
+    def top_n_drilldown(self, first, second, n=10, query='', filterfile=None, workers=None):
+        """Find the top n objects for the first statistic, and for each of
+        them the top n objects for the second statistic.
+
+        This gives the same answer as running a statistics search for first
+        and then one for second limited to each of the results, with two
+        nfdump runs instead of n+1.  The first level is a statistics search,
+        the second reads only the flows matching its objects and counts
+        them per object.
+
+        :param first: statistic and order, like 'ip/bytes'
+        :param second: statistic and order for the drill down
+        :param n: number of results at each level
+
+        The rest of the options are passed to :func:`Dumper.search`.
+        Returns a list of (StatRecord, [StatRecord, ...]) tuples.
+        """
+        from pynfdump.aggregate import drilldown, parse_stat_spec, stat_filter
+        stat, order = parse_stat_spec(first)
+        top = list(self.search(query, filterfile, statistics=stat, statistics_order=order, limit=n,
+            workers=workers))
+        if not top:
+            return []
+        if self.engine == 'cli' and not filterfile:
+            query = "(%s) and (%s)" % (query or 'any', stat_filter(stat, top))
+        records = self.search(query, filterfile, workers=workers)
+        return drilldown(records, top, first, second, n, self.protocols)
+
+    def top_n_by_interval(self, start, end, step=300, stat='ip', order='bytes', n=10, query='',
+                          filterfile=None, workers=4, timeout=None):
+        """Find the top n objects of a statistic in each step seconds from
+        start to end, like a statistics search for every interval.
+
+        Each interval is a separate nfdump -s over its own files, up to
+        workers of them run at once and only the top n of each are read
+        back.  step should be a multiple of the nfcapd rotation interval.
+        timeout is the same as for :func:`Dumper.search`.
+
+        Returns a list of (datetime, [StatRecord, ...]) tuples in time order.
+        """
+        from pynfdump.parallel import ordered_parallel
+        if self.engine == 'native':
+            raise NFDumpError("top_n_by_interval requires the nfdump executable")
+        if isinstance(start, basestring):
+            start = parse_date(start)
+        if isinstance(end, basestring):
+            end = parse_date(end)
+        intervals = _intervals(start, end, step)
+        cmds = [self._search_cmd(query, filterfile, None, stat, order, n, where) for t, where in intervals]
+
+        def run(stats, control):
+            if stats is not None:
+                stats.command = cmds
+            def top(cmd, where):
+                chunks = self._chunks(cmd, where, stats, control)
+                return [list(self.parse_stats(flatten(chunks), object_field=stat))]
+            funcs = [lambda cmd=cmd, where=where: top(cmd, where) for cmd, (t, where) in itertools.izip(cmds, intervals)]
+            results = ordered_parallel(funcs, workers)
+            return [(t, records) for (t, where), records in itertools.izip(intervals, results)]
+
+        return self._query(run, timeout, size=lambda result: sum(len(records) for t, records in result))
+
+    def export(self, fmt, columns, dest, query='', filterfile=None, aggregate=None, limit=None,
+               header=False, extra=None, timeout=None, max_bytes=None):
+        """Run nfdump and write the flows straight to the file dest, without
+        building a record per flow.  Memory use does not depend on the
+        number of flows.
+
+        :param fmt: one of 'csv', 'tsv' or 'splunk' (key=value lines)
+        :param columns: list of column names, like 'first srcip dstport'.split()
+        :param header: write the column names first (csv and tsv)
+        :param extra: dictionary of additional column names to functions of
+            the pipe output line split on '|'
+
+        The rest of the options are the same as :func:`Dumper.search`.
+        Returns the number of flows written.
+        """
+        from pynfdump.export import export_chunks, record_chunks
+
+        def run(stats, control):
+            if self.engine == 'native':
+                records = self._search_native(query, filterfile, aggregate, None, None, limit, stats, control)
+                chunks = record_chunks(records)
+            else:
+                cmd = self._search_cmd(query, filterfile, aggregate, None, None, limit)
+                if stats is not None:
+                    stats.command = cmd
+                chunks = self._chunks(cmd, stats=stats, control=control)
+            return export_chunks(chunks, fmt, columns, dest, self.protocols, header, extra)
+
+        return self._query(run, timeout, max_bytes, size=lambda count: count)
+
+    def group_by(self, key, n=10, order='bytes', query='', filterfile=None, max_keys=None):
+        """Sum flows, packets and bytes per key over the flows matching the
+        query and return the top n groups as (key, flows, packets, bytes)
+        tuples.  Unlike the statistics option of :func:`Dumper.search` the
+        key can be anything :class:`pynfdump.aggregate.GroupBy` accepts,
+        like 'srcip/24', ['srcip', 'dstport'] or 'first/3600'.
+
+        :param order: one of flows, packets or bytes
+        :param max_keys: spill groups to disk when there are more than this
+        """
+        from pynfdump.aggregate import GroupBy
+        g = GroupBy(key, max_keys)
+        try:
+            if g.vectorized and self.engine == 'cli':
+                g.update_batches(self.search_batches(query, filterfile))
+            else:
+                g.update(self.search(query, filterfile))
+            return g.top(n, order)
+        finally:
+            g.close()
+
+    def heavy_hitters(self, statistic, order='bytes', n=10, query='', filterfile=None, capacity=None,
+                      workers=None, shard_interval=DEFAULT_SHARD_INTERVAL, timeout=None):
+        """Approximate the top n objects of a statistics search in a fixed
+        amount of memory, for ranges with too many distinct objects for
+        nfdump -s.  See :class:`pynfdump.sketch.HeavyHitters`.
+
+        :param statistic: one of the statistics :func:`Dumper.search`
+            supports, addresses are returned as
+            :class:`pynfdump.aggregate.Net` objects
+        :param order: one of flows, packets or bytes
+        :param capacity: how many objects to track, more is more accurate
+        :param workers: like :func:`Dumper.search`, each piece of the range is
+            counted separately and the results merged
+        :param timeout: like :func:`Dumper.search`
+
+        Returns a list of (key, estimate, error) tuples, the true total of
+        each key is between estimate - error and estimate.
+        """
+        from pynfdump.sketch import HeavyHitters, DEFAULT_CAPACITY
+        capacity = capacity or DEFAULT_CAPACITY
+        make = lambda: HeavyHitters(statistic, order, capacity)
+        return self._sketch(make, n, query, filterfile, workers, shard_interval, timeout)
+
+    def distinct_count(self, key, distinct, n=10, query='', filterfile=None, precision=None,
+                       workers=None, shard_interval=DEFAULT_SHARD_INTERVAL, timeout=None):
+        """Find the n groups with the most distinct values of a field, like
+        the sources that talked to the most destination addresses::
+
+            >>> d.distinct_count('srcip', 'dstip', n=10)
+            >>> d.distinct_count('dstport', 'srcip', n=10, query='proto tcp')
+
+        The values are counted with a HyperLogLog per group, see
+        :class:`pynfdump.sketch.DistinctCounter`, so the counts are
+        estimates, within about 3% with the default precision.
+
+        :param key: what to group by, anything
+            :class:`pynfdump.aggregate.GroupBy` accepts except functions
+        :param distinct: the field, or list of fields, to count
+        :param precision: log2 of the registers in each HyperLogLog
+        :param workers: like :func:`Dumper.search`, each piece of the range is
+            counted separately and the results merged
+        :param timeout: like :func:`Dumper.search`
+
+        Returns a list of (key, count) tuples.
+        """
+        from pynfdump.sketch import DistinctCounter, DEFAULT_PRECISION
+        precision = precision or DEFAULT_PRECISION
+        make = lambda: DistinctCounter(key, distinct, precision)
+        return self._sketch(make, n, query, filterfile, workers, shard_interval, timeout)
+
+    def _sketch(self, make, n, query, filterfile, workers, shard_interval, timeout=None):
+        """Feed the flows into summaries returned by make, one per time shard
+        when using workers, merge them and return their top n"""
+        from pynfdump.parallel import ordered_parallel
+
+        def count(stats, control, cmd=None, where=None):
+            s = make()
+            if self.engine == 'native':
+                s.update(self._search_native(query, filterfile, None, None, None, None, stats, control))
+                return s
+            chunks = self._chunks(cmd, where, stats, control)
+            if numpy is not None:
+                s.update_batches(self.parse_batches(flatten(chunks)))
+            else:
+                s.update(self.parse_search_chunks(chunks))
+            return s
+
+        def run(stats, control):
+            if not (workers and self.sd and self.ed and not self.filename and self.engine == 'cli'):
+                cmd = None
+                if self.engine == 'cli':
+                    cmd = self._search_cmd(query, filterfile)
+                    if stats is not None:
+                        stats.command = cmd
+                return count(stats, control, cmd).top(n)
+            shards = [(self._search_cmd(query, filterfile, where=where), where)
+                      for where in self._time_shards(shard_interval)]
+            if stats is not None:
+                stats.command = [cmd for cmd, where in shards]
+            funcs = [lambda cmd=cmd, where=where: [count(stats, control, cmd, where)] for cmd, where in shards]
+            result = None
+            for part in ordered_parallel(funcs, workers):
+                if result is None:
+                    result = part
+                else:
+                    result.merge(part)
+            return result.top(n)
+
+        return self._query(run, timeout, size=len)
+
+    def search_batches(self, query='', filterfile=None, aggregate=None, limit=None, batch_size=DEFAULT_BATCH_SIZE,
+                       workers=None, shard_interval=DEFAULT_SHARD_INTERVAL, timeout=None, max_rows=None,
+                       max_bytes=None, handle=False):
+        """Run nfdump and return the flows as :class:`FlowBatch` objects of
+        up to batch_size records each.  Requires numpy.
+
+        The options are the same as :func:`Dumper.search`, statistics mode
+        is not supported.
+        """
+        if numpy is None:
+            raise NFDumpError("search_batches requires numpy")
+        control = None
+        if handle or timeout or max_rows or max_bytes:
+            from pynfdump.query import Query, QueryControl
+            control = QueryControl(timeout, max_rows, max_bytes)
+        stats = None
+        if self.hooks:
+            stats = QueryStats(None)
+        batches = self._search_batches(query, filterfile, aggregate, limit, workers, shard_interval, batch_size,
+            stats, control)
+        if max_rows:
+            batches = limit_batches(batches, max_rows)
+        if stats is not None:
+            batches = stats.records(batches, self.hooks, len)
+        if control is not None:
+            return Query(control, batches, len)
+        return batches
+
+    def _search_batches(self, query, filterfile, aggregate, limit, workers, shard_interval, batch_size,
+                        stats=None, control=None):
+        sharded = workers and self.sd and self.ed and not self.filename
+        if self.engine == 'native' or (sharded and aggregate) or (not sharded and self._use_binary(None, control)):
+            #these are read as records rather than lines of output
+            records = self._search(query, filterfile, aggregate, None, None, limit, workers, shard_interval,
+                stats, control)
+            return (FlowBatch.from_records(group, self.protocols) for group in group_lines(records, batch_size))
+
+        if sharded:
+            chunks = self._shard_chunks(query, filterfile, aggregate, None, None, limit, workers, shard_interval,
+                stats, control)
+            batches = self._timed(self.parse_batches(flatten(chunks), batch_size), stats, 1)
+            if limit:
+                batches = limit_batches(batches, limit)
+            return batches
+
+        cmd = self._search_cmd(query, filterfile, aggregate, None, None, limit)
+        if stats is not None:
+            stats.command = cmd
+        chunks = self._chunks(cmd, stats=stats, control=control)
+        return self._timed(self.parse_batches(flatten(chunks), batch_size), stats, 1)
+
+    def _search_cmd(self, query='', filterfile=None, aggregate=None, statistics=None, statistics_order=None,limit=None, where=None):
+        cmd = self._base_cmd(where)
 
         if aggregate and statistics:
             raise NFDumpError("Specify only one of aggregate and statistics")
@@ -245,7 +1482,7 @@ class Dumper:
                 aggregate = aggregate.replace(" ","")
                 cmd.extend(["-a", "-A", self._arg_escape(aggregate)])
 
-        if limit:
+        if limit is not None:
             if statistics:
                 cmd.extend(['-n',str(limit)])
             else:
@@ -255,92 +1492,57 @@ class Dumper:
             cmd.extend(['-f', filterfile])
         else:
             cmd.append(self._arg_escape(query))
-
-        out = run(cmd)
-        if statistics:
-            return self.parse_stats(out, object_field=statistics)
-        else:
-            return self.parse_search(out)
+        return cmd
 
     def parse_search(self, out):
-        #    snprintf(data_string, STRINGSIZE-1 ,"%i|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%u|%llu|%llu",
-        #                0 af, 1 r->first, 2 r->msec_first ,3 r->last, 4 r->msec_last, 5 r->prot,
-        #                6 sa[0], 7 sa[1], 8 sa[2], 9 r->srcip, 10 r->srcport, 11 da[0], 12 da[1], 13 da[2], 14 r->dstip, 15 r->dstport,
-        #                16 r->srcas, 17 r->dstas, 18 r->input, 19 r->output,
-        #                20 r->tcp_flags, 21 r->tos, 22 (unsigned long long)r->dPkts, 23 (unsigned long long)r->dOctets);
+        """Parse nfdump -o pipe output into :class:`FlowRecord` objects"""
+        return self.parse_search_chunks(group_lines(out, PARSE_CHUNK))
+
+    def parse_search_chunks(self, chunks):
+        """Parse lists of nfdump -o pipe output lines into :class:`FlowRecord`
+        objects.  Each list is converted at once, and its records are
+        available as soon as it is read."""
+        protocols = self.protocols
+        for lines in chunks:
+            lines = [l for l in lines if is_flow_line(l)]
+            for parts in parse_pipe_lines(lines, PIPE_FIELDS):
+                yield FlowRecord(parts, protocols)
 
+    def parse_batches(self, out, batch_size=DEFAULT_BATCH_SIZE):
+        """Parse nfdump -o pipe output into :class:`FlowBatch` objects"""
+        lines = []
         for line in out:
-            parts = line.split("|")
-            parts = [int(x) for x in parts]
-            if not len(parts) > 20:
+            if not is_flow_line(line):
                 continue
-            row = {
-                'af':           parts[0],
-                'first':        fromtimestamp(parts[1]),
-                #'msec_first':   parts[2],
-                'last':         fromtimestamp(parts[3]),
-                #'msec_last':    parts[4],
-                'prot':         self.protocols.get(parts[5], parts[5]),
-                #'sa0':          parts[6],
-                #'sa1':          parts[7],
-                #'sa2':          parts[8],
-                'srcip':        IP(parts[9]),
-                'srcport':      parts[10],
-                #'da0':          parts[11],
-                #'da1':          parts[12],
-                #'da2':          parts[13],
-                'dstip':          IP(parts[14]),
-                'dstport':      parts[15],
-                'srcas':        parts[16],
-                'dstas':        parts[17],
-                'input':        parts[18],
-                'output':       parts[19],
-                'flags':        parts[20],
-                'tos':          parts[21],
-                'packets':      parts[22],
-                'bytes':        parts[23],
-            }
-            yield row
+            lines.append(line)
+            if len(lines) == batch_size:
+                yield FlowBatch.from_lines(lines, self.protocols)
+                lines = []
+        if lines:
+            yield FlowBatch.from_lines(lines, self.protocols)
 
     def parse_stats(self, out,object_field):
+        """Parse nfdump -s -o pipe output into :class:`StatRecord` objects"""
+        protocols = self.protocols
         for line in out:
             parts = line.split("|")
-            parts = [maybe_int(x) for x in parts]
-            if not len(parts) > 10:
-                #print line
+            if len(parts) not in STAT_FIELDS:
                 continue
-            if '0|0|0|0' in line:
-                object_idx = 9
-            else:
-                object_idx = 6
-            row = {
-                'af':           parts[0],
-                'first':        fromtimestamp(parts[1]),
-                #'msec_first':   parts[2],
-                'last':         fromtimestamp(parts[3]),
-                #'msec_last':    parts[4],
-                'prot':         self.protocols.get(parts[5], parts[5]),
-                object_field:   parts[object_idx],
-                'flows':        parts[object_idx+1],
-                'packets':      parts[object_idx+2],
-                'bytes':        parts[object_idx+3],
-                'pps':          parts[object_idx+4],
-                'bps':          parts[object_idx+5],
-                'bpp':          parts[object_idx+6],
-            }
-
-            if 'ip' in object_field:
-                row[object_field] = IP(row[object_field])
-
-            yield row
+            try:
+                parts = map(int, parts)
+            except ValueError:
+                parts = map(maybe_int, parts)
+            yield StatRecord(parts, object_field, protocols)
 
 
     def list_profiles(self):
         """Return a list of the nfsen profiles"""
+        catalog = self._catalog()
         if not self.remote_host:
-            return os.listdir(self.datadir)
+            return list(catalog.listdir(self.datadir))
         else:
-            return run(['ssh', self.remote_host, '/bin/ls', self.datadir])[0].split()
+            cmd = self._ssh_cmd() + ['/bin/ls', self.datadir]
+            return list(catalog.remote(('ls', self.remote_host, self.datadir), lambda: ''.join(run(cmd)).split()))
 
     def get_profile_data(self, profile=None):
         """Return a dictionary of the nfsen profile data"""
@@ -348,10 +1550,12 @@ class Dumper:
     
         path = os.path.join(self.datadir,p,'profile.dat')
     
+        catalog = self._catalog()
         if not self.remote_host:
-            data = open(path).read()
+            data = catalog.read_file(path)
         else:
-            data = run(['ssh', self.remote_host, '/bin/cat', path])[0]
+            cmd = self._ssh_cmd() + ['/bin/cat', path]
+            data = catalog.remote(('cat', self.remote_host, path), lambda: ''.join(run(cmd)))
 
         ret = {}
         sourcelist = []
@@ -371,11 +1575,95 @@ class Dumper:
 
     def flow_stats(self):
         """Run nfdump -I to get flow stats"""
+        if not self.hooks:
+            return self._flow_stats()
+        stats = QueryStats(None)
+        return stats.call(self._flow_stats, self.hooks, (stats,))
+
+    def _flow_stats(self, stats=None):
+        if self.engine == 'native':
+            return self._flow_stats_native()
         cmd = self._base_cmd()
         cmd.append("-I")
-        out = run(cmd)
+        if stats is not None:
+            stats.command = cmd
+        out = self._run(cmd, stats=stats)
         return self.parse_flow_stats(out)
 
+    def _file_stats(self, filename):
+        """Return the flow stats of a single file"""
+        if self.engine == 'native':
+            from pynfdump.nffile import file_stats
+            return file_stats(filename)
+        cmd = []
+        if self.remote_host:
+            cmd = self._ssh_cmd()
+        cmd.extend([self.exec_path, '-q', '-o', 'pipe', '-r', filename, '-I'])
+        return self.parse_flow_stats(run(cmd))
+
+    def timeseries(self, start, end, step=300, workers=4):
+        """Sum the flow stats of every file from start to end into buckets of
+        step seconds, using the rollup index.  Files that are not in the
+        index yet are read with up to workers nfdump processes at once and
+        added to it.
+
+        Returns a list of (datetime, {counter: total}) tuples, the counters
+        are the ones :func:`Dumper.flow_stats` returns, like flows, bytes_tcp
+        or packets_udp.
+        """
+        from pynfdump.rollup import to_epoch
+        from pynfdump.parallel import ordered_parallel
+        if self.rollup is None:
+            raise NFDumpError("timeseries requires a rollup index")
+        if self.remote_host or not self._source_dirs():
+            raise NFDumpError("timeseries requires a local datadir and sources")
+        if isinstance(start, basestring):
+            start = parse_date(start)
+        if isinstance(end, basestring):
+            end = parse_date(end)
+        first, last = date_to_fn(start), date_to_fn(end)
+
+        index = self.rollup
+        todo = []
+        catalog = self._catalog()
+        for source, d in zip(self.sources, self._source_dirs()):
+            known = index.known(self.profile, source)
+            for f, fn, size in catalog.files(d, first, last):
+                if f > last:
+                    continue
+                st = os.stat(fn)
+                t = to_epoch(datetime.datetime.strptime(f[7:], FILE_FMT))
+                if known.get(t) != (st.st_size, st.st_mtime):
+                    todo.append((source, t, st.st_size, st.st_mtime, fn))
+
+        funcs = [lambda fn=fn: [self._file_stats(fn)] for source, t, size, mtime, fn in todo]
+        try:
+            for (source, t, size, mtime, fn), stats in itertools.izip(todo, ordered_parallel(funcs, workers)):
+                index.add(self.profile, source, t, size, mtime, stats)
+        finally:
+            #keep the files that were done even if one failed
+            index.commit()
+        return index.timeseries(self.profile, self.sources, to_epoch(start), to_epoch(end), step)
+
+    def _flow_stats_native(self):
+        from pynfdump.nffile import file_stats
+        stats = None
+        for fn in self._native_files():
+            s = file_stats(fn)
+            if stats is None:
+                stats = s
+                continue
+            for k, v in s.items():
+                if k not in _NOT_SUMMED:
+                    stats[k] += v
+            if (s['first'], s['msec_first']) < (stats['first'], stats['msec_first']):
+                stats['first'], stats['msec_first'] = s['first'], s['msec_first']
+            if (s['last'], s['msec_last']) > (stats['last'], stats['msec_last']):
+                stats['last'], stats['msec_last'] = s['last'], s['msec_last']
+        if stats is None:
+            raise NFDumpError("No files to read")
+        return stats
+
     def parse_flow_stats(self, out):
         stats = {}
         for line in out:
@@ -397,6 +1685,18 @@ def search_file(filename, query='', filterfile=None, aggregate=None, statistics=
     d.set_where(filename=filename)
     return d.search(query, filterfile, aggregate, statistics, statistics_order, limit)
 
+def export_file(filename, fmt, columns, dest, query='', filterfile=None, header=False, extra=None):
+    """Export a single nfcapd file
+
+    :param filename: the file to export
+
+    The rest of the options are passed directly to :func:`Dumper.export`
+    """
+
+    d = Dumper()
+    d.set_where(filename=filename)
+    return d.export(fmt, columns, dest, query, filterfile, header=header, extra=extra)
+
 def flow_stats_file(filename):
     """Get flow stats for a single nfcapd file"""
     d = Dumper()
@@ -0,0 +1,293 @@
+# nffile.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+Read nfcapd files directly, without running nfdump.
+
+This understands the nfdump 1.6 file layout (LAYOUT_VERSION_1): the file
+header, the stat record and data blocks of common records with extension
+maps.  Uncompressed and bz2 compressed files are always supported, LZO and
+LZ4 compressed files need the python-lzo and lz4 modules.
+"""
+
+import os
+import bz2
+import mmap
+import struct
+
+from pynfdump.nfdump import NFDumpError, FlowRecord, AF_INET6
+
+try:
+    import lzo
+except ImportError:
+    lzo = None
+
+try:
+    import lz4.block as lz4_block
+except ImportError:
+    lz4_block = None
+
+MAGIC = 0xA50C
+LAYOUT_VERSION_1 = 1
+IDENTLEN = 128
+
+FLAG_LZO_COMPRESSED = 0x1
+FLAG_ANONYMIZED = 0x2
+FLAG_BZ2_COMPRESSED = 0x8
+FLAG_LZ4_COMPRESSED = 0x10
+
+#size of the buffer nfdump decompresses blocks into
+BUFFSIZE = 5 * 1048576
+
+DATA_BLOCK_TYPE_2 = 2
+
+#record types
+ExtensionMapType = 2
+CommonRecordType = 10
+
+#common record flags
+FLAG_IPV6_ADDR = 0x1
+FLAG_PKG_64 = 0x2
+FLAG_BYTES_64 = 0x4
+
+#extension ids
+EX_IO_SNMP_2 = 4
+EX_IO_SNMP_4 = 5
+EX_AS_2 = 6
+EX_AS_4 = 7
+
+#size in bytes of each optional extension, by id
+EXTENSION_SIZES = {
+    4: 4, 5: 8, 6: 4, 7: 8, 8: 4, 9: 4, 10: 16, 11: 4, 12: 16, 13: 4,
+    14: 4, 15: 8, 16: 4, 17: 8, 18: 4, 19: 8, 20: 16, 21: 16, 22: 40,
+    23: 4, 24: 16, 25: 4, 26: 8, 27: 8,
+}
+
+file_header = struct.Struct("<HHII%ds" % IDENTLEN)
+stat_record = struct.Struct("<15QIIHHI")
+block_header = struct.Struct("<IIHH")
+record_header = struct.Struct("<HH")
+map_header = struct.Struct("<HHHH")
+
+STAT_FIELDS = [
+    'flows', 'bytes', 'packets',
+    'flows_tcp', 'flows_udp', 'flows_icmp', 'flows_other',
+    'bytes_tcp', 'bytes_udp', 'bytes_icmp', 'bytes_other',
+    'packets_tcp', 'packets_udp', 'packets_icmp', 'packets_other',
+    'first', 'last', 'msec_first', 'msec_last', 'sequence failures',
+]
+
+#type, size, flags, ext_map, msec_first, msec_last, first, last,
+#fwd_status, tcp_flags, prot, tos, srcport, dstport, exporter_sysid,
+#biFlowDir, flowEndReason
+COMMON_HEAD = "<HHHHHHIIBBBBHHHBB"
+
+class _Layout(object):
+    """A compiled struct for one combination of extension map and flags"""
+    __slots__ = ('struct', 'v6', 'io', 'asn')
+
+    def __init__(self, ex_ids, flags):
+        fmt = [COMMON_HEAD]
+        self.v6 = bool(flags & FLAG_IPV6_ADDR)
+        fmt.append(self.v6 and "QQQQ" or "II")
+        fmt.append(flags & FLAG_PKG_64 and "Q" or "I")
+        fmt.append(flags & FLAG_BYTES_64 and "Q" or "I")
+        pos = 17 + (self.v6 and 4 or 2) + 2
+        self.io = self.asn = None
+        for ex in ex_ids:
+            if ex in (EX_IO_SNMP_2, EX_IO_SNMP_4):
+                fmt.append(ex == EX_IO_SNMP_2 and "HH" or "II")
+                self.io = pos
+                pos += 2
+            elif ex in (EX_AS_2, EX_AS_4):
+                fmt.append(ex == EX_AS_2 and "HH" or "II")
+                self.asn = pos
+                pos += 2
+            elif ex in EXTENSION_SIZES:
+                fmt.append("%dx" % EXTENSION_SIZES[ex])
+            else:
+                #the fields after it can't be located
+                raise NFDumpError("Unknown nfcapd extension %d, use the nfdump executable" % ex)
+        self.struct = struct.Struct("".join(fmt))
+
+    def parts(self, buf, offset):
+        v = self.struct.unpack_from(buf, offset)
+        if self.v6:
+            s0, s1, d0, d1, packets, bytes = v[17:23]
+            af = AF_INET6
+            src = [s0 >> 32, s0 & 0xffffffff, s1 >> 32, s1 & 0xffffffff]
+            dst = [d0 >> 32, d0 & 0xffffffff, d1 >> 32, d1 & 0xffffffff]
+        else:
+            s, d, packets, bytes = v[17:21]
+            af = 2
+            src = [0, 0, 0, s]
+            dst = [0, 0, 0, d]
+        if self.io is None:
+            input = output = 0
+        else:
+            input, output = v[self.io], v[self.io + 1]
+        if self.asn is None:
+            srcas = dstas = 0
+        else:
+            srcas, dstas = v[self.asn], v[self.asn + 1]
+        parts = [af, v[6], v[4], v[7], v[5], v[10]]
+        parts.extend(src)
+        parts.append(v[12])
+        parts.extend(dst)
+        parts.extend([v[13], srcas, dstas, input, output, v[9], v[11], packets, bytes])
+        return parts
+
+def decompress_block(data, flags):
+    """Decompress the contents of a data block"""
+    if flags & FLAG_BZ2_COMPRESSED:
+        return bz2.decompress(data)
+    if flags & FLAG_LZO_COMPRESSED:
+        if lzo is None:
+            raise NFDumpError("LZO compressed files require the python-lzo module")
+        return lzo.decompress(data, False, BUFFSIZE)
+    if flags & FLAG_LZ4_COMPRESSED:
+        if lz4_block is None:
+            raise NFDumpError("LZ4 compressed files require the lz4 module")
+        return lz4_block.decompress(data, uncompressed_size=BUFFSIZE)
+    return data
+
+def parse_header(data):
+    """Parse the file header and stat record at the start of data.
+    Returns (flags, number of blocks, ident, stats dictionary)"""
+    if len(data) < file_header.size + stat_record.size:
+        raise NFDumpError("File is too short to be a nfcapd file")
+    magic, version, flags, num_blocks, ident = file_header.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise NFDumpError("Not a nfcapd file, or written on a machine with different byte order")
+    if version != LAYOUT_VERSION_1:
+        raise NFDumpError("Unsupported nfcapd file layout version %d" % version)
+    ident = ident.split("\0", 1)[0]
+    values = stat_record.unpack_from(data, file_header.size)
+    stats = dict(zip(STAT_FIELDS, values))
+    stats['ident'] = ident
+    return flags, num_blocks, ident, stats
+
+class BlockDecoder(object):
+    """Decode the records in data blocks into :class:`FlowRecord` objects.
+    Extension maps are remembered across blocks, as nfdump does."""
+    def __init__(self, protocols=None):
+        self.protocols = protocols
+        self.maps = {}
+        self.layouts = {}
+
+    def records(self, data):
+        protocols = self.protocols
+        layouts = self.layouts
+        offset = 0
+        end = len(data)
+        while offset + record_header.size <= end:
+            rtype, size = record_header.unpack_from(data, offset)
+            if size < record_header.size:
+                raise NFDumpError("Corrupt record in nfcapd file")
+            if rtype == CommonRecordType:
+                flags, map_id = struct.unpack_from("<HH", data, offset + 4)
+                key = (map_id, flags & 7)
+                layout = layouts.get(key)
+                if layout is None:
+                    if map_id not in self.maps:
+                        raise NFDumpError("Record refers to unknown extension map %d" % map_id)
+                    layout = layouts[key] = _Layout(self.maps[map_id], flags)
+                yield FlowRecord(layout.parts(data, offset), protocols)
+            elif rtype == ExtensionMapType:
+                self._add_map(data, offset, size)
+            offset += size
+
+    def _add_map(self, data, offset, size):
+        rtype, size, map_id, ext_size = map_header.unpack_from(data, offset)
+        count = (size - map_header.size) // 2
+        ids = struct.unpack_from("<%dH" % count, data, offset + map_header.size)
+        ex_ids = []
+        for i in ids:
+            if i == 0:
+                break
+            ex_ids.append(i)
+        self.maps[map_id] = ex_ids
+        #a map id can be redefined, forget layouts built from the old one
+        for key in [k for k in self.layouts if k[0] == map_id]:
+            del self.layouts[key]
+
+class NfcapdFile(object):
+    """A memory mapped nfcapd file"""
+    def __init__(self, filename, protocols=None):
+        self.filename = filename
+        self.protocols = protocols
+        f = open(filename, 'rb')
+        try:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                raise NFDumpError("%s is empty" % filename)
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        self.flags, self.num_blocks, self.ident, self.stats = parse_header(self.data)
+
+    def close(self):
+        self.data.close()
+
+    def blocks(self):
+        """Yield the decompressed contents of each data block"""
+        data = self.data
+        offset = file_header.size + stat_record.size
+        end = len(data)
+        for i in xrange(self.num_blocks):
+            if offset + block_header.size > end:
+                raise NFDumpError("%s is truncated" % self.filename)
+            num_records, size, block_id, block_flags = block_header.unpack_from(data, offset)
+            offset += block_header.size
+            if offset + size > end:
+                raise NFDumpError("%s is truncated" % self.filename)
+            if block_id == DATA_BLOCK_TYPE_2:
+                yield decompress_block(data[offset:offset+size], self.flags)
+            offset += size
+
+    def records(self):
+        """Yield a :class:`FlowRecord` for each flow in the file"""
+        decoder = BlockDecoder(self.protocols)
+        for block in self.blocks():
+            for rec in decoder.records(block):
+                yield rec
+
+def read_stream(f, protocols=None):
+    """Yield a :class:`FlowRecord` for each flow in an nfcapd file read
+    sequentially from the file object f, like the output of nfdump -w -"""
+    head = f.read(file_header.size + stat_record.size)
+    flags, num_blocks, ident, stats = parse_header(head)
+    decoder = BlockDecoder(protocols)
+    while True:
+        h = f.read(block_header.size)
+        if len(h) < block_header.size:
+            break
+        num_records, size, block_id, block_flags = block_header.unpack(h)
+        data = f.read(size)
+        if len(data) < size:
+            raise NFDumpError("nfcapd stream is truncated")
+        if block_id == DATA_BLOCK_TYPE_2:
+            for rec in decoder.records(decompress_block(data, flags)):
+                yield rec
+
+def file_stats(filename):
+    """Return the same dictionary as :func:`pynfdump.nfdump.Dumper.flow_stats`
+    for a single file, read from its stat record"""
+    f = open(filename, 'rb')
+    try:
+        flags, num_blocks, ident, stats = parse_header(f.read(file_header.size + stat_record.size))
+    finally:
+        f.close()
+    return stats
+
+def read_files(filenames, protocols=None):
+    """Yield the flows in each of filenames, in order"""
+    for fn in filenames:
+        nf = NfcapdFile(fn, protocols)
+        try:
+            for rec in nf.records():
+                yield rec
+        finally:
+            nf.close()
@@ -0,0 +1,125 @@
+# parallel.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+Run several producers at once and consume their output in order
+"""
+
+import sys
+import threading
+from Queue import Queue, Full, Empty
+
+ITEM, DONE, ERROR = range(3)
+
+#how long a blocked worker waits before checking if it was cancelled
+POLL_INTERVAL = 0.2
+
+class _Worker(threading.Thread):
+    def __init__(self, func, queue, slots, stop):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.func = func
+        self.queue = queue
+        self.slots = slots
+        self.stop = stop
+
+    def put(self, msg):
+        while not self.stop.is_set():
+            try:
+                self.queue.put(msg, timeout=POLL_INTERVAL)
+                return True
+            except Full:
+                pass
+        return False
+
+    def run(self):
+        it = None
+        try:
+            try:
+                it = iter(self.func())
+                for item in it:
+                    if not self.put((ITEM, item)):
+                        break
+                else:
+                    self.put((DONE, None))
+            except Exception:
+                self.put((ERROR, sys.exc_info()))
+        finally:
+            if hasattr(it, 'close'):
+                it.close()
+            self.slots.release()
+
+class _Launcher(threading.Thread):
+    """Start one worker per producer, never more than slots at once"""
+    def __init__(self, workers, slots, stop):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.workers = workers
+        self.slots = slots
+        self.stop = stop
+
+    def run(self):
+        for w in self.workers:
+            self.slots.acquire()
+            if self.stop.is_set():
+                self.slots.release()
+                return
+            w.start()
+
+def ordered_parallel(funcs, workers=4, queue_size=64):
+    """Call each function in funcs in a pool of at most workers threads,
+    and yield the items from the iterables they return.
+
+    All of the items from the first function are yielded before those of the
+    second, and so on.  Each function may only run ahead of the consumer by
+    queue_size items, so memory use stays bounded.  An exception in a function
+    is raised in the consumer when its items are reached.
+
+    If the consumer stops early the remaining functions are abandoned and the
+    iterables they returned are closed.
+    """
+    stop = threading.Event()
+    slots = threading.Semaphore(max(1, workers))
+    pool = [_Worker(f, Queue(queue_size), slots, stop) for f in funcs]
+    launcher = _Launcher(pool, slots, stop)
+    launcher.start()
+    try:
+        for w in pool:
+            for item in _drain(w):
+                yield item
+    finally:
+        stop.set()
+        #wake the launcher if it is waiting for a free slot
+        slots.release()
+
+def _drain(worker):
+    """Yield the items a worker produces until it is done"""
+    while True:
+        try:
+            msg, item = worker.queue.get(timeout=POLL_INTERVAL)
+        except Empty:
+            continue
+        if msg == ITEM:
+            yield item
+        elif msg == DONE:
+            return
+        else:
+            raise item[0], item[1], item[2]
+
+def concurrent_streams(funcs, queue_size=64):
+    """Call every function in funcs at once, each in its own thread, and
+    return a list with an iterator over the items of each one and a function
+    that stops them all.
+
+    Unlike :func:`ordered_parallel` the iterators can be read in any order,
+    like with heapq.merge.  Each function may only run ahead of its iterator
+    by queue_size items.
+    """
+    stop = threading.Event()
+    slots = threading.Semaphore(len(funcs))
+    pool = [_Worker(f, Queue(queue_size), slots, stop) for f in funcs]
+    for w in pool:
+        w.start()
+    return [_drain(w) for w in pool], stop.set
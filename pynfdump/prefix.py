@@ -0,0 +1,273 @@
+# prefix.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+Longest prefix match lookups of addresses in a local routing table
+"""
+
+import socket
+import struct
+import itertools
+from bisect import bisect_right
+
+from pynfdump.nfdump import NFDumpError, FlowRecord, AF_INET6, PARSE_CHUNK
+
+try :
+    import numpy
+except ImportError:
+    numpy = None
+
+_V6_DTYPE = [('hi', '<u8'), ('lo', '<u8')]
+_ALL64 = (1 << 64) - 1
+
+def parse_prefix(text):
+    """Return (version, first, last) for an address or CIDR prefix like
+    '10.0.0.0/8' or '2001:db8::/32', the addresses as integers"""
+    if '/' in text:
+        addr, bits = text.split('/', 1)
+        bits = int(bits)
+    else:
+        addr, bits = text, None
+    try :
+        if ':' in addr:
+            hi, lo = struct.unpack("!QQ", socket.inet_pton(socket.AF_INET6, addr))
+            version, width, value = 6, 128, (hi << 64) | lo
+        else:
+            version, width, value = 4, 32, struct.unpack("!I", socket.inet_aton(addr))[0]
+    except (socket.error, struct.error):
+        raise NFDumpError("Invalid prefix %r" % text)
+    if bits is None:
+        bits = width
+    if not 0 <= bits <= width:
+        raise NFDumpError("Invalid prefix %r" % text)
+    host = (1 << (width - bits)) - 1
+    first = value & ~host
+    return version, first, first | host
+
+def _flatten(prefixes):
+    """Turn possibly nested (first, last, value) prefixes into sorted,
+    non-overlapping ranges where the most specific prefix wins"""
+    out = []
+    stack = []
+    cur = 0
+    for first, last, value in sorted(prefixes, key=lambda p: (p[0], -p[1])):
+        while stack and stack[-1][0] < first:
+            end, v = stack.pop()
+            if cur <= end:
+                out.append((cur, end, v))
+                cur = end + 1
+        if stack and cur < first:
+            out.append((cur, first - 1, stack[-1][1]))
+        cur = first
+        stack.append((last, value))
+    while stack:
+        end, v = stack.pop()
+        if cur <= end:
+            out.append((cur, end, v))
+            cur = end + 1
+    return out
+
+class PrefixTable(object):
+    """A table of IPv4 and IPv6 prefixes, each with a value like a
+    dictionary of asn, cc and owner.  Looking up an address returns the value
+    of the longest prefix that contains it.
+
+    The prefixes are stored as sorted arrays of non-overlapping ranges and
+    searched with numpy, or with bisect when numpy is not installed::
+
+        >>> t = PrefixTable.load("/var/lib/pfx2as.txt", fields=['asn'])
+        >>> t.find('169.226.1.1')
+        {'asn': '3112', 'prefix': '169.226.0.0/16'}
+        >>> for r in t.annotate(d.search('proto tcp'), 'srcip', ['asn'], prefix='src'):
+        ...     print r['srcip'], r['srcasn']
+
+    A table can be used as the backend of a :class:`pynfdump.enrich.Enricher`.
+    """
+    def __init__(self):
+        self.values = []
+        self._prefixes = {4: [], 6: []}
+        self._built = False
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, prefix, value):
+        """Add a prefix like '10.0.0.0/8' with any value"""
+        version, first, last = parse_prefix(prefix)
+        self._prefixes[version].append((first, last, len(self.values)))
+        self.values.append(value)
+        self._built = False
+
+    @classmethod
+    def load(cls, filename, fields=('asn',), sep=None):
+        """Load a table from a text file.
+
+        Each line has a prefix followed by the values of fields, separated
+        by sep or whitespace.  The prefix is either in CIDR notation or an
+        address followed by the prefix length, like the RouteViews pfx2as
+        files.  Blank lines and lines starting with # are skipped.  Each
+        value is a dictionary of fields and 'prefix'.
+        """
+        t = cls()
+        f = open(filename)
+        try:
+            for n, line in enumerate(f):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                cols = [c.strip() for c in line.split(sep)]
+                prefix = cols.pop(0)
+                if '/' not in prefix:
+                    if not cols:
+                        raise NFDumpError("%s:%d: missing prefix length" % (filename, n + 1))
+                    prefix = "%s/%s" % (prefix, cols.pop(0))
+                value = dict(zip(fields, cols))
+                value['prefix'] = prefix
+                t.add(prefix, value)
+        finally:
+            f.close()
+        return t
+
+    def build(self):
+        """Build the lookup arrays, done automatically by the first lookup
+        after prefixes are added"""
+        if self._built:
+            return
+        v4 = _flatten(self._prefixes[4])
+        v6 = _flatten(self._prefixes[6])
+        if numpy is not None:
+            self._v4 = (numpy.array([r[0] for r in v4], dtype=numpy.uint64),
+                        numpy.array([r[1] for r in v4], dtype=numpy.uint64),
+                        numpy.array([r[2] for r in v4], dtype=numpy.int64))
+            self._v6 = (numpy.array([(r[0] >> 64, r[0] & _ALL64) for r in v6], dtype=_V6_DTYPE),
+                        numpy.array([(r[1] >> 64, r[1] & _ALL64) for r in v6], dtype=_V6_DTYPE),
+                        numpy.array([r[2] for r in v6], dtype=numpy.int64))
+        self._lists = {
+            4: ([r[0] for r in v4], [r[1] for r in v4], [r[2] for r in v4]),
+            6: ([r[0] for r in v6], [r[1] for r in v6], [r[2] for r in v6]),
+        }
+        self._built = True
+
+    def _index(self, version, addr):
+        self.build()
+        firsts, lasts, values = self._lists[version]
+        i = bisect_right(firsts, addr) - 1
+        if i >= 0 and addr <= lasts[i]:
+            return values[i]
+        return -1
+
+    def _search(self, table, keys):
+        firsts, lasts, values = table
+        if not len(firsts):
+            return numpy.zeros(len(keys), dtype=numpy.int64) - 1
+        i = numpy.searchsorted(firsts, keys, 'right') - 1
+        found = i >= 0
+        i[~found] = 0
+        last = lasts[i]
+        if keys.dtype.names:
+            #structured arrays sort by field, but can't be compared with <=
+            found &= (keys['hi'] < last['hi']) | ((keys['hi'] == last['hi']) & (keys['lo'] <= last['lo']))
+        else:
+            found &= keys <= last
+        return numpy.where(found, values[i], -1)
+
+    def indexes(self, af, hi, lo):
+        """Look up addresses stored as numpy arrays like the columns of a
+        :class:`pynfdump.nfdump.FlowBatch`, and return an array with the
+        position in ``values`` of the match for each, or -1"""
+        if numpy is None:
+            raise NFDumpError("PrefixTable.indexes requires numpy")
+        self.build()
+        v6 = numpy.asarray(af) == AF_INET6
+        lo = numpy.asarray(lo, dtype=numpy.uint64)
+        out = self._search(self._v4, lo)
+        if v6.any():
+            keys = numpy.empty(int(v6.sum()), dtype=_V6_DTYPE)
+            keys['hi'] = numpy.asarray(hi, dtype=numpy.uint64)[v6]
+            keys['lo'] = lo[v6]
+            out[v6] = self._search(self._v6, keys)
+        return out
+
+    def lookup_batch(self, batch, address='srcip'):
+        """Return the value for the srcip or dstip of every flow in a
+        :class:`pynfdump.nfdump.FlowBatch`"""
+        prefix = {'srcip': 'src', 'dstip': 'dst'}[address]
+        idx = self.indexes(batch.af, getattr(batch, prefix + '_hi'), getattr(batch, prefix + '_lo'))
+        values = self.values
+        return [values[i] if i >= 0 else None for i in idx.tolist()]
+
+    def _lookup_ints(self, addrs):
+        """Look up a list of (af, address) integer pairs"""
+        if numpy is None or len(addrs) < 16:
+            idx = [self._index(af == AF_INET6 and 6 or 4, a) for af, a in addrs]
+        else:
+            af = numpy.array([a[0] for a in addrs], dtype=numpy.uint8)
+            hi = numpy.array([a[1] >> 64 for a in addrs], dtype=numpy.uint64)
+            lo = numpy.array([a[1] & _ALL64 for a in addrs], dtype=numpy.uint64)
+            idx = self.indexes(af, hi, lo).tolist()
+        values = self.values
+        return [values[i] if i >= 0 else None for i in idx]
+
+    def find(self, ip):
+        """Return the value of the longest prefix containing the address ip,
+        or None"""
+        version, addr, last = parse_prefix(str(ip))
+        i = self._index(version, addr)
+        if i < 0:
+            return None
+        return self.values[i]
+
+    def lookup(self, ips):
+        """Return a list with the value for each address string in ips"""
+        addrs = []
+        for ip in ips:
+            version, addr, last = parse_prefix(ip)
+            addrs.append((version == 6 and AF_INET6 or 2, addr))
+        return self._lookup_ints(addrs)
+
+    def __call__(self, ips):
+        """Look up a list of addresses, returning a dictionary of address to
+        value, the interface of an :class:`pynfdump.enrich.Enricher` backend"""
+        ips = list(ips)
+        return dict(zip(ips, self.lookup(ips)))
+
+    def annotate(self, records, address='srcip', fields=None, prefix='', batch_size=PARSE_CHUNK):
+        """Add the value for an address of each record to the record, looking
+        them up a batch at a time.
+
+        :param records: :class:`FlowRecord` objects, like the results of
+            :func:`pynfdump.nfdump.Dumper.search`, or :class:`StatRecord`
+            objects of an address statistic
+        :param address: 'srcip' or 'dstip', ignored for statistics
+        :param fields: keys of the dictionary values to copy into each record,
+            or None to store the whole value under 'prefix_info'
+        :param prefix: added to the name of each field, like 'src'
+        """
+        attr = {'srcip': 'src', 'dstip': 'dst'}[address]
+        records = iter(records)
+        while True:
+            batch = list(itertools.islice(records, batch_size))
+            if not batch:
+                return
+            addrs = []
+            for r in batch:
+                if isinstance(r, FlowRecord):
+                    addrs.append((r.af, getattr(r, attr)))
+                else:
+                    addrs.append((r.af, r.raw_key))
+            for r, value in zip(batch, self._lookup_ints(addrs)):
+                if fields is None:
+                    r[prefix + 'prefix_info'] = value
+                else:
+                    for f in fields:
+                        r[prefix + f] = _field(value, f)
+                yield r
+
+def _field(value, name):
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return value.get(name)
+    return getattr(value, name, None)
@@ -0,0 +1,169 @@
+# query.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+Handles for running queries that can be cancelled or limited
+"""
+
+import time
+import threading
+
+from pynfdump.nfdump import QueryTimeout, QueryCancelled, _kill
+
+class QueryControl(object):
+    """The limits and running processes of a :class:`Query`.  It is passed
+    down to the code that runs nfdump, and kept separate from the Query so
+    the Query can be garbage collected while its records are being read"""
+    def __init__(self, timeout=None, max_rows=None, max_bytes=None):
+        self.deadline = None
+        if timeout:
+            self.deadline = time.time() + timeout
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.rows = 0
+        self.bytes = 0
+        self.cancelled = False
+        self.truncated = False
+        self.pipes = set()
+        self.lock = threading.Lock()
+
+    def attach(self, pipe):
+        self.lock.acquire()
+        try:
+            self.pipes.add(pipe)
+        finally:
+            self.lock.release()
+        if self.cancelled:
+            _kill(pipe)
+
+    def detach(self, pipe):
+        self.lock.acquire()
+        try:
+            self.pipes.discard(pipe)
+        finally:
+            self.lock.release()
+
+    def remaining(self):
+        """Seconds until the deadline, or None"""
+        if self.deadline is None:
+            return None
+        return max(0, self.deadline - time.time())
+
+    def check(self):
+        """Raise if the query was cancelled or ran out of time"""
+        if self.cancelled:
+            raise QueryCancelled("Query cancelled")
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise QueryTimeout("Query timed out")
+
+    def chunks(self, chunks):
+        """Enforce max_bytes and the deadline on lists of output lines"""
+        for lines in chunks:
+            self.check()
+            if self.max_bytes:
+                self.bytes += sum(map(len, lines))
+                if self.bytes > self.max_bytes:
+                    self.truncated = True
+                    return
+            yield lines
+
+    def checked(self, records):
+        """Check for cancellation and the deadline every 1024 records, for
+        records that are not read through :func:`QueryControl.chunks`"""
+        n = 0
+        for rec in records:
+            n += 1
+            if not n & 1023:
+                self.check()
+            yield rec
+
+    def records(self, records, size=None):
+        """Enforce max_rows on records, and stop the processes when reading
+        stops for any reason.  size returns the number of rows in a record,
+        for records that are batches of rows"""
+        it = iter(records)
+        max_rows = self.max_rows
+        n = 0
+        try:
+            for rec in it:
+                n += 1
+                if size is None:
+                    self.rows += 1
+                else:
+                    self.rows += size(rec)
+                if not n & 1023:
+                    self.check()
+                yield rec
+                if max_rows and self.rows >= max_rows:
+                    self.truncated = True
+                    break
+        except QueryCancelled:
+            pass
+        finally:
+            if hasattr(it, 'close'):
+                it.close()
+            self.kill()
+
+    def kill(self):
+        self.lock.acquire()
+        try:
+            pipes = list(self.pipes)
+        finally:
+            self.lock.release()
+        for pipe in pipes:
+            _kill(pipe)
+
+    def cancel(self):
+        self.cancelled = True
+        self.kill()
+
+class Query(object):
+    """The records of a running :func:`pynfdump.nfdump.Dumper.search`.
+
+    Iterate over it to read the records.  The nfdump processes behind it
+    are killed when it is closed, cancelled, times out, reaches max_rows or
+    max_bytes, or is garbage collected::
+
+        >>> with d.search("proto tcp", timeout=60, max_rows=10000) as q:
+        ...     for rec in q:
+        ...         print rec.srcip
+
+    When the query stops because of max_rows or max_bytes, ``truncated`` is
+    set.  :func:`Query.cancel` may be called from any thread; the consumer
+    then sees the records end.  A timeout raises
+    :class:`pynfdump.nfdump.QueryTimeout`.
+    """
+    def __init__(self, control, records, size=None):
+        self.control = control
+        self._records = control.records(records, size)
+
+    rows = property(lambda self: self.control.rows)
+    truncated = property(lambda self: self.control.truncated)
+    cancelled = property(lambda self: self.control.cancelled)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return self._records.next()
+
+    def cancel(self):
+        """Stop the query, this may be called from any thread"""
+        self.control.cancel()
+
+    def close(self):
+        """Stop the query and wait for nfdump to exit.  Call this from the
+        thread reading the records"""
+        self.control.cancelled = True
+        self._records.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
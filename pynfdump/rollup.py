@@ -0,0 +1,108 @@
+# rollup.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+A persistent index of the flow stats of each nfcapd file
+"""
+
+import calendar
+import datetime
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id      INTEGER PRIMARY KEY,
+    profile TEXT NOT NULL,
+    source  TEXT NOT NULL,
+    time    INTEGER NOT NULL,
+    size    INTEGER NOT NULL,
+    mtime   REAL NOT NULL,
+    UNIQUE (profile, source, time)
+);
+CREATE TABLE IF NOT EXISTS counters (
+    file    INTEGER NOT NULL REFERENCES files(id),
+    name    TEXT NOT NULL,
+    value   INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS counters_file ON counters(file);
+"""
+
+#flow_stats values that are not counters
+SKIP = frozenset(['ident', 'first', 'last', 'msec_first', 'msec_last'])
+
+def to_epoch(date):
+    """nfcapd file times are treated as UTC so buckets follow the wall clock"""
+    return calendar.timegm(date.timetuple())
+
+def from_epoch(t):
+    return datetime.datetime.utcfromtimestamp(t)
+
+class RollupIndex(object):
+    """Flow stats (:func:`pynfdump.nfdump.Dumper.flow_stats`) of every nfcapd
+    file, stored in a sqlite database and keyed by profile, source and file
+    time.  A file is looked at again if its size or mtime changes.
+
+    Pass one to a :class:`pynfdump.nfdump.Dumper` as rollup to use
+    :func:`pynfdump.nfdump.Dumper.timeseries`.  The index must only be used
+    from the thread that created it.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def known(self, profile, source):
+        """Return a dictionary of file time to (size, mtime) for the files
+        already in the index"""
+        cur = self.db.execute("SELECT time, size, mtime FROM files WHERE profile=? AND source=?",
+            (profile, source))
+        return dict((t, (size, mtime)) for t, size, mtime in cur)
+
+    def add(self, profile, source, time, size, mtime, stats):
+        """Store the flow stats of a file, replacing any older entry"""
+        db = self.db
+        cur = db.execute("SELECT id FROM files WHERE profile=? AND source=? AND time=?",
+            (profile, source, time))
+        row = cur.fetchone()
+        if row:
+            db.execute("DELETE FROM counters WHERE file=?", row)
+            db.execute("DELETE FROM files WHERE id=?", row)
+        cur = db.execute("INSERT INTO files (profile, source, time, size, mtime) VALUES (?,?,?,?,?)",
+            (profile, source, time, size, mtime))
+        file_id = cur.lastrowid
+        db.executemany("INSERT INTO counters (file, name, value) VALUES (?,?,?)",
+            [(file_id, k, v) for k, v in stats.items() if k not in SKIP and isinstance(v, (int, long))])
+
+    def commit(self):
+        self.db.commit()
+
+    def timeseries(self, profile, sources, start, end, step):
+        """Sum the counters of the files from start up to end into buckets
+        of step seconds.  start and end are epoch seconds.
+
+        Returns a list of (bucket start, {counter: total}) tuples, one for
+        every bucket in the range.
+        """
+        marks = ",".join("?" * len(sources))
+        cur = self.db.execute("""
+            SELECT (f.time - ?) / ? AS bucket, c.name, SUM(c.value)
+            FROM files f JOIN counters c ON c.file = f.id
+            WHERE f.profile = ? AND f.source IN (%s) AND f.time >= ? AND f.time <= ?
+            GROUP BY bucket, c.name""" % marks,
+            [start, step, profile] + list(sources) + [start, end])
+        names = set()
+        buckets = {}
+        for bucket, name, value in cur:
+            buckets.setdefault(bucket, {})[name] = value
+            names.add(name)
+        result = []
+        for i in range((end - start) // step + 1):
+            totals = dict.fromkeys(names, 0)
+            totals.update(buckets.get(i, {}))
+            result.append((from_epoch(start + i * step), totals))
+        return result
+
+    def close(self):
+        self.db.close()
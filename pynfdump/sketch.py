@@ -0,0 +1,594 @@
+# sketch.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+Approximate statistics over any number of flows in a fixed amount of memory
+"""
+
+import math
+import heapq
+import random
+import struct
+from collections import namedtuple
+
+from pynfdump.nfdump import NFDumpError
+from pynfdump.aggregate import Net, _key_part, SUM_ORDERS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_CAPACITY = 1000
+DEFAULT_WIDTH = 1 << 16
+DEFAULT_DEPTH = 4
+
+_M64 = (1 << 64) - 1
+_MIX = 0x9e3779b97f4a7c15
+
+#the group by keys each nfdump -s statistic counts a flow towards
+STAT_PARTS = {
+    'srcip':    ['srcip'],
+    'dstip':    ['dstip'],
+    'ip':       ['srcip', 'dstip'],
+    'srcport':  ['srcport'],
+    'dstport':  ['dstport'],
+    'port':     ['srcport', 'dstport'],
+    'srcas':    ['srcas'],
+    'dstas':    ['dstas'],
+    'as':       ['srcas', 'dstas'],
+    'inif':     ['input'],
+    'outif':    ['output'],
+    'proto':    ['proto'],
+}
+
+def fingerprint(values):
+    """Combine the integer column values of a key into one 64 bit number"""
+    h = 0
+    for v in values:
+        h = ((h ^ v) * _MIX) & _M64
+    return h
+
+def fingerprints(columns):
+    """:func:`fingerprint` of each row of a list of uint64 column arrays"""
+    mix = numpy.uint64(_MIX)
+    h = numpy.zeros(len(columns[0]), dtype=numpy.uint64)
+    for c in columns:
+        h = (h ^ c) * mix
+    return h
+
+def _key_values(key):
+    """The column values a key is grouped by, the inverse of from_row"""
+    if isinstance(key, Net):
+        af, addr, bits = key
+        return (af, addr >> 64, addr & _M64)
+    return (key,)
+
+class CountMinSketch(object):
+    """Estimate the total weight of any key from a depth x width table of
+    counters.  Estimates are never too low, and are too high by at most
+    ``epsilon * total`` with probability ``confidence``.
+
+    Keys are 64 bit fingerprints.  Sketches with the same width, depth and
+    seed can be merged.
+    """
+    def __init__(self, width=DEFAULT_WIDTH, depth=DEFAULT_DEPTH, seed=0):
+        if width < 2 or width & (width - 1):
+            raise NFDumpError("Count-Min width must be a power of two")
+        self.width = width
+        self.depth = depth
+        self.seed = seed
+        self.shift = 64 - int(math.log(width, 2))
+        r = random.Random(seed)
+        self.a = [r.getrandbits(64) | 1 for i in range(depth)]
+        self.b = [r.getrandbits(64) for i in range(depth)]
+        if numpy is not None:
+            self.table = numpy.zeros((depth, width), dtype=numpy.uint64)
+        else:
+            self.table = [[0] * width for i in range(depth)]
+        self.total = 0
+
+    @property
+    def epsilon(self):
+        return math.e / self.width
+
+    @property
+    def confidence(self):
+        return 1 - math.exp(-self.depth)
+
+    def error_bound(self):
+        """How much any estimate may be too high, with probability
+        confidence"""
+        return self.epsilon * self.total
+
+    def _cells(self, fp):
+        shift = self.shift
+        return [((a * fp + b) & _M64) >> shift for a, b in zip(self.a, self.b)]
+
+    def add(self, fp, weight=1):
+        for row, i in zip(self.table, self._cells(fp)):
+            row[i] += weight
+        self.total += weight
+
+    def add_many(self, fps, weights):
+        """Add numpy arrays of fingerprints and their weights"""
+        shift = numpy.uint64(self.shift)
+        weights = numpy.asarray(weights, dtype=numpy.uint64)
+        for row, a, b in zip(self.table, self.a, self.b):
+            cells = (fps * numpy.uint64(a) + numpy.uint64(b)) >> shift
+            row += numpy.bincount(cells.astype(numpy.intp), weights=weights,
+                                  minlength=self.width).astype(numpy.uint64)
+        self.total += int(weights.sum())
+
+    def estimate(self, fp):
+        return int(min(row[i] for row, i in zip(self.table, self._cells(fp))))
+
+    def merge(self, other):
+        """Add the counts of another sketch to this one"""
+        if (self.width, self.depth, self.seed) != (other.width, other.depth, other.seed):
+            raise NFDumpError("Can only merge Count-Min sketches of the same shape and seed")
+        if numpy is not None:
+            self.table += other.table
+        else:
+            for row, orow in zip(self.table, other.table):
+                for i, v in enumerate(orow):
+                    row[i] += v
+        self.total += other.total
+        return self
+
+class SpaceSaving(object):
+    """Track the heaviest keys of a stream in at most capacity counters.
+
+    Each counter holds a count, which is never lower than the true total of
+    its key, and an error, the most it can be too high.  Any key whose total
+    is more than ``total / capacity`` is always tracked.
+    """
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.counters = {}
+        self.heap = []
+        self.total = 0
+
+    def __len__(self):
+        return len(self.counters)
+
+    def _min(self):
+        """Remove stale heap entries and return the smallest (count, key)"""
+        heap = self.heap
+        counters = self.counters
+        while True:
+            count, key = heap[0]
+            c = counters.get(key)
+            if c is not None and c[0] == count:
+                return count, key
+            heapq.heappop(heap)
+
+    def add(self, key, weight=1):
+        self.total += weight
+        counters = self.counters
+        c = counters.get(key)
+        if c is not None:
+            c[0] += weight
+        elif len(counters) < self.capacity:
+            c = counters[key] = [weight, 0]
+        else:
+            count, old = self._min()
+            heapq.heappop(self.heap)
+            del counters[old]
+            c = counters[key] = [count + weight, count]
+        heapq.heappush(self.heap, (c[0], key))
+        if len(self.heap) > 4 * self.capacity:
+            self._rebuild()
+
+    def add_many(self, keys, weights, floor=0, total=None):
+        """Add the exact totals of a batch of keys at once.
+
+        :param floor: the most any key that was left out of keys weighs
+        :param total: the weight of the whole batch, if keys were left out
+        """
+        if total is None:
+            total = sum(weights)
+        counters = dict((k, (w, 0)) for k, w in zip(keys, weights))
+        return self._combine(counters, floor, total)
+
+    def _rebuild(self):
+        self.heap = [(c[0], k) for k, c in self.counters.iteritems()]
+        heapq.heapify(self.heap)
+
+    def min_count(self):
+        """The count a new key would start from"""
+        if len(self.counters) < self.capacity:
+            return 0
+        return self._min()[0]
+
+    def merge(self, other):
+        """Combine another summary into this one"""
+        return self._combine(other.counters, other.min_count(), other.total)
+
+    def _combine(self, counters, floor, total):
+        #a key missing from a full summary may have had up to its smallest
+        #count, so that is added to both its count and error
+        m = self.min_count()
+        merged = {}
+        for k in set(self.counters).union(counters):
+            c1 = self.counters.get(k, (m, m))
+            c2 = counters.get(k, (floor, floor))
+            merged[k] = [c1[0] + c2[0], c1[1] + c2[1]]
+        if len(merged) > self.capacity:
+            keep = heapq.nlargest(self.capacity, merged.iteritems(), key=lambda kc: kc[1][0])
+            merged = dict(keep)
+        self.counters = merged
+        self.total += total
+        self._rebuild()
+        return self
+
+    def top(self, n=10):
+        """Return the n largest (key, count, error) tuples"""
+        best = heapq.nlargest(n, self.counters.iteritems(), key=lambda kc: kc[1][0])
+        return [(k, c[0], c[1]) for k, c in best]
+
+HeavyHitter = namedtuple('HeavyHitter', 'key estimate error')
+
+class HeavyHitters(object):
+    """Approximate top talkers for an nfdump statistic like 'ip' or 'dstport',
+    ordered by flows, packets or bytes.
+
+    A :class:`SpaceSaving` summary finds the heaviest keys and a
+    :class:`CountMinSketch` estimates the total of any key.  Memory use only
+    depends on capacity, width and depth, not on how many keys there are.
+    Summaries built over separate files or time ranges can be merged::
+
+        >>> hh = HeavyHitters('ip', 'bytes')
+        >>> hh.update_batches(d.search_batches())
+        >>> for key, estimate, error in hh.top(10):
+        ...     print key, estimate, error
+
+    Each estimate may be too high by at most error.
+    """
+    def __init__(self, statistic, order='bytes', capacity=DEFAULT_CAPACITY, width=DEFAULT_WIDTH,
+                 depth=DEFAULT_DEPTH, seed=0):
+        if statistic not in STAT_PARTS:
+            raise NFDumpError("Unsupported statistic %r" % statistic)
+        if order not in SUM_ORDERS:
+            raise NFDumpError("Unknown statistics order %r" % order)
+        self.statistic = statistic
+        self.order = order
+        self.parts = [_key_part(p) for p in STAT_PARTS[statistic]]
+        self.summary = SpaceSaving(capacity)
+        self.sketch = CountMinSketch(width, depth, seed)
+
+    @property
+    def total(self):
+        """The sum of the weights counted, a flow counts twice for a
+        statistic like 'ip' when its two addresses differ"""
+        return self.summary.total
+
+    def _weight(self, rec):
+        if self.order == 'flows':
+            return 1
+        return getattr(rec, self.order)
+
+    def add(self, rec):
+        w = self._weight(rec)
+        seen = None
+        for p in self.parts:
+            k = p.scalar(rec)
+            if k == seen:
+                continue
+            seen = k
+            self.summary.add(k, w)
+            self.sketch.add(fingerprint(_key_values(k)), w)
+
+    def update(self, records):
+        for rec in records:
+            self.add(rec)
+
+    def add_batch(self, batch):
+        """Add every flow of a :class:`pynfdump.nfdump.FlowBatch` using numpy"""
+        if not len(batch):
+            return
+        if self.order == 'flows':
+            weights = numpy.ones(len(batch), dtype=numpy.uint64)
+        else:
+            weights = getattr(batch, self.order)
+        first = None
+        for p in self.parts:
+            cols = p.columns(batch)
+            w = weights
+            if first is None:
+                first = cols
+            else:
+                #like nfdump, a flow from a key to itself counts once
+                differ = numpy.zeros(len(batch), dtype=bool)
+                for a, b in zip(first, cols):
+                    differ |= a != b
+                cols = [c[differ] for c in cols]
+                w = weights[differ]
+                if not len(w):
+                    continue
+            rows, inverse = numpy.unique(numpy.column_stack(cols), axis=0, return_inverse=True)
+            sums = numpy.bincount(inverse, weights=w, minlength=len(rows)).astype(numpy.uint64)
+            self.sketch.add_many(fingerprints([rows[:, i] for i in range(rows.shape[1])]), sums)
+            #only the heaviest keys of the batch can matter to the summary,
+            #the rest are covered by the error of the merge
+            floor = 0
+            capacity = self.summary.capacity
+            if len(rows) > capacity:
+                order = numpy.argpartition(sums, len(rows) - capacity)
+                floor = int(sums[order[:len(rows) - capacity]].max())
+                keep = order[len(rows) - capacity:]
+                rows, sums = rows[keep], sums[keep]
+            keys = [p.from_row(r) for r in rows.tolist()]
+            self.summary.add_many(keys, [int(s) for s in sums.tolist()], floor, int(w.sum()))
+
+    def update_batches(self, batches):
+        for b in batches:
+            self.add_batch(b)
+
+    def merge(self, other):
+        """Combine the flows counted by another HeavyHitters into this one"""
+        if (self.statistic, self.order) != (other.statistic, other.order):
+            raise NFDumpError("Can only merge heavy hitters of the same statistic and order")
+        self.summary.merge(other.summary)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def estimate(self, key):
+        """Return (estimate, error) for any key, like a port number or the
+        :class:`pynfdump.aggregate.Net` of an address"""
+        c = self.summary.counters.get(key)
+        est = self.sketch.estimate(fingerprint(_key_values(key)))
+        if c is not None and c[0] <= est:
+            return c[0], c[1]
+        return est, int(math.ceil(self.sketch.error_bound()))
+
+    def top(self, n=10):
+        """Return the n heaviest keys as (key, estimate, error) tuples.  The
+        true total of each key is between estimate - error and estimate."""
+        result = []
+        for key, count, error in self.summary.top(n):
+            est = min(count, self.sketch.estimate(fingerprint(_key_values(key))))
+            result.append(HeavyHitter(key, est, max(0, est - (count - error))))
+        return result
+
+DEFAULT_PRECISION = 10
+#the bias correction constants of the HyperLogLog paper for small numbers of
+#registers, larger ones use 0.7213 / (1 + 1.079 / m)
+_SMALL_ALPHA = {16: 0.673, 32: 0.697, 64: 0.709}
+
+def _alpha(m):
+    if m in _SMALL_ALPHA:
+        return _SMALL_ALPHA[m]
+    return 0.7213 / (1 + 1.079 / m)
+
+def _mix(h):
+    """Spread the bits of a fingerprint so the low bits are as random as the
+    high ones"""
+    h ^= h >> 31
+    h = (h * 0xbf58476d1ce4e5b9) & _M64
+    return h ^ (h >> 29)
+
+def _mix_array(h):
+    h = h ^ (h >> numpy.uint64(31))
+    h = h * numpy.uint64(0xbf58476d1ce4e5b9)
+    return h ^ (h >> numpy.uint64(29))
+
+def _ranks(h, precision):
+    """Split mixed fingerprints into register indexes and ranks"""
+    q = 64 - precision
+    idx = (h >> numpy.uint64(q)).astype(numpy.intp)
+    x = h & numpy.uint64((1 << q) - 1)
+    #floor(log2(x)) a bit at a time, floats would round near powers of two
+    top = numpy.zeros(len(h), dtype=numpy.int64)
+    for s in (32, 16, 8, 4, 2, 1):
+        big = x >= numpy.uint64(1 << s)
+        top += big * s
+        x = numpy.where(big, x >> numpy.uint64(s), x)
+    rank = numpy.where(h & numpy.uint64((1 << q) - 1), q - top, q + 1)
+    return idx, rank.astype(numpy.uint8)
+
+class HyperLogLog(object):
+    """Estimate the number of distinct values added, within about
+    ``1.04 / sqrt(2 ** precision)``, in 2 ** precision bytes.
+
+    Small sets are stored sparsely until they would need more memory than
+    the full registers.  Sketches of the same precision can be merged and
+    are saved with :func:`to_bytes`.
+    """
+    def __init__(self, precision=DEFAULT_PRECISION):
+        if not 4 <= precision <= 16:
+            raise NFDumpError("HyperLogLog precision must be from 4 to 16")
+        self.precision = precision
+        self.m = 1 << precision
+        self.sparse = {}
+        self.registers = None
+
+    def _densify(self):
+        self.registers = bytearray(self.m)
+        for i, r in self.sparse.iteritems():
+            self.registers[i] = r
+        self.sparse = None
+
+    def _set(self, i, rank):
+        if self.registers is not None:
+            if rank > self.registers[i]:
+                self.registers[i] = rank
+            return
+        if rank > self.sparse.get(i, 0):
+            self.sparse[i] = rank
+            if len(self.sparse) > self.m // 32:
+                self._densify()
+
+    def add(self, fp):
+        """Add a value by its 64 bit :func:`fingerprint`"""
+        h = _mix(fp)
+        q = 64 - self.precision
+        rest = h & ((1 << q) - 1)
+        self._set(h >> q, q - rest.bit_length() + 1)
+
+    def add_ranks(self, idx, ranks):
+        """Set registers from numpy arrays of indexes and ranks"""
+        if self.registers is None and len(self.sparse) + len(idx) > self.m // 32:
+            self._densify()
+        if self.registers is not None:
+            numpy.maximum.at(numpy.frombuffer(self.registers, dtype=numpy.uint8), idx, ranks)
+        else:
+            for i, r in zip(idx.tolist(), ranks.tolist()):
+                self._set(i, r)
+
+    def add_many(self, fps):
+        """Add a numpy array of fingerprints"""
+        idx, ranks = _ranks(_mix_array(fps), self.precision)
+        self.add_ranks(idx, ranks)
+
+    def merge(self, other):
+        if self.precision != other.precision:
+            raise NFDumpError("Can only merge HyperLogLogs of the same precision")
+        if other.registers is None:
+            for i, r in other.sparse.iteritems():
+                self._set(i, r)
+            return self
+        if self.registers is None:
+            self._densify()
+        if numpy is not None:
+            mine = numpy.frombuffer(self.registers, dtype=numpy.uint8)
+            numpy.maximum(mine, numpy.frombuffer(other.registers, dtype=numpy.uint8), mine)
+        else:
+            self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def __len__(self):
+        return int(round(self.estimate()))
+
+    def estimate(self):
+        m = self.m
+        if self.registers is None:
+            values = self.sparse.values()
+            zeros = m - len(values)
+        else:
+            values = self.registers
+            zeros = values.count('\0')
+        s = zeros + sum(2.0 ** -r for r in values if r)
+        e = _alpha(m) * m * m / s
+        if e <= 2.5 * m and zeros:
+            #linear counting is more accurate for small sets
+            e = m * math.log(float(m) / zeros)
+        return e
+
+    def to_bytes(self):
+        """Serialize the sketch, see :func:`HyperLogLog.from_bytes`"""
+        if self.registers is None:
+            items = sorted(self.sparse.iteritems())
+            return struct.pack("!BB", self.precision, 0) + "".join(struct.pack("!HB", i, r) for i, r in items)
+        return struct.pack("!BB", self.precision, 1) + str(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data):
+        precision, dense = struct.unpack("!BB", data[:2])
+        h = cls(precision)
+        if dense:
+            h._densify()
+            h.registers[:] = data[2:]
+        else:
+            for o in range(2, len(data), 3):
+                i, r = struct.unpack("!HB", data[o:o+3])
+                h.sparse[i] = r
+        return h
+
+    def __getstate__(self):
+        return self.to_bytes()
+
+    def __setstate__(self, data):
+        self.__dict__.update(self.from_bytes(data).__dict__)
+
+class DistinctCounter(object):
+    """Count the distinct values of one field for each value of a group by
+    key, like the number of distinct destination addresses per source.
+
+    key and distinct are anything :class:`pynfdump.aggregate.GroupBy`
+    accepts, except functions::
+
+        >>> dc = DistinctCounter('srcip', 'dstip')
+        >>> dc.update_batches(d.search_batches('proto tcp'))
+        >>> dc.top(10)
+        [(Net('10.1.2.3'), 40213), ...]
+
+    Each group holds a :class:`HyperLogLog`, so a source that talks to
+    millions of addresses takes no more memory than one that talks to
+    thousands.  Counters over different files, time ranges or collectors
+    can be merged.
+    """
+    def __init__(self, key, distinct, precision=DEFAULT_PRECISION):
+        self.key = [_key_part(k) for k in isinstance(key, (list, tuple)) and key or [key]]
+        self.distinct = [_key_part(k) for k in isinstance(distinct, (list, tuple)) and distinct or [distinct]]
+        for p in self.key + self.distinct:
+            if p.columns is None:
+                raise NFDumpError("DistinctCounter can not use a function as a key")
+        self.is_tuple = isinstance(key, (list, tuple))
+        self.precision = precision
+        self.groups = {}
+
+    def _group(self, k):
+        h = self.groups.get(k)
+        if h is None:
+            h = self.groups[k] = HyperLogLog(self.precision)
+        return h
+
+    def add(self, rec):
+        key = [p.scalar(rec) for p in self.key]
+        key = self.is_tuple and tuple(key) or key[0]
+        values = []
+        for p in self.distinct:
+            values.extend(_key_values(p.scalar(rec)))
+        self._group(key).add(fingerprint(values))
+
+    def update(self, records):
+        for rec in records:
+            self.add(rec)
+
+    def add_batch(self, batch):
+        """Add every flow of a :class:`pynfdump.nfdump.FlowBatch` using numpy"""
+        if not len(batch):
+            return
+        cols = []
+        for p in self.key:
+            cols.extend(p.columns(batch))
+        values = []
+        for p in self.distinct:
+            values.extend(p.columns(batch))
+        rows, inverse = numpy.unique(numpy.column_stack(cols), axis=0, return_inverse=True)
+        idx, ranks = _ranks(_mix_array(fingerprints(values)), self.precision)
+        order = numpy.argsort(inverse, kind='mergesort')
+        bounds = numpy.searchsorted(inverse[order], numpy.arange(len(rows) + 1))
+        for g, row in enumerate(rows.tolist()):
+            key = []
+            i = 0
+            for p in self.key:
+                key.append(p.from_row(row[i:i+p.width]))
+                i += p.width
+            key = self.is_tuple and tuple(key) or key[0]
+            sel = order[bounds[g]:bounds[g+1]]
+            self._group(key).add_ranks(idx[sel], ranks[sel])
+
+    def update_batches(self, batches):
+        for b in batches:
+            self.add_batch(b)
+
+    def merge(self, other):
+        for k, h in other.groups.iteritems():
+            self._group(k).merge(h)
+        return self
+
+    def estimate(self, key):
+        h = self.groups.get(key)
+        if h is None:
+            return 0
+        return len(h)
+
+    def top(self, n=10):
+        """Return the n (key, distinct count) pairs with the most distinct
+        values"""
+        counts = ((k, len(h)) for k, h in self.groups.iteritems())
+        return heapq.nlargest(n, counts, key=lambda kc: kc[1])
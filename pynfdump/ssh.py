@@ -0,0 +1,152 @@
+# ssh.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+Reuse ssh connections to remote hosts
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+from subprocess import call
+
+#seconds an unused master connection stays open
+DEFAULT_IDLE_TIMEOUT = 300
+#seconds between health checks of a master connection
+DEFAULT_CHECK_INTERVAL = 30
+#seconds to wait before trying again to start a master that failed
+DEFAULT_RETRY_INTERVAL = 60
+#seconds ssh may take to connect to a host
+DEFAULT_CONNECT_TIMEOUT = 10
+
+class _Master(object):
+    __slots__ = ('path', 'started', 'last_used', 'last_checked', 'retry_at', 'lock')
+
+    def __init__(self, path):
+        self.path = path
+        self.started = False
+        self.last_used = self.last_checked = self.retry_at = 0
+        self.lock = threading.Lock()
+
+class SSHPool(object):
+    """Keep persistent multiplexed ssh connections to remote hosts.
+
+    Each host gets up to size OpenSSH ControlMaster connections, queries
+    are spread over them and run as new sessions on an existing connection,
+    skipping the connection setup and authentication.  Masters are checked
+    with ``ssh -O check`` at most every check_interval seconds and restarted
+    if they died.  A master that is unused for idle_timeout seconds exits on
+    its own (ControlPersist) and is started again when it is next needed.
+
+    ssh never prompts for a password (BatchMode) and gives up connecting
+    after connect_timeout seconds.  Each master is started under its own
+    lock, so a slow host only holds up the queries waiting for that
+    connection.  When a master can't be started, queries use plain ssh
+    for retry_interval seconds before it is tried again.
+
+    :param size: number of master connections per host
+    :param idle_timeout: seconds before an unused master exits
+    :param check_interval: seconds between health checks
+    :param retry_interval: seconds before restarting a master that failed
+    :param connect_timeout: seconds ssh may take to connect
+    :param ssh: the ssh executable
+    :param socket_dir: directory for the control sockets, a private
+        temporary directory by default
+    """
+    def __init__(self, size=1, idle_timeout=DEFAULT_IDLE_TIMEOUT, check_interval=DEFAULT_CHECK_INTERVAL,
+                 ssh='ssh', socket_dir=None, retry_interval=DEFAULT_RETRY_INTERVAL,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT):
+        self.size = max(1, size)
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.retry_interval = retry_interval
+        self.connect_timeout = connect_timeout
+        self.ssh = ssh
+        self._own_dir = socket_dir is None
+        self.socket_dir = socket_dir or tempfile.mkdtemp(prefix="pynfdump-ssh-")
+        self.masters = {}
+        self.next = {}
+        self.lock = threading.Lock()
+
+    def _options(self):
+        return ['-o', 'BatchMode=yes', '-o', 'ConnectTimeout=%d' % self.connect_timeout]
+
+    def _ssh(self, host, path, *args):
+        devnull = open(os.devnull, 'r+')
+        try:
+            cmd = [self.ssh] + self._options() + ['-o', 'ControlPath=%s' % path] + list(args) + [host]
+            return call(cmd, stdin=devnull, stdout=devnull, stderr=devnull)
+        finally:
+            devnull.close()
+
+    def _start(self, host, m):
+        self._ssh(host, m.path, '-o', 'ControlMaster=yes',
+            '-o', 'ControlPersist=%d' % self.idle_timeout, '-N', '-f')
+        m.started = os.path.exists(m.path)
+        m.last_checked = time.time()
+        if not m.started:
+            m.retry_at = m.last_checked + self.retry_interval
+
+    def check(self, host, m):
+        """Return True if the master connection m to host is alive"""
+        if not os.path.exists(m.path):
+            return False
+        return self._ssh(host, m.path, '-O', 'check') == 0
+
+    def _master(self, host):
+        self.lock.acquire()
+        try:
+            masters = self.masters.get(host)
+            if masters is None:
+                safe = "".join(c.isalnum() and c or "_" for c in host)
+                masters = [_Master(os.path.join(self.socket_dir, "%s-%d" % (safe, i))) for i in range(self.size)]
+                self.masters[host] = masters
+                self.next[host] = 0
+            idx = self.next[host]
+            self.next[host] = (idx + 1) % self.size
+            return masters[idx]
+        finally:
+            self.lock.release()
+
+    def command(self, host):
+        """Return the ssh command to run a command on host over a pooled
+        connection.  If the connection can't be established a plain ssh
+        command is returned"""
+        m = self._master(host)
+        m.lock.acquire()
+        try:
+            now = time.time()
+            idle = now - m.last_used > self.idle_timeout
+            if not m.started or idle or now - m.last_checked > self.check_interval:
+                if m.started and self.check(host, m):
+                    m.last_checked = now
+                elif now >= m.retry_at:
+                    self._start(host, m)
+                else:
+                    m.started = False
+            m.last_used = now
+            started = m.started
+        finally:
+            m.lock.release()
+        if not started:
+            return [self.ssh] + self._options() + [host]
+        return [self.ssh] + self._options() + ['-o', 'ControlPath=%s' % m.path, '-o', 'ControlMaster=no', host]
+
+    def close(self):
+        """Shut down all master connections"""
+        self.lock.acquire()
+        try:
+            for host, masters in self.masters.items():
+                for m in masters:
+                    if m.started and os.path.exists(m.path):
+                        self._ssh(host, m.path, '-O', 'exit')
+                    m.started = False
+            self.masters = {}
+            if self._own_dir:
+                shutil.rmtree(self.socket_dir, True)
+        finally:
+            self.lock.release()
@@ -0,0 +1,83 @@
+# transport.py
+# Copyright (C) 2008 Justin Azoff JAzoff@uamail.albany.edu
+#
+# This module is released under the MIT License:
+# http://www.opensource.org/licenses/mit-license.php
+"""
+Compressed binary transfer of flows from remote hosts
+"""
+
+import zlib
+import threading
+
+#the remote command the nfdump -w - output is piped through.  gzip is
+#everywhere and -1 compresses about as fast as nfdump can scan
+COMPRESSOR = "gzip -1"
+
+#hosts that are known to handle, or not handle, the binary transport
+_supported = {}
+_lock = threading.Lock()
+
+def supported(host):
+    """Return True or False if host is known to support the binary
+    transport, or None if it hasn't been tried yet"""
+    return _supported.get(host)
+
+def set_supported(host, value):
+    _lock.acquire()
+    try:
+        _supported[host] = value
+    finally:
+        _lock.release()
+
+def forget(host=None):
+    """Try the binary transport again for host, or for every host"""
+    _lock.acquire()
+    try:
+        if host is None:
+            _supported.clear()
+        else:
+            _supported.pop(host, None)
+    finally:
+        _lock.release()
+
+class GunzipReader(object):
+    """A file object that decompresses gzip data read from an iterator of
+    byte blocks, like the output of run_chunks with split=False"""
+    def __init__(self, chunks, stats=None):
+        self.chunks = iter(chunks)
+        self.stats = stats
+        self.z = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.buf = ''
+        self.done = False
+
+    def _fill(self, size):
+        parts = [self.buf]
+        have = len(self.buf)
+        while have < size and not self.done:
+            try:
+                data = self.chunks.next()
+            except StopIteration:
+                data = self.z.flush()
+                self.done = True
+            else:
+                if self.stats is not None:
+                    self.stats.bytes_read += len(data)
+                try:
+                    data = self.z.decompress(data)
+                except zlib.error, e:
+                    from pynfdump.nfdump import NFDumpError
+                    raise NFDumpError("Bad compressed stream: %s" % e)
+            parts.append(data)
+            have += len(data)
+        self.buf = ''.join(parts)
+
+    def read(self, size):
+        if len(self.buf) < size:
+            self._fill(size)
+        data, self.buf = self.buf[:size], self.buf[size:]
+        return data
+
+    def close(self):
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
@@ -36,6 +36,9 @@ It supports running nfdump on a remote host via ssh.
     tests_require=[ "nose" ],
     extras_require = {
         'docs' : ['sphinx'],
+        'numpy' : ['numpy'],
+        'lzo' : ['python-lzo'],
+        'lz4' : ['lz4'],
     },
     scripts=glob('scripts/*'),
     test_suite='nose.collector',
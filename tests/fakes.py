@@ -0,0 +1,252 @@
+"""
+Stand ins for nfdump and ssh shared by the tests
+"""
+
+import os
+import sys
+import stat
+import time
+import struct
+import shutil
+import tempfile
+
+import pynfdump
+from pynfdump import nffile
+
+#writes synthetic flows, the number is set with FAKE_NFDUMP_ROWS
+BENCH_NFDUMP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "fake_nfdump")
+
+#a line of nfdump -o pipe output
+FLOW = "2|1235500152|664|1235500152|676|6|0|0|0|1234567890|1672|0|0|0|1122112211|80|0|0|5|7|17|0|2|80"
+
+#logs its arguments and runs the command locally
+SSH = """#!/bin/sh
+printf '%%s\\n' "$*" >> %(log)s
+shift
+exec sh -c "$*"
+"""
+
+#like SSH, but understands the options SSHPool uses.  ControlMaster=yes
+#creates the control socket, -O check and -O exit test and remove it.
+#The host "down" can't be reached and "slow" takes a second to connect.
+MASTER_SSH = """#!%(python)s
+import os, sys, time
+log = open(%(log)r, 'a')
+log.write(" ".join(sys.argv[1:]) + "\\n")
+log.close()
+args = sys.argv[1:]
+opts = {}
+op = None
+while args and args[0].startswith("-"):
+    a = args.pop(0)
+    if a == "-o":
+        k, v = args.pop(0).split("=", 1)
+        opts[k] = v
+    elif a == "-O":
+        op = args.pop(0)
+host = args.pop(0)
+path = opts.get("ControlPath")
+if host == "down":
+    sys.exit(255)
+if host == "slow":
+    time.sleep(1)
+if opts.get("ControlMaster") == "yes":
+    open(path, "w").close()
+    sys.exit(0)
+if op == "check":
+    sys.exit(not os.path.exists(path))
+if op == "exit":
+    os.unlink(path)
+    sys.exit(0)
+os.execvp("sh", ["sh", "-c", " ".join(args)])
+"""
+
+class Error(object):
+    """Output that makes the fake nfdump print message to stderr and exit"""
+    def __init__(self, message, status=255):
+        self.message = message
+        self.status = status
+
+class Fakes(object):
+    """A temporary directory holding a fake nfdump and ssh.
+
+    Every run of nfdump is logged to ``log`` and every run of ssh to
+    ``ssh_log``.  The object can be passed as the ssh_pool of a Dumper to
+    run its remote commands with the fake ssh.
+    """
+    def __init__(self, ssh=SSH):
+        self.dir = tempfile.mkdtemp()
+        self.log = self.path("log")
+        self.ssh_log = self.path("ssh.log")
+        self.ssh = self.script("ssh", ssh % {'python': sys.executable, 'log': self.ssh_log})
+        self.exe = self.path("nfdump")
+
+    def path(self, *names):
+        return os.path.join(self.dir, *names)
+
+    def write(self, name, data):
+        fn = self.path(name)
+        if not os.path.isdir(os.path.dirname(fn)):
+            os.makedirs(os.path.dirname(fn))
+        f = open(fn, 'wb')
+        f.write(data)
+        f.close()
+        return fn
+
+    def script(self, name, text):
+        fn = self.write(name, text)
+        os.chmod(fn, stat.S_IRWXU)
+        return fn
+
+    def nfdump(self, output='', cases=(), delay=None, hang=None, name='nfdump'):
+        """Write a fake nfdump and return its path.
+
+        It prints output, or the output of the first (pattern, output) pair
+        in cases whose shell pattern matches its arguments.  An output is a
+        list of lines, a string or an :class:`Error`.  delay is how long to
+        wait before printing, and hang how long to keep running afterwards,
+        with the pid in name.pid.
+        """
+        script = ['#!/bin/sh', 'printf "%%s\\n" "$*" >> %s' % self.log]
+        if hang:
+            script.append('echo $$ > %s' % self.path(name + '.pid'))
+        if delay:
+            script.append('sleep %s' % delay)
+        script.append('case "$*" in')
+        for i, (pattern, out) in enumerate(list(cases) + [('*', output)]):
+            if isinstance(out, Error):
+                action = 'echo "%s" >&2; exit %d' % (out.message, out.status)
+            else:
+                if isinstance(out, list):
+                    out = "".join(line + "\n" for line in out)
+                action = 'cat %s' % self.write("%s.%d" % (name, i), out)
+            script.append('%s) %s ;;' % (pattern, action))
+        script.append('esac')
+        if hang:
+            script.append('exec sleep %s' % hang)
+        return self.script(name, "\n".join(script) + "\n")
+
+    def command(self, host):
+        """The ssh_pool interface of a Dumper"""
+        return [self.ssh, host]
+
+    def dumper(self, *args, **kw):
+        """Return a Dumper using the fake nfdump, and the fake ssh for a
+        remote_host"""
+        kw.setdefault('executable_path', self.exe)
+        kw.setdefault('ssh_pool', self)
+        return pynfdump.Dumper(*args, **kw)
+
+    def calls(self):
+        """Return the arguments of each nfdump run"""
+        return self._read(self.log)
+
+    def ssh_calls(self):
+        """Return the arguments of each ssh run"""
+        return self._read(self.ssh_log)
+
+    def _read(self, fn):
+        if not os.path.exists(fn):
+            return []
+        return open(fn).read().splitlines()
+
+    def reset(self):
+        """Forget the logged calls"""
+        for fn in (self.log, self.ssh_log):
+            if os.path.exists(fn):
+                os.unlink(fn)
+
+    def running(self, name='nfdump', wait=3):
+        """Check if a hanging fake nfdump is still alive after up to wait
+        seconds"""
+        pid = int(open(self.path(name + '.pid')).read())
+        end = time.time() + wait
+        while time.time() < end:
+            try:
+                os.kill(pid, 0)
+            except OSError:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def cleanup(self):
+        shutil.rmtree(self.dir)
+
+class Fixture(object):
+    """One object made by factory and shared by the tests of a module.
+    Attributes are looked up on the current object::
+
+        s = Fixture(Setup)
+        setup, teardown = s.setup, s.teardown
+    """
+    def __init__(self, factory=Fakes):
+        self.factory = factory
+        self.current = None
+
+    def setup(self):
+        self.current = self.factory()
+
+    def teardown(self):
+        self.current.cleanup()
+        self.current = None
+
+    def __getattr__(self, name):
+        current = self.__dict__.get('current')
+        if current is None:
+            raise AttributeError(name)
+        return getattr(current, name)
+
+#builders for nfcapd file contents, for the native reader and the binary
+#transport
+
+def ext_map(map_id, ids):
+    ids = list(ids) + [0]
+    if len(ids) % 2:
+        ids.append(0)
+    size = 8 + 2 * len(ids)
+    return struct.pack("<HHHH%dH" % len(ids), nffile.ExtensionMapType, size, map_id, 0, *ids)
+
+def common(map_id, flags, first, last, proto, sport, dport, addrs, packets, bytes, ext=""):
+    if flags & nffile.FLAG_IPV6_ADDR:
+        addr = struct.pack("<QQQQ", *addrs)
+    else:
+        addr = struct.pack("<II", *addrs)
+    counters = struct.pack("<II", packets, bytes)
+    body = struct.pack("<HHHHIIBBBBHHHBB", flags, map_id, 100, 200, first, last,
+        0, 0x12, proto, 0, sport, dport, 0, 0, 0) + addr + counters + ext
+    return struct.pack("<HH", nffile.CommonRecordType, 4 + len(body)) + body
+
+def block(records, compress=None):
+    data = "".join(records)
+    if compress:
+        data = compress(data)
+    return struct.pack("<IIHH", len(records), len(data), nffile.DATA_BLOCK_TYPE_2, 0) + data
+
+def nfcapd(blocks, flags=0):
+    head = struct.pack("<HHII128s", nffile.MAGIC, 1, flags, len(blocks), "test")
+    stat = struct.pack("<15QIIHHI", 3, 1200, 12, 2, 1, 0, 0, 1100, 100, 0, 0,
+        10, 2, 0, 0, 1000, 1300, 5, 6, 0)
+    return head + stat + "".join(blocks)
+
+def records():
+    v4 = common(1, 0, 1000, 1010, 6, 1234, 80, (0x01020304, 0x05060708), 10, 1000,
+        struct.pack("<HHHH", 3, 4, 65001, 65002))
+    v6 = common(2, nffile.FLAG_IPV6_ADDR, 1100, 1300, 17, 53, 4000,
+        (0x20010db800000000, 1, 0x20010db800000000, 2), 2, 100)
+    return [ext_map(1, [nffile.EX_IO_SNMP_2, nffile.EX_AS_2]), ext_map(2, []), v4, v6]
+
+def check_records(recs):
+    v4, v6 = recs
+    assert str(v4['srcip']) == '1.2.3.4'
+    assert str(v4['dstip']) == '5.6.7.8'
+    assert v4.first_ms == 1000100
+    assert v4.last_ms == 1010200
+    assert (v4.srcport, v4.dstport) == (1234, 80)
+    assert (v4.input, v4.output) == (3, 4)
+    assert (v4.srcas, v4.dstas) == (65001, 65002)
+    assert v4.flags == 0x12
+    assert (v4.packets, v4.bytes) == (10, 1000)
+    assert str(v6['srcip']) == '2001:db8::1'
+    assert str(v6['dstip']) == '2001:db8::2'
+    assert v6.srcas == 0
+    assert v6.bytes == 100
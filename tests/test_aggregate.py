@@ -0,0 +1,56 @@
+import pynfdump
+from pynfdump.aggregate import drilldown, StatCounter
+
+from fakes import Fakes
+
+out = """
+2|1000|0|1010|0|6|0|0|0|1|1000|0|0|0|2|80|0|0|0|0|0|0|10|1000
+2|1000|0|1010|0|6|0|0|0|1|1001|0|0|0|3|80|0|0|0|0|0|0|10|500
+2|1000|0|1010|0|6|0|0|0|4|1002|0|0|0|2|443|0|0|0|0|0|0|1|100
+2|1000|0|1010|0|6|0|0|0|5|1003|0|0|0|6|22|0|0|0|0|0|0|1|50
+"""
+
+def parse_search(txt):
+    lines = [l.strip() for l in txt.strip().splitlines()]
+    return list(pynfdump.Dumper().parse_search(lines))
+
+def test_stat_counter():
+    c = StatCounter('ip')
+    for r in parse_search(out):
+        c.add(r)
+    top = c.top('bytes', 2)
+    assert [str(r['ip']) for r in top] == ['0.0.0.1', '0.0.0.2']
+    assert top[0].bytes == 1500
+    assert top[0].flows == 2
+    assert top[1].bytes == 1100
+
+def test_drilldown():
+    c = StatCounter('ip')
+    for r in parse_search(out):
+        c.add(r)
+    result = drilldown(parse_search(out), c.top('bytes', 2), 'ip/bytes', 'dstport/bytes', 2)
+    assert len(result) == 2
+    (ip1, ports1), (ip2, ports2) = result
+    assert str(ip1['ip']) == '0.0.0.1'
+    assert [(r['dstport'], r.bytes) for r in ports1] == [(80, 1500)]
+    assert str(ip2['ip']) == '0.0.0.2'
+    assert [(r['dstport'], r.bytes) for r in ports2] == [(80, 1000), (443, 100)]
+
+def test_top_n_drilldown():
+    s = Fakes()
+    try:
+        s.nfdump([l.strip() for l in out.strip().splitlines()], cases=[('*"-s ip/bytes"*', [
+            "2|1000|0|1010|0|0|0|0|0|1|2|20|1500|0|0|750",
+            "2|1000|0|1010|0|0|0|0|0|2|2|20|1100|0|0|550",
+        ])])
+        d = s.dumper()
+        d.set_where(filename="nfcapd.200903231000")
+        result = d.top_n_drilldown('ip/bytes', 'dstport/bytes', 2, 'proto tcp')
+        assert [str(ip['ip']) for ip, ports in result] == ['0.0.0.1', '0.0.0.2']
+        assert [(r['dstport'], r.bytes) for r in result[1][1]] == [(80, 1000), (443, 100)]
+        calls = s.calls()
+        assert len(calls) == 2
+        assert '-n 2' in calls[0]
+        assert calls[1].endswith('(proto tcp) and (host 0.0.0.1 or host 0.0.0.2)')
+    finally:
+        s.cleanup()
@@ -0,0 +1,113 @@
+import pynfdump
+from pynfdump.nfdump import FlowBatch, numpy
+
+from fakes import Fakes, nfcapd, block, records, check_records
+
+from nose.plugins.skip import SkipTest
+
+out = """
+2|1235500152|664|1235500152|676|6|0|0|0|1234567890|1672|0|0|0|1122112211|80|0|0|5|7|17|0|2|80
+2|1235500152|664|1235500152|844|6|0|0|0|1234567890|1729|0|0|0|1321321321|80|0|0|5|7|27|0|6|2640
+2|1235500152|668|1235500153|32|6|0|0|0|1231231231|80|0|0|0|1234567890|1726|0|0|7|5|27|0|7|5774
+10|1235500153|0|1235500154|0|17|536939960|0|0|1|53|536939960|0|0|2|4000|0|0|0|0|0|0|1|100
+"""
+
+def parse_batches(txt, batch_size=1000):
+    if numpy is None:
+        raise SkipTest("numpy not installed")
+    lines = [l.strip() for l in txt.strip().splitlines()]
+    return list(pynfdump.Dumper().parse_batches(lines, batch_size))
+
+def test_batch_columns():
+    b, = parse_batches(out)
+    assert len(b) == 4
+    assert b.first[0] == 1235500152664
+    assert b.last[2] == 1235500153032
+    assert b.sum('bytes') == 80 + 2640 + 5774 + 100
+    assert b.sum('packets') == 16
+    assert str(b.srcip(0)) == '73.150.2.210'
+    assert str(b.dstip(3)) == '2001:db8::2'
+
+def test_batch_size():
+    batches = parse_batches(out, batch_size=3)
+    assert [len(b) for b in batches] == [3, 1]
+
+def test_batch_filter_sort():
+    b, = parse_batches(out)
+    web = b[b.dstport == 80]
+    assert len(web) == 2
+    top = b.sort('bytes', reverse=True)
+    assert top.bytes.tolist() == [5774, 2640, 100, 80]
+
+def test_batch_records():
+    b, = parse_batches(out)
+    recs = list(b.records())
+    assert str(recs[2]['srcip']) == '73.99.24.255'
+    assert recs[2]['bytes'] == 5774
+    assert str(recs[3]['srcip']) == '2001:db8::1'
+    assert recs[3]['prot'] == 'udp'
+
+#nfdump output with a blank line, a short line and a line with an extra field
+odd = out + """
+2|1235500152|664|1235500152|676|6|0|0|0|1234567890
+2|1235500152|664|1235500152|676|6|0|0|0|1234567890|1672|0|0|0|1122112211|80|0|0|5|7|17|0|2|80|9
+Summary: total flows: 4
+"""
+
+def fake_dumper(s, **kw):
+    if numpy is None:
+        raise SkipTest("numpy not installed")
+    s.nfdump(odd.splitlines())
+    d = s.dumper(**kw)
+    d.set_where(filename="nfcapd.200903231000")
+    return d
+
+def test_search_and_batches_agree():
+    s = Fakes()
+    try:
+        d = fake_dumper(s)
+        records = list(d.search())
+        batch = FlowBatch.concatenate(d.search_batches(batch_size=3))
+        assert len(records) == 4
+        assert list(batch.records()) == records
+    finally:
+        s.cleanup()
+
+def test_batches_hooks_and_limits():
+    s = Fakes()
+    try:
+        d = fake_dumper(s)
+        seen = []
+        d.add_hook(seen.append)
+        q = d.search_batches(batch_size=3, max_rows=2)
+        assert [len(b) for b in q] == [2]
+        assert q.truncated
+        assert seen[0].rows == 2
+        assert seen[0].command[0] == s.exe
+    finally:
+        s.cleanup()
+
+def test_batches_native():
+    if numpy is None:
+        raise SkipTest("numpy not installed")
+    t = Fakes()
+    try:
+        fn = t.write("nfcapd.200903231000", nfcapd([block(records())]))
+        d = pynfdump.Dumper(engine='native')
+        d.set_where(filename=fn)
+        b, = d.search_batches()
+        check_records(list(b.records()))
+    finally:
+        t.cleanup()
+
+def test_batches_sharded():
+    s = Fakes()
+    try:
+        s.nfdump(out.split())
+        d = s.dumper(s.dir, sources=['src'])
+        d.set_where("2009-03-23 10:00", "2009-03-23 12:55")
+        batches = list(d.search_batches(limit=10, workers=2))
+        assert sum(len(b) for b in batches) == 10
+        assert len(s.calls()) == 3
+    finally:
+        s.cleanup()
@@ -0,0 +1,73 @@
+import os
+import time
+import shutil
+import tempfile
+
+from pynfdump.cache import ResultCache
+
+from fakes import Fakes, FLOW
+
+class Setup(Fakes):
+    def __init__(self):
+        Fakes.__init__(self)
+        self.nfdump([FLOW])
+        old = time.time() - 3600
+        for name in ("nfcapd.200903231000", "nfcapd.200903231005", "nfcapd.200903231010"):
+            fn = self.write(os.path.join("live", "src", name), "data")
+            os.utime(fn, (old, old))
+        self.cache = ResultCache(self.path("cache"))
+
+    def dumper(self):
+        return Fakes.dumper(self, self.dir, sources=['src'], cache=self.cache)
+
+def test_cache_hit():
+    s = Setup()
+    try:
+        d = s.dumper()
+        d.set_where("2009-03-23 10:00", "2009-03-23 10:05")
+        first = list(d.search("proto tcp"))
+        second = list(d.search("proto tcp"))
+        assert len(s.calls()) == 1
+        assert first == second
+        assert s.cache.hits == 1
+
+        list(d.search("proto udp"))
+        assert len(s.calls()) == 2
+    finally:
+        s.cleanup()
+
+def test_open_range_not_cached():
+    s = Setup()
+    try:
+        d = s.dumper()
+        d.set_where("2009-03-23 10:05", "2009-03-23 10:15")
+        list(d.search())
+        list(d.search())
+        assert len(s.calls()) == 2
+    finally:
+        s.cleanup()
+
+def test_partial_read_not_cached():
+    d = tempfile.mkdtemp()
+    try:
+        c = ResultCache(d)
+        chunks = c._store_chunks("key", iter([["a\n"], ["b\n"]]))
+        chunks.next()
+        chunks.close()
+        assert c.entries() == []
+        assert os.listdir(d) == []
+    finally:
+        shutil.rmtree(d)
+
+def test_evict():
+    d = tempfile.mkdtemp()
+    try:
+        c = ResultCache(d, max_size=10)
+        for i, name in enumerate("abc"):
+            fn = os.path.join(d, name)
+            open(fn, 'w').write("12345")
+            os.utime(fn, (i, i))
+        c.evict()
+        assert sorted(os.listdir(d)) == ['b', 'c']
+    finally:
+        shutil.rmtree(d)
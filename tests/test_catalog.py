@@ -0,0 +1,111 @@
+import os
+import time
+
+from pynfdump.catalog import Catalog, layout_dirs
+
+from fakes import Fakes, Fixture, nfcapd, block, records
+
+PROFILE = """# profile.dat
+name = live
+group = .
+tstart = 1235500000
+channel = podium:+:0:0:0:0:0
+channel = campus:+:0:0:0:0:0
+"""
+
+class Setup(Fakes):
+    def __init__(self):
+        Fakes.__init__(self)
+        self.src = self.path("live", "src")
+        #nfsen layout 1, %Y/%m/%d
+        self.add("2009/03/23/nfcapd.200903232350")
+        self.add("2009/03/23/nfcapd.200903232355")
+        self.add("2009/03/24/nfcapd.200903240000")
+        self.add("2009/03/24/nfcapd.200903240005", empty=True)
+        self.add("2009/03/24/nfcapd.current.1234")
+        self.write(os.path.join("live", "profile.dat"), PROFILE)
+
+    def add(self, name, empty=False):
+        data = ""
+        if not empty:
+            data = nfcapd([block(records())])
+        self.write(os.path.join("live", "src", name), data)
+
+    def dumper(self, **kw):
+        return Fakes.dumper(self, self.dir, sources=['src'], **kw)
+
+    def remote(self, **kw):
+        return self.dumper(remote_host='collector', **kw)
+
+s = Fixture(Setup)
+setup, teardown = s.setup, s.teardown
+
+def test_layout_dirs():
+    assert layout_dirs(0, "nfcapd.200903232350", "nfcapd.200903240010") == ['']
+    assert layout_dirs(1, "nfcapd.200903232350", "nfcapd.200903240010") == ['2009/03/23', '2009/03/24']
+    assert layout_dirs(8, "nfcapd.200903232350", "nfcapd.200903240010") == ['2009-03-23/23', '2009-03-24/00']
+
+def check_files(catalog):
+    d = s.dumper(catalog=catalog)
+    d.set_where("2009-03-23 23:55", "2009-03-24 00:05")
+    files = d.files()
+    assert [f.name for f in files] == ["nfcapd.200903232355", "nfcapd.200903240000"]
+    assert [f.rows for f in files] == [3, 3]
+    assert d.estimate_rows() == 6
+    names = d._range_files(closed=True)
+    assert [os.path.basename(n) for n in names] == ["nfcapd.200903232355", "nfcapd.200903240000",
+        "nfcapd.200903240005"]
+
+def test_subdirectories():
+    check_files(None)
+    check_files(Catalog())
+    check_files(Catalog(layout=1))
+
+def test_listing_follows_mtime():
+    c = Catalog()
+    d = s.dumper(catalog=c)
+    d.set_where("2009-03-24 00:00", "2009-03-24 00:10")
+    assert len(d.files()) == 1
+    s.add("2009/03/24/nfcapd.200903240010")
+    #make sure the directory looks modified even within the same second
+    day = os.path.join(s.src, "2009/03/24")
+    st = os.stat(day)
+    os.utime(day, (st.st_atime, st.st_mtime + 5))
+    assert len(d.files()) == 2
+
+def test_profile_data():
+    c = Catalog()
+    d = s.dumper(catalog=c)
+    assert 'live' in d.list_profiles()
+    data = d.get_profile_data()
+    assert data['sourcelist'] == ['podium', 'campus']
+    assert data['tstart'] == 1235500000
+
+def test_remote_cached():
+    c = Catalog(ttl=60)
+    d = s.remote(catalog=c)
+    before = len(s.ssh_calls())
+    assert 'live' in d.list_profiles()
+    assert d.get_profile_data()['name'] == 'live'
+    assert d.list_profiles() == d.list_profiles()
+    assert len(s.ssh_calls()) == before + 2
+
+    d.set_where("2009-03-23 23:55", "2009-03-24 00:05")
+    files = d.files()
+    assert [f.name for f in files] == ["nfcapd.200903232355", "nfcapd.200903240000"]
+    assert files[0].rows is None
+    assert d.estimate_rows() is None
+    assert len(s.ssh_calls()) == before + 3
+
+def test_default_catalog():
+    d = s.remote()
+    before = len(s.ssh_calls())
+    assert d.get_profile_data()['name'] == 'live'
+    assert d.get_profile_data()['name'] == 'live'
+    assert len(s.ssh_calls()) == before + 1
+    assert s.remote().get_profile_data()['name'] == 'live'
+    assert len(s.ssh_calls()) == before + 2
+
+    d = s.dumper()
+    assert d._catalog() is d._catalog()
+    assert d._catalog().ttl > 0
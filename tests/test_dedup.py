@@ -0,0 +1,43 @@
+import pynfdump
+from pynfdump.dedup import Deduplicator
+
+def flow(first, last, src=1, dst=2, dport=80, bytes=1000, msec=0):
+    return "2|%d|%d|%d|0|6|0|0|0|%d|1234|0|0|0|%d|%d|0|0|0|0|18|0|10|%d" % (
+        first, msec, last, src, dst, dport, bytes)
+
+def parse(lines):
+    return list(pynfdump.Dumper().parse_search(lines))
+
+def test_drops_copies():
+    recs = parse([
+        flow(1000, 1010),
+        flow(1000, 1010, msec=500),     #the second router, clock slightly off
+        flow(1000, 1010, bytes=999),    #different byte count
+        flow(1000, 1010, dport=443),    #different port
+        flow(1003, 1010),               #started at a different time
+        flow(1000, 1010),               #a third router
+    ])
+    dd = Deduplicator()
+    kept = list(dd.filter(recs))
+    assert kept == [recs[0], recs[2], recs[3], recs[4]]
+    assert dd.seen == 6
+    assert dd.dropped == 2
+
+def test_window_expires():
+    dd = Deduplicator(window=60)
+    lines = [flow(1000, 1010)] + [flow(t, t + 1, src=t) for t in range(1001, 1100)] + [flow(1000, 1010)]
+    kept = list(dd.filter(parse(lines)))
+    #the copy arrived after the original left the window
+    assert len(kept) == 101
+    assert dd.dropped == 0
+    assert len(dd) == 61
+
+def test_max_entries():
+    dd = Deduplicator(max_entries=10)
+    lines = [flow(1000 + i, 1010 + i, src=i) for i in range(100)]
+    kept = list(dd.filter(parse(lines + lines[-5:])))
+    assert len(kept) == 100
+    assert dd.dropped == 5
+    assert dd.evicted == 90
+    assert len(dd) == 10
+    assert sum(len(t) for t in dd.recent.values()) == 10
@@ -0,0 +1,54 @@
+import time
+from StringIO import StringIO
+
+from pynfdump.enrich import LRUCache, Enricher, StubBackend
+from pynfdump.export import export_chunks
+
+LINES = [
+    "2|1235500152|664|1235500152|676|6|0|0|0|1234567890|1672|0|0|0|1122112211|80|0|0|5|7|17|0|2|80\n",
+    "2|1235500152|664|1235500152|844|6|0|0|0|1234567890|1729|0|0|0|1321321321|80|0|0|5|7|27|0|6|2640\n",
+    "2|1235500152|668|1235500153|32|6|0|0|0|1231231231|80|0|0|0|1234567890|1726|0|0|7|5|27|0|7|5774\n",
+]
+
+TABLE = {
+    '73.150.2.210': {'asn': 1234, 'cc': 'US'},
+    '73.99.24.255': {'asn': 5678, 'cc': 'CA'},
+}
+
+def test_lru_evicts_oldest():
+    c = LRUCache(max_size=2)
+    c.put_many({'a': 1})
+    c.put_many({'b': 2})
+    assert c.get_many(['a']) == {'a': 1}
+    c.put_many({'c': 3})
+    assert c.get_many(['a', 'b', 'c']) == {'a': 1, 'c': 3}
+
+def test_lru_ttl():
+    c = LRUCache(ttl=1)
+    c.put_many({'a': 1})
+    c.data['a'] = (1, time.time() - 1)
+    assert c.get_many(['a']) == {}
+
+def test_one_lookup_per_batch():
+    backend = StubBackend(TABLE)
+    e = Enricher(backend)
+    f = StringIO()
+    extra = e.columns([LINES[:2], LINES[2:]], ['asn', 'cc'])
+    export_chunks([LINES], 'csv', ['srcip', 'asn', 'cc'], f, extra=extra)
+    assert f.getvalue().splitlines() == [
+        '73.150.2.210,1234,US',
+        '73.150.2.210,1234,US',
+        '73.99.24.255,5678,CA',
+    ]
+    assert backend.calls == [['73.150.2.210', '73.99.24.255']]
+
+    #a second file only looks up what isn't cached
+    e.columns([LINES[:1]], ['asn'])
+    assert len(backend.calls) == 1
+
+def test_unknown_address():
+    e = Enricher(StubBackend({}))
+    f = StringIO()
+    extra = e.columns([LINES[:1]], ['asn'])
+    export_chunks([LINES[:1]], 'csv', ['srcip', 'asn'], f, extra=extra)
+    assert f.getvalue() == '73.150.2.210,\r\n'
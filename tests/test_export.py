@@ -0,0 +1,80 @@
+import os
+import csv
+from StringIO import StringIO
+
+import pynfdump
+from pynfdump.export import export_chunks, render_file, srcip, DEFAULT_COLUMNS
+from pynfdump.enrich import Enricher, StubBackend
+
+from fakes import Fakes
+
+OUT = """
+2|1235500152|664|1235500152|676|6|0|0|0|1234567890|1672|0|0|0|1122112211|80|0|0|5|7|17|0|2|80
+2|1235500152|664|1235500152|844|6|0|0|0|1234567890|1729|0|0|0|1321321321|80|0|0|5|7|27|0|6|2640
+10|1235500153|0|1235500154|0|17|536939960|0|0|1|53|536939960|0|0|2|4000|0|0|0|0|0|0|1|100
+"""
+
+def lines():
+    return [l.strip() + "\n" for l in OUT.strip().splitlines()]
+
+def test_csv_matches_records():
+    d = pynfdump.Dumper()
+    f = StringIO()
+    count = export_chunks([lines()], 'csv', DEFAULT_COLUMNS, f, d.protocols, header=True)
+    assert count == 3
+
+    expected = StringIO()
+    w = csv.writer(expected)
+    w.writerow(DEFAULT_COLUMNS)
+    for rec in d.parse_search(lines()):
+        w.writerow([rec.get(c) for c in DEFAULT_COLUMNS])
+    assert f.getvalue() == expected.getvalue()
+
+def test_tsv():
+    f = StringIO()
+    export_chunks([lines()], 'tsv', ['srcip', 'dstport', 'bytes'], f)
+    rows = f.getvalue().splitlines()
+    assert rows[0] == '73.150.2.210\t80\t80'
+    assert rows[2] == '2001:db8::1\t4000\t100'
+
+def test_splunk():
+    f = StringIO()
+    export_chunks([lines()[:1]], 'splunk', ['first', 'srcip', 'flags'], f)
+    line = f.getvalue()
+    assert line.startswith('first="')
+    assert line.endswith(' srcip=73.150.2.210 flags=17\n')
+
+def test_extra_columns():
+    f = StringIO()
+    extra = {'asn': lambda p: len(srcip(p))}
+    export_chunks([lines()[:1]], 'csv', ['srcip', 'asn'], f, extra=extra)
+    assert f.getvalue() == '73.150.2.210,12\r\n'
+
+def test_malformed_lines_skipped():
+    f = StringIO()
+    bad = [lines()[0].rstrip("\n") + "|1\n", "Summary: total flows: 3\n"]
+    assert export_chunks([bad + lines()[:1]], 'tsv', ['srcip'], f) == 1
+    assert f.getvalue() == '73.150.2.210\n'
+
+def test_bad_column():
+    try:
+        export_chunks([lines()], 'csv', ['nope'], StringIO())
+    except pynfdump.NFDumpError:
+        pass
+    else:
+        assert False, "expected NFDumpError"
+
+def test_render_file():
+    s = Fakes()
+    path = os.environ['PATH']
+    try:
+        s.nfdump(lines())
+        os.environ['PATH'] = s.dir + os.pathsep + path
+        e = Enricher(StubBackend({'73.150.2.210': {'asn': 1234}}))
+        out, count = render_file("nfcapd.200903231000", 'csv', ['srcip', 'asn'], enricher=e)
+        assert count == 3
+        assert out.read().splitlines() == ['73.150.2.210,1234', '73.150.2.210,1234', '2001:db8::1,']
+        out.close()
+    finally:
+        os.environ['PATH'] = path
+        s.cleanup()
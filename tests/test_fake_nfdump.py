@@ -0,0 +1,28 @@
+import os
+
+import pynfdump
+
+from fakes import BENCH_NFDUMP
+
+def dumper(rows):
+    os.environ["FAKE_NFDUMP_ROWS"] = str(rows)
+    return pynfdump.Dumper(executable_path=BENCH_NFDUMP)
+
+def test_search():
+    recs = list(dumper(5000).search())
+    assert len(recs) == 5000
+    assert set(r.af for r in recs) == set([2, 10])
+    assert all(r.bytes >= r.packets for r in recs)
+
+def test_search_limit():
+    assert len(list(dumper(5000).search(limit=10))) == 10
+
+def test_statistics():
+    recs = list(dumper(5000).search(statistics='ip', statistics_order='bytes', limit=5))
+    assert len(recs) == 5
+    assert [r.bytes for r in recs] == sorted([r.bytes for r in recs], reverse=True)
+
+def test_flow_stats():
+    stats = dumper(5000).flow_stats()
+    assert stats['flows'] == 5000
+    assert stats['ident'] == 'fake'
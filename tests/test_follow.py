@@ -0,0 +1,171 @@
+import os
+import imp
+
+from pynfdump import follow
+from pynfdump.follow import Follower, Checkpoint
+
+from fakes import Fakes
+
+class Setup(Fakes):
+    def __init__(self):
+        Fakes.__init__(self)
+        self.src = self.path("src")
+        os.mkdir(self.src)
+        self.checkpoint = self.path("checkpoint")
+        self.seen = []
+
+    def add(self, name):
+        self.write(os.path.join("src", name), "")
+        #make sure the directory looks modified even within the same second
+        st = os.stat(self.src)
+        os.utime(self.src, (st.st_atime, st.st_mtime + len(self.seen) + 1))
+
+    def follower(self):
+        return Follower(self.src, lambda fn: self.seen.append(os.path.basename(fn)), self.checkpoint)
+
+def test_each_file_once():
+    s = Setup()
+    try:
+        s.add("nfcapd.200903231005")
+        s.add("nfcapd.200903231000")
+        s.add("nfcapd.current.1234")
+        f = s.follower()
+        assert f.run_once() == 2
+        assert s.seen == ["nfcapd.200903231000", "nfcapd.200903231005"]
+        assert f.run_once() == 0
+
+        s.add("nfcapd.200903231010")
+        assert f.run_once() == 1
+        assert s.seen[-1] == "nfcapd.200903231010"
+    finally:
+        s.cleanup()
+
+def test_restart_from_checkpoint():
+    s = Setup()
+    try:
+        s.add("nfcapd.200903231000")
+        s.follower().run_once()
+        s.add("nfcapd.200903231005")
+        s.follower().run_once()
+        assert s.seen == ["nfcapd.200903231000", "nfcapd.200903231005"]
+        assert Checkpoint(s.checkpoint).get(s.src) == "nfcapd.200903231005"
+    finally:
+        s.cleanup()
+
+def count_listdir(func):
+    calls = []
+    listdir = os.listdir
+    def counting(d):
+        calls.append(d)
+        return listdir(d)
+    os.listdir = counting
+    try:
+        func()
+    finally:
+        os.listdir = listdir
+    return len(calls)
+
+def test_unchanged_directory_not_listed():
+    s = Setup()
+    try:
+        s.add("nfcapd.200903231000")
+        assert count_listdir(s.follower().run_once) == 1
+        #a new Follower, like the next run from cron, trusts the checkpoint
+        assert count_listdir(s.follower().run_once) == 0
+        s.add("nfcapd.200903231005")
+        assert count_listdir(s.follower().run_once) == 1
+        assert s.seen == ["nfcapd.200903231000", "nfcapd.200903231005"]
+    finally:
+        s.cleanup()
+
+def inotify_works(d):
+    try:
+        follow._Inotify([d]).close()
+    except (OSError, AttributeError):
+        return False
+    return True
+
+def test_inotify_names():
+    s = Setup()
+    if not inotify_works(s.src):
+        s.cleanup()
+        return
+    notify = follow._Inotify([s.src])
+    try:
+        tmp = os.path.join(s.dir, "nfcapd.current.1234")
+        open(tmp, 'w').close()
+        os.rename(tmp, os.path.join(s.src, "nfcapd.200903231000"))
+        assert notify.wait(5) == {s.src: ["nfcapd.200903231000"]}
+        assert notify.wait(0) == {}
+    finally:
+        notify.close()
+        s.cleanup()
+
+def test_follow_queues_inotify_names():
+    s = Setup()
+    try:
+        s.add("nfcapd.200903231000")
+        f = s.follower()
+        f.poll_interval = 0.1
+        stops = []
+        def stop():
+            stops.append(1)
+            if len(stops) == 2:
+                s.add("nfcapd.200903231005")
+            return len(stops) > 4
+        listed = count_listdir(lambda: f.follow(stop))
+        assert s.seen == ["nfcapd.200903231000", "nfcapd.200903231005"]
+        if inotify_works(s.src):
+            assert listed == 1
+    finally:
+        s.cleanup()
+
+def test_failed_callback_retried():
+    s = Setup()
+    try:
+        s.add("nfcapd.200903231000")
+        def fail(fn):
+            raise IOError("disk full")
+        try:
+            Follower(s.src, fail, s.checkpoint).run_once()
+        except IOError:
+            pass
+        s.follower().run_once()
+        assert s.seen == ["nfcapd.200903231000"]
+    finally:
+        s.cleanup()
+
+def test_prepare_in_parallel():
+    s = Setup()
+    try:
+        names = ["nfcapd.2009032310%02d" % m for m in range(0, 60, 5)]
+        for n in names:
+            s.add(n)
+        written = []
+        f = Follower(s.src, lambda fn, r: written.append(r), s.checkpoint,
+                     prepare=lambda fn: os.path.basename(fn).upper(), workers=3)
+        assert f.run_once() == len(names)
+        assert written == [n.upper() for n in names]
+        assert Checkpoint(s.checkpoint).get(os.path.abspath(s.src)) == names[-1]
+    finally:
+        s.cleanup()
+
+def test_checkpoint_from_done_list():
+    script = os.path.join(os.path.dirname(__file__), "..", "scripts", "nfdump-csv-export-dir")
+    export_dir = imp.load_source("export_dir", script)
+    s = Setup()
+    try:
+        dst = os.path.join(s.dir, "dst")
+        os.makedirs(os.path.join(dst, "done"))
+        f = open(os.path.join(dst, "done", "all.txt"), 'w')
+        f.write("nfcapd.200903231000\nnfcapd.current.4242\nnfcapd.200903230955\n")
+        f.close()
+        checkpoint = export_dir.load_checkpoint(s.src, dst)
+        assert checkpoint.get(os.path.abspath(s.src)) == "nfcapd.200903231000"
+
+        s.add("nfcapd.200903231000")
+        s.add("nfcapd.200903231005")
+        Follower(s.src, lambda fn: s.seen.append(os.path.basename(fn)), checkpoint).run_once()
+        assert s.seen == ["nfcapd.200903231005"]
+    finally:
+        s.cleanup()
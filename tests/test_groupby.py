@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+
+import pynfdump
+from pynfdump.aggregate import GroupBy, Net, time_bucket
+from pynfdump.nfdump import FlowBatch, numpy
+
+from nose.plugins.skip import SkipTest
+
+OUT = """
+2|1235500152|664|1235500152|676|6|0|0|0|1234567890|1672|0|0|0|1122112211|80|0|0|5|7|17|0|2|80
+2|1235500152|664|1235500152|844|6|0|0|0|1234567891|1729|0|0|0|1321321321|80|0|0|5|7|27|0|6|2640
+2|1235503752|668|1235503753|32|6|0|0|0|1231231231|80|0|0|0|1234567890|1726|0|0|7|5|27|0|7|5774
+10|1235500153|0|1235500154|0|17|536939960|0|0|1|53|536939960|0|0|2|4000|0|0|0|0|0|0|1|100
+10|1235500153|0|1235500154|0|17|536939960|0|0|2|53|536939960|0|0|2|4000|0|0|0|0|0|0|3|300
+"""
+
+def lines():
+    return [l.strip() for l in OUT.strip().splitlines()]
+
+def records():
+    return list(pynfdump.Dumper().parse_search(lines()))
+
+def grouped(key, **kw):
+    g = GroupBy(key, **kw)
+    g.update(records())
+    return dict((k, (f, p, b)) for k, f, p, b in g.groups())
+
+def test_field():
+    r = grouped('dstport')
+    assert r[80] == (2, 8, 2720)
+    assert r[1726] == (1, 7, 5774)
+
+def test_cidr():
+    r = grouped('srcip/24/64')
+    nets = sorted(str(k) for k in r)
+    assert nets == ['2001:db8::/64', '73.150.2.0/24', '73.99.24.0/24']
+    assert r[Net(2, 1234567680, 24)] == (2, 8, 2720)
+    assert r[Net(10, 0x20010db8 << 96, 64)] == (2, 4, 400)
+
+def test_tuple_and_time():
+    r = grouped([time_bucket(3600), 'proto'])
+    assert r[(1235498400, 6)] == (2, 8, 2720)
+    assert r[(1235502000, 6)] == (1, 7, 5774)
+
+def test_function_key():
+    r = grouped(lambda rec: rec.bytes > 1000)
+    assert r[True] == (2, 13, 8414)
+
+def test_top():
+    g = GroupBy('dstport')
+    g.update(records())
+    top = g.top(2, 'bytes')
+    assert [k for k, f, p, b in top] == [1726, 80]
+
+def test_spill():
+    d = tempfile.mkdtemp()
+    try:
+        g = GroupBy(['srcip', 'dstport'], max_keys=1, spill_dir=d, partitions=3)
+        g.update(records())
+        g.update(records())
+        r = dict((k, (f, p, b)) for k, f, p, b in g.groups())
+        assert len(r) == 5
+        assert sum(f for f, p, b in r.values()) == 10
+        top = g.top(1, 'bytes')
+        assert top[0][3] == 2 * 5774
+        g.close()
+        assert os.listdir(d) == []
+    finally:
+        shutil.rmtree(d)
+
+def test_batch_matches_records():
+    if numpy is None:
+        raise SkipTest("numpy not installed")
+    for key in ('dstport', 'srcip/24/64', ['dstip', 'first/3600'], 'af'):
+        g = GroupBy(key)
+        assert g.vectorized
+        g.add_batch(FlowBatch.from_lines(lines()))
+        expected = GroupBy(key)
+        expected.update(records())
+        assert sorted(g.groups()) == sorted(expected.groups())
@@ -0,0 +1,164 @@
+import os
+import time
+import threading
+from StringIO import StringIO
+
+import pynfdump
+from pynfdump.instrument import QueryStats, StatsAggregator, clock
+
+from fakes import Fakes, Fixture, FLOW as LINE
+
+class Setup(Fakes):
+    def __init__(self):
+        Fakes.__init__(self)
+        self.nfdump([LINE] * 3, cases=[('*-I*', ["Flows: 10", "Packets: 20"])])
+
+    def dumper(self):
+        d = Fakes.dumper(self, self.dir)
+        d.set_where(filename="nfcapd.200903231000")
+        return d
+
+s = Fixture(Setup)
+setup, teardown = s.setup, s.teardown
+
+def test_no_hooks():
+    d = s.dumper()
+    assert len(list(d.search())) == 3
+
+def test_search_stats():
+    d = s.dumper()
+    seen = []
+    d.add_hook(seen.append)
+    records = list(d.search())
+    assert len(records) == 3
+    assert len(seen) == 1
+    st = seen[0]
+    assert st.command[0] == s.exe
+    assert st.rows == 3
+    assert st.lines_read == 3
+    assert st.bytes_read == 3 * (len(LINE) + 1)
+    assert st.exit_status == 0
+    assert st.first_byte is not None
+    assert st.wall_time >= st.first_byte
+    assert st.error is None
+
+def test_search_closed_early():
+    d = s.dumper()
+    seen = []
+    d.add_hook(seen.append)
+    records = d.search()
+    records.next()
+    records.close()
+    assert len(seen) == 1
+    assert seen[0].rows == 1
+
+def test_flow_stats():
+    d = s.dumper()
+    seen = []
+    d.add_hook(seen.append)
+    stats = d.flow_stats()
+    assert stats['flows'] == 10
+    assert seen[0].rows == 1
+    assert '-I' in seen[0].command
+
+def test_aggregator():
+    d = s.dumper()
+    agg = StatsAggregator()
+    d.add_hook(agg)
+    list(d.search())
+    list(d.search())
+    snap = agg.snapshot()
+    assert snap['queries'] == 2
+    assert snap['rows'] == 6
+    assert snap['errors'] == 0
+    assert snap['slowest_command'][0] == s.exe
+    d.remove_hook(agg)
+    list(d.search())
+    assert agg.snapshot()['queries'] == 2
+
+def test_error():
+    d = s.dumper()
+    d.exec_path = os.path.join(s.dir, "missing")
+    agg = StatsAggregator()
+    d.add_hook(agg)
+    try:
+        list(d.search())
+    except pynfdump.NFDumpError:
+        pass
+    else:
+        assert False, "expected NFDumpError"
+    assert agg.snapshot()['errors'] == 1
+
+def test_child_cpu():
+    d = s.dumper()
+    d.exec_path = s.script("busy", "#!/bin/sh\ni=0\nwhile [ $i -lt 20000 ]; do i=$((i+1)); done\n")
+    seen = []
+    d.add_hook(seen.append)
+    list(d.search())
+    assert seen[0].child_cpu > 0
+    assert seen[0].as_dict()['child_cpu'] == seen[0].child_cpu
+
+def test_killed():
+    d = s.dumper()
+    d.exec_path = s.script("killed", "#!/bin/sh\nkill -9 $$\n")
+    seen = []
+    agg = StatsAggregator()
+    d.add_hook(seen.append)
+    d.add_hook(agg)
+    try:
+        list(d.search())
+    except pynfdump.NFDumpError:
+        pass
+    assert seen[0].exit_status == -9
+    assert agg.snapshot()['errors'] == 1
+
+def test_clock_per_thread():
+    used = []
+    def idle():
+        c = clock()
+        time.sleep(0.3)
+        used.append(clock() - c)
+    t = threading.Thread(target=idle)
+    t.start()
+    end = time.time() + 0.2
+    while time.time() < end:
+        pass
+    t.join()
+    assert used[0] < 0.1
+
+def test_parse_timed_per_chunk():
+    from pynfdump import instrument
+    calls = []
+    real = instrument.clock
+    def counting():
+        calls.append(1)
+        return real()
+    d = s.dumper()
+    seen = []
+    d.add_hook(seen.append)
+    instrument.clock = counting
+    try:
+        assert len(list(d.search())) == 3
+    finally:
+        instrument.clock = real
+    #one list of lines and the end of the output, not every record
+    assert len(calls) == 4
+    assert seen[0].parse_cpu >= 0
+
+def test_export_stats():
+    d = s.dumper()
+    seen = []
+    d.add_hook(seen.append)
+    assert d.export('csv', ['srcip'], StringIO()) == 3
+    assert seen[0].rows == 3
+    assert seen[0].lines_read == 3
+    assert seen[0].command[0] == s.exe
+
+def test_heavy_hitters_stats():
+    d = s.dumper()
+    seen = []
+    d.add_hook(seen.append)
+    top = d.heavy_hitters('srcip', n=5)
+    assert len(seen) == 1
+    assert seen[0].rows == len(top)
+    assert seen[0].lines_read == 3
@@ -0,0 +1,29 @@
+from fakes import Fakes
+
+def stat_line(ip):
+    return "2|1000|0|1010|0|0|0|0|0|%d|10|20|3000|2|2400|150" % ip
+
+def test_top_n_by_interval():
+    s = Fakes()
+    try:
+        #the top talker is 0.0.0.1 in the first hour and 0.0.0.2 after that
+        s.nfdump([stat_line(2)], cases=[('*"-R nfcapd.200903231000:"*', [stat_line(1)])])
+        dumper = s.dumper(s.dir, sources=['src'])
+        seen = []
+        dumper.add_hook(seen.append)
+        result = dumper.top_n_by_interval("2009-03-23 10:00", "2009-03-23 12:55", 3600, 'ip', 'bytes', 5)
+        assert [t.hour for t, records in result] == [10, 11, 12]
+        assert [[str(r['ip']) for r in records] for t, records in result] == [['0.0.0.1'], ['0.0.0.2'], ['0.0.0.2']]
+
+        calls = sorted(s.calls())
+        assert len(calls) == 3
+        assert '-s ip/bytes' in calls[0]
+        assert '-n 5' in calls[0]
+        assert '-R nfcapd.200903231100:nfcapd.200903231159' in calls[1]
+
+        assert len(seen) == 1
+        assert len(seen[0].command) == 3
+        assert seen[0].rows == 3
+        assert seen[0].lines_read == 3
+    finally:
+        s.cleanup()
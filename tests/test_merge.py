@@ -0,0 +1,83 @@
+import pynfdump
+from pynfdump.merge import merge_stats, merge_aggregates
+from pynfdump.parallel import ordered_parallel
+
+from fakes import Fakes
+
+def parse_stats(txt, object_field):
+    lines = [l.strip() for l in txt.strip().splitlines()]
+    return list(pynfdump.Dumper().parse_stats(lines, object_field))
+
+def parse_search(txt):
+    lines = [l.strip() for l in txt.strip().splitlines()]
+    return list(pynfdump.Dumper().parse_search(lines))
+
+def test_merge_stats():
+    out = """
+    2|1000|0|1010|0|0|0|0|0|1|10|20|3000|2|2400|150
+    2|1000|0|1010|0|0|0|0|0|2|5|10|5000|1|4000|500
+    2|1010|0|1020|0|0|0|0|0|1|10|20|3000|2|2400|150
+    """
+    top = merge_stats(parse_stats(out, 'ip'), 'ip', 'bytes', 1)
+    assert len(top) == 1
+    r = top[0]
+    assert str(r['ip']) == '0.0.0.1'
+    assert r.flows == 20
+    assert r.packets == 40
+    assert r.bytes == 6000
+    assert r.pps == 2
+    assert r.bps == 2400
+    assert r.bpp == 150
+
+    top = merge_stats(parse_stats(out, 'ip'), 'ip', 'bpp', 0)
+    assert [str(r['ip']) for r in top] == ['0.0.0.2', '0.0.0.1']
+
+def test_merge_aggregates():
+    out = """
+    2|1000|5|1001|0|6|0|0|0|1|0|0|0|0|2|80|0|0|0|0|2|0|1|40
+    2|1002|0|1003|0|6|0|0|0|1|0|0|0|0|2|80|0|0|0|0|16|0|3|120
+    2|1001|0|1002|0|6|0|0|0|1|0|0|0|0|3|80|0|0|0|0|16|0|1|40
+    """
+    a, b = merge_aggregates(parse_search(out))
+    assert str(a['dstip']) == '0.0.0.2'
+    assert a.packets == 4
+    assert a.bytes == 160
+    assert a.flags == 18
+    assert a.first_ms == 1000005
+    assert a.last_ms == 1003000
+    assert str(b['dstip']) == '0.0.0.3'
+
+def test_ordered_parallel():
+    funcs = [lambda i=i: range(i * 100, i * 100 + 100) for i in range(10)]
+    assert list(ordered_parallel(funcs, 3, queue_size=5)) == range(1000)
+
+def test_ordered_parallel_error():
+    def fail():
+        yield 1
+        raise ValueError("boom")
+    try:
+        list(ordered_parallel([fail], 2))
+    except ValueError:
+        pass
+    else:
+        assert False, "ValueError not raised"
+
+def test_sharded_statistics():
+    s = Fakes()
+    try:
+        s.nfdump(["2|1000|0|1010|0|0|0|0|0|1|10|20|3000|2|2400|150",
+                  "2|1000|0|1010|0|0|0|0|0|2|5|10|5000|1|4000|500"])
+        dumper = s.dumper(s.dir, sources=['src'])
+        dumper.set_where("2009-03-23 10:00", "2009-03-23 12:55")
+        top = list(dumper.search(statistics='ip', statistics_order='bytes', limit=1, workers=2))
+        assert len(top) == 1
+        assert str(top[0]['ip']) == '0.0.0.2'
+        assert top[0].bytes == 15000
+
+        calls = sorted(s.calls())
+        assert len(calls) == 3
+        assert '-R nfcapd.200903231000:nfcapd.200903231059' in calls[0]
+        assert '-R nfcapd.200903231200:nfcapd.200903231255' in calls[2]
+        assert '-n 0' in calls[0]
+    finally:
+        s.cleanup()
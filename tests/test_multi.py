@@ -0,0 +1,80 @@
+from pynfdump.multi import MultiDumper
+from pynfdump.parallel import concurrent_streams
+
+from fakes import Fakes, Fixture
+
+def flow(first, dstip):
+    return "2|%d|0|%d|0|6|0|0|0|1|1234|0|0|0|%d|80|0|0|0|0|2|0|1|40" % (first, first + 1, dstip)
+
+def stat_line(ip, flows, packets, bytes):
+    return "2|1000|0|1010|0|0|0|0|0|%d|%d|%d|%d|0|0|0" % (ip, flows, packets, bytes)
+
+class Setup(Fakes):
+    def __init__(self):
+        Fakes.__init__(self)
+        #each host has its own nfdump printing its own flows or statistics
+        self.nfdump([flow(t, 1) for t in range(1000, 1100, 2)],
+            cases=[('*" -s "*', [stat_line(1, 10, 20, 3000), stat_line(2, 5, 10, 5000)])], name='nfdump-a')
+        self.nfdump([flow(t, 2) for t in range(1001, 1100, 2)],
+            cases=[('*" -s "*', [stat_line(1, 10, 20, 3000), stat_line(3, 1, 1, 100)])], name='nfdump-b')
+
+    def dumper(self, host):
+        return Fakes.dumper(self, executable_path=self.path('nfdump-' + host), remote_host=host)
+
+    def multi(self, hosts):
+        md = MultiDumper([self.dumper(h) for h in hosts])
+        md.set_where(filename="nfcapd.200903231000")
+        return md
+
+s = Fixture(Setup)
+setup, teardown = s.setup, s.teardown
+
+def test_concurrent_streams():
+    funcs = [lambda i=i: range(i * 100, i * 100 + 100) for i in range(3)]
+    streams, stop = concurrent_streams(funcs, queue_size=5)
+    #read them backwards, which would deadlock if they ran one at a time
+    assert [list(x) for x in reversed(streams)] == [range(200, 300), range(100, 200), range(100)]
+    stop()
+
+def test_flows_merged_in_time_order():
+    md = s.multi(['a', 'b'])
+    recs = list(md.search())
+    assert [r.first_ms for r in recs] == range(1000000, 1100000, 1000)
+    assert set(str(r['dstip']) for r in recs) == set(['0.0.0.1', '0.0.0.2'])
+    assert md.errors == {}
+
+def test_limit():
+    recs = list(s.multi(['a', 'b']).search(limit=5))
+    assert [r.first_ms / 1000 for r in recs] == [1000, 1001, 1002, 1003, 1004]
+
+def test_stats_merged():
+    top = list(s.multi(['a', 'b']).search(statistics='ip', statistics_order='bytes', limit=2))
+    assert [str(r['ip']) for r in top] == ['0.0.0.1', '0.0.0.2']
+    assert top[0].bytes == 6000
+    assert top[0].flows == 20
+
+def test_failed_host_gives_partial_results():
+    md = s.multi(['a', 'down', 'b'])
+    recs = list(md.search())
+    assert len(recs) == 100
+    assert md.errors.keys() == [1]
+
+    top = list(md.search(statistics='ip', statistics_order='bytes'))
+    assert top[0].bytes == 6000
+    assert md.errors.keys() == [1]
+
+def test_errors_per_collector():
+    #two collectors on the same host are told apart
+    md = s.multi(['a', 'down', 'down'])
+    assert len(list(md.search())) == 50
+    assert sorted(md.errors.keys()) == [1, 2]
+
+class BrokenPool(object):
+    def command(self, host):
+        raise OSError("can't create the control socket")
+
+def test_os_error_isolated():
+    md = s.multi(['a', 'b'])
+    md.dumpers[1].ssh_pool = BrokenPool()
+    assert len(list(md.search())) == 50
+    assert isinstance(md.errors[1], OSError)
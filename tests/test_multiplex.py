@@ -0,0 +1,154 @@
+import os
+import time
+
+from pynfdump.multiplex import AsyncDumper
+from pynfdump.cache import ResultCache
+from pynfdump.nfdump import NFDumpError, QueryCancelled, QueryTimeout
+
+from fakes import Fakes, Error, FLOW
+
+def make_dumper(s):
+    s.nfdump([
+        "2|1235500152|664|1235500152|676|6|0|0|0|1234567890|1672|0|0|0|1122112211|80|0|0|5|7|17|0|2|80",
+        "2|1235500152|664|1235500152|844|6|0|0|0|1234567890|1729|0|0|0|1321321321|80|0|0|5|7|27|0|6|2640",
+    ], cases=[('*fail', Error("bad filter"))], delay=0.5)
+    return s.dumper()
+
+def test_concurrent_queries():
+    s = Fakes()
+    try:
+        ad = AsyncDumper(make_dumper(s), max_concurrent=4)
+        queries = [ad.search("port %d" % i) for i in range(4)]
+        start = time.time()
+        results = ad.wait()
+        elapsed = time.time() - start
+        assert elapsed < 1.5, elapsed
+        for q in queries:
+            assert q.done
+            assert q.records == 2
+            assert [r.bytes for r in results[q]] == [80, 2640]
+    finally:
+        s.cleanup()
+
+def test_concurrency_limit():
+    s = Fakes()
+    try:
+        ad = AsyncDumper(make_dumper(s), max_concurrent=1)
+        ad.search("a")
+        ad.search("b")
+        start = time.time()
+        ad.wait()
+        assert time.time() - start >= 1.0
+    finally:
+        s.cleanup()
+
+def test_error_isolated():
+    s = Fakes()
+    try:
+        ad = AsyncDumper(make_dumper(s))
+        bad = ad.search("fail")
+        good = ad.search("ok")
+        results = ad.wait()
+        assert bad.error is not None
+        assert bad not in results
+        assert good.error is None
+        assert len(results[good]) == 2
+    finally:
+        s.cleanup()
+
+def hanging_dumper(s, remote_host=None):
+    s.nfdump([FLOW] * 5, hang=30)
+    d = s.dumper(remote_host=remote_host)
+    d.set_where(filename="nfcapd.200903231000")
+    return d
+
+def test_remote_cancel():
+    s = Fakes()
+    try:
+        ad = AsyncDumper(hanging_dumper(s, 'collector'))
+        q = ad.search()
+        for query, rec in ad.run():
+            q.cancel()
+        assert isinstance(q.error, QueryCancelled)
+        assert s.ssh_calls()
+        assert not s.running()
+    finally:
+        s.cleanup()
+
+def test_remote_close():
+    s = Fakes()
+    try:
+        ad = AsyncDumper(hanging_dumper(s, 'collector'))
+        q = ad.search()
+        results = ad.run()
+        results.next()
+        results.close()
+        assert isinstance(q.error, QueryCancelled)
+        assert not s.running()
+    finally:
+        s.cleanup()
+
+def test_max_rows():
+    s = Fakes()
+    try:
+        ad = AsyncDumper(hanging_dumper(s))
+        q = ad.search(max_rows=2)
+        assert len(ad.wait()[q]) == 2
+        assert q.truncated
+        assert q.error is None
+        assert not s.running()
+    finally:
+        s.cleanup()
+
+def test_timeout():
+    s = Fakes()
+    try:
+        ad = AsyncDumper(hanging_dumper(s))
+        q = ad.search(timeout=0.5)
+        start = time.time()
+        assert len(ad.wait()[q]) == 5
+        assert time.time() - start < 5
+        assert isinstance(q.error, QueryTimeout)
+        assert not s.running()
+    finally:
+        s.cleanup()
+
+def test_hooks_and_cache():
+    s = Fakes()
+    try:
+        s.nfdump([FLOW])
+        old = time.time() - 3600
+        fn = s.write(os.path.join("live", "src", "nfcapd.200903231000"), "data")
+        os.utime(fn, (old, old))
+        s.write(os.path.join("live", "src", "nfcapd.200903231005"), "data")
+        d = s.dumper(s.dir, sources=['src'], cache=ResultCache(s.path("cache")))
+        d.set_where("2009-03-23 10:00", "2009-03-23 10:00")
+        seen = []
+        d.add_hook(seen.append)
+        for x in range(2):
+            ad = AsyncDumper(d)
+            q = ad.search("proto tcp")
+            assert [r.bytes for r in ad.wait()[q]] == [80]
+        assert len(s.calls()) == 1
+        assert [st.cache_hit for st in seen] == [False, True]
+        assert [st.rows for st in seen] == [1, 1]
+        assert seen[0].exit_status == 0
+    finally:
+        s.cleanup()
+
+def test_unsupported_dumpers():
+    s = Fakes()
+    try:
+        ad = AsyncDumper(s.dumper())
+        for d in (s.dumper(engine='native'), s.dumper(remote_host='async-binary', transport='binary')):
+            try:
+                ad.search(dumper=d)
+            except NFDumpError:
+                pass
+            else:
+                assert False, "expected NFDumpError"
+        #statistics never use the binary transport
+        ad.search(statistics='ip', dumper=s.dumper(remote_host='async-binary', transport='binary'))
+        assert len(ad.pending) == 1
+    finally:
+        s.cleanup()
@@ -0,0 +1,71 @@
+import bz2
+import struct
+
+import pynfdump
+from pynfdump import nffile
+from pynfdump.nfdump import NFDumpError
+
+from fakes import Fakes, ext_map, common, block, nfcapd, records, check_records
+
+from nose.tools import raises
+
+def test_read_uncompressed():
+    t = Fakes()
+    try:
+        fn = t.write("nfcapd.200903231000", nfcapd([block(records())]))
+        nf = nffile.NfcapdFile(fn)
+        check_records(list(nf.records()))
+        assert nf.stats['flows'] == 3
+        assert nf.stats['ident'] == 'test'
+        nf.close()
+    finally:
+        t.cleanup()
+
+def test_read_bz2():
+    t = Fakes()
+    try:
+        data = nfcapd([block(records(), bz2.compress)], nffile.FLAG_BZ2_COMPRESSED)
+        fn = t.write("nfcapd.200903231000", data)
+        check_records(list(nffile.read_files([fn])))
+    finally:
+        t.cleanup()
+
+def test_read_stream():
+    from StringIO import StringIO
+    check_records(list(nffile.read_stream(StringIO(nfcapd([block(records())])))))
+
+def test_dumper_native_engine():
+    t = Fakes()
+    try:
+        t.write("live/src/nfcapd.200903231000", nfcapd([block(records())]))
+        t.write("live/src/nfcapd.200903231005", nfcapd([block(records())]))
+        d = pynfdump.Dumper(t.dir, sources=['src'], engine='native')
+        d.set_where("2009-03-23 10:00", "2009-03-23 10:05")
+        assert len(list(d.search())) == 4
+        top = list(d.search(statistics='dstport', statistics_order='bytes', limit=1))
+        assert top[0]['dstport'] == 80
+        assert top[0].bytes == 2000
+        stats = d.flow_stats()
+        assert stats['flows'] == 6
+        assert stats['first'] == 1000
+        assert stats['msec_first'] == 5
+    finally:
+        t.cleanup()
+
+@raises(NFDumpError)
+def test_unknown_extension():
+    from StringIO import StringIO
+    v4 = common(1, 0, 1000, 1010, 6, 1234, 80, (0x01020304, 0x05060708), 10, 1000,
+        struct.pack("<IHHHH", 0, 3, 4, 65001, 65002))
+    data = nfcapd([block([ext_map(1, [99, nffile.EX_IO_SNMP_2, nffile.EX_AS_2]), v4])])
+    list(nffile.read_stream(StringIO(data)))
+
+@raises(NFDumpError)
+def test_native_refuses_filters():
+    d = pynfdump.Dumper(engine='native')
+    d.set_where(filename="nfcapd.200903231000")
+    d.search("proto tcp")
+
+@raises(NFDumpError)
+def test_bad_magic():
+    nffile.parse_header("\0" * 400)
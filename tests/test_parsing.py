@@ -4,9 +4,9 @@ def parse_search_helper(txt):
     lines = [l.strip() for l in txt.strip().splitlines()]
     return list(pynfdump.Dumper().parse_search(lines))
 
-def parse_stats(txt):
+def parse_stats(txt, object_field):
     lines = [l.strip() for l in txt.strip().splitlines()]
-    return list(pynfdump.Dumper().parse_stats(lines))
+    return list(pynfdump.Dumper().parse_stats(lines, object_field))
 
 def parse_flow_stats(txt):
     lines = [l.strip() for l in txt.strip().splitlines()]
@@ -30,6 +30,60 @@ def test_parse_1():
             msg =  "field:%s expected:%s actual:%s" % (k, v, a[k])
             assert str(a[k]) == v, msg
 
+def test_parse_ipv6():
+    out = """
+    10|1235500153|0|1235500154|0|17|536939960|0|0|1|53|536939960|0|0|2|4000|0|0|0|0|0|0|1|100
+    """
+    r, = parse_search_helper(out)
+    assert str(r['srcip']) == '2001:db8::1'
+    assert str(r['dstip']) == '2001:db8::2'
+    assert r['prot'] == 'udp'
+    assert r.bytes == 100
+
+def test_record_extra_keys():
+    out = """
+    2|1235500152|664|1235500152|676|6|0|0|0|1234567890|1672|0|0|0|1122112211|80|0|0|5|7|17|0|2|80
+    """
+    r, = parse_search_helper(out)
+    r['asn'] = 1234
+    assert r['asn'] == 1234
+    assert r.get('cc') is None
+    assert 'asn' in r.keys()
+    assert r.first_ms == 1235500152664
+    assert "%(dstport)s %(asn)s" % r == "80 1234"
+
+def test_parse_stats():
+    out = """
+    2|1235500152|664|1235500252|676|0|0|0|0|1234567890|10|20|3000|1|240|150
+    10|1235500152|664|1235500252|676|0|536939960|0|0|1|5|6|700|0|56|116
+    """
+    v4, v6 = parse_stats(out, 'ip')
+    assert str(v4['ip']) == '73.150.2.210'
+    assert v4['flows'] == 10
+    assert v4['bytes'] == 3000
+    assert v4['bpp'] == 150
+    assert str(v6['ip']) == '2001:db8::1'
+    assert v6['packets'] == 6
+
+def test_parse_stats_port():
+    out = """
+    0|1235500152|664|1235500252|676|0|80|10|20|3000|1|240|150
+    """
+    r, = parse_stats(out, 'dstport')
+    assert r['dstport'] == 80
+    assert r.key == 80
+    assert r['flows'] == 10
+
+def test_parse_stats_proto():
+    out = """
+    0|1235500152|664|1235500252|676|0|6|10|20|3000|1|240|150
+    """
+    r, = parse_stats(out, 'proto')
+    assert r['proto'] == 6
+    assert r.proto == 6
+    assert r.key == 6
+    assert r['flows'] == 10
+
 def test_parse_flow_stats():
     output=  """Ident: podium
                 Flows: 1722928
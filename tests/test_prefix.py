@@ -0,0 +1,133 @@
+import os
+import random
+import tempfile
+
+import pynfdump
+from pynfdump import prefix
+from pynfdump.prefix import PrefixTable, parse_prefix
+from pynfdump.enrich import Enricher
+from pynfdump.nfdump import NFDumpError, FlowBatch, AF_INET6
+
+from nose.tools import raises
+
+def table():
+    t = PrefixTable()
+    t.add('10.0.0.0/8', 'ten')
+    t.add('10.1.0.0/16', 'ten-one')
+    t.add('10.1.2.0/24', 'ten-one-two')
+    t.add('10.2.0.0/16', 'ten-two')
+    t.add('2001:db8::/32', 'doc')
+    t.add('2001:db8:0:1::/64', 'doc-one')
+    t.add('2001:db8:0:1::5/128', 'doc-one-five')
+    return t
+
+CASES = [
+    ('10.0.0.1', 'ten'),
+    ('10.1.0.1', 'ten-one'),
+    ('10.1.2.255', 'ten-one-two'),
+    ('10.1.3.0', 'ten-one'),
+    ('10.2.255.255', 'ten-two'),
+    ('10.255.255.255', 'ten'),
+    ('11.0.0.0', None),
+    ('9.255.255.255', None),
+    ('2001:db8::1', 'doc'),
+    ('2001:db8:0:1::4', 'doc-one'),
+    ('2001:db8:0:1::5', 'doc-one-five'),
+    ('2001:db8:0:1::6', 'doc-one'),
+    ('2001:db8:0:2::', 'doc'),
+    ('2001:db9::', None),
+]
+
+def test_parse_prefix():
+    assert parse_prefix('10.1.2.3/8') == (4, 10 << 24, (11 << 24) - 1)
+    assert parse_prefix('1.2.3.4') == (4, 0x01020304, 0x01020304)
+    assert parse_prefix('::/0') == (6, 0, (1 << 128) - 1)
+
+@raises(NFDumpError)
+def test_parse_prefix_bad():
+    parse_prefix('10.0.0.0/33')
+
+def test_find():
+    t = table()
+    for ip, value in CASES:
+        assert t.find(ip) == value, (ip, t.find(ip), value)
+
+def test_lookup_vectorized():
+    t = table()
+    ips = [ip for ip, value in CASES] * 3
+    assert t.lookup(ips) == [value for ip, value in CASES] * 3
+
+def test_lookup_without_numpy():
+    numpy = prefix.numpy
+    prefix.numpy = None
+    try:
+        t = table()
+        ips = [ip for ip, value in CASES] * 3
+        assert t.lookup(ips) == [value for ip, value in CASES] * 3
+    finally:
+        prefix.numpy = numpy
+
+def test_random_against_brute_force():
+    r = random.Random(1)
+    t = PrefixTable()
+    prefixes = []
+    for i in range(300):
+        bits = r.randint(4, 28)
+        first, last = parse_prefix('%d.%d.0.0/%d' % (r.randint(0, 15), r.randint(0, 255), bits))[1:]
+        prefixes.append((last - first, i, first, last))
+        t.add('%s/%d' % (pynfdump.nfdump.IP(first), bits), i)
+    addrs = ['%s' % pynfdump.nfdump.IP(r.randint(0, (16 << 24) - 1)) for i in range(2000)]
+    for ip, got in zip(addrs, t.lookup(addrs)):
+        a = parse_prefix(ip)[1]
+        #the smallest containing prefix, the latest added among equals
+        matches = sorted((size, -i) for size, i, first, last in prefixes if first <= a <= last)
+        want = matches and -matches[0][1] or None
+        assert got == want, (ip, got, want)
+
+def test_load():
+    fd, fn = tempfile.mkstemp()
+    os.write(fd, "# pfx2as\n10.0.0.0\t8\t65001\n10.1.0.0/16\t65002\n\n2001:db8::\t32\t65003\n")
+    os.close(fd)
+    try:
+        t = PrefixTable.load(fn)
+    finally:
+        os.unlink(fn)
+    assert len(t) == 3
+    assert t.find('10.0.0.1') == {'asn': '65001', 'prefix': '10.0.0.0/8'}
+    assert t.find('10.1.0.1')['asn'] == '65002'
+    assert t.find('2001:db8::1')['asn'] == '65003'
+
+def test_annotate():
+    t = PrefixTable()
+    t.add('1.2.3.0/24', {'asn': 65001, 'cc': 'US'})
+    t.add('5.6.0.0/16', {'asn': 65002, 'cc': 'CA'})
+    lines = ["2|1000|0|1010|0|6|0|0|0|16909060|1234|0|0|0|84281096|80|0|0|0|0|18|0|10|1000",
+             "2|1000|0|1010|0|6|0|0|0|84281096|80|0|0|0|16909060|1234|0|0|0|0|18|0|10|1000",
+             "2|1000|0|1010|0|6|0|0|0|1|80|0|0|0|2|1234|0|0|0|0|18|0|10|1000"]
+    recs = list(pynfdump.Dumper().parse_search(lines))
+    recs = list(t.annotate(recs, 'srcip', ['asn', 'cc'], prefix='src', batch_size=2))
+    recs = list(t.annotate(recs, 'dstip', ['asn']))
+    assert [(r['srcasn'], r['srccc'], r['asn']) for r in recs] == [
+        (65001, 'US', 65002), (65002, 'CA', 65001), (None, None, None)]
+
+def test_annotate_stats():
+    lines = ["2|1000|0|1010|0|0|0|0|0|16909060|10|20|3000|2|2400|150"]
+    recs = list(pynfdump.Dumper().parse_stats(lines, 'srcip'))
+    rec, = table().annotate(recs)
+    assert rec['prefix_info'] is None
+    t = PrefixTable()
+    t.add('1.2.3.4/32', 'host')
+    rec, = t.annotate(recs)
+    assert rec['prefix_info'] == 'host'
+
+def test_lookup_batch():
+    t = table()
+    lines = ["2|1000|0|1010|0|6|0|0|0|167838209|1234|0|0|0|167838209|80|0|0|0|0|18|0|10|1000",
+             "10|1000|0|1010|0|6|536939960|1|0|5|1234|0|0|0|1|80|0|0|0|0|18|0|10|1000"]
+    batch = FlowBatch.from_lines(lines)
+    assert t.lookup_batch(batch) == ['ten-one-two', 'doc-one-five']
+
+def test_enricher_backend():
+    e = Enricher(table())
+    info = e.lookup(['10.1.0.1', '11.0.0.0'])
+    assert info == {'10.1.0.1': 'ten-one', '11.0.0.0': None}
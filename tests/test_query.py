@@ -0,0 +1,90 @@
+import time
+import threading
+from StringIO import StringIO
+
+from pynfdump.nfdump import QueryTimeout
+
+from fakes import Fakes, Fixture, FLOW
+
+from nose.tools import raises
+
+class Setup(Fakes):
+    def __init__(self):
+        Fakes.__init__(self)
+        #prints some flows and then hangs
+        self.nfdump([FLOW] * 5, hang=30)
+
+    def dumper(self, remote=False):
+        if remote:
+            d = Fakes.dumper(self, remote_host='collector')
+        else:
+            d = Fakes.dumper(self)
+        d.set_where(filename="nfcapd.200903231000")
+        return d
+
+    def nfdump_running(self):
+        return self.running()
+
+s = Fixture(Setup)
+setup, teardown = s.setup, s.teardown
+
+def test_max_rows():
+    start = time.time()
+    q = s.dumper().search(max_rows=3)
+    assert len(list(q)) == 3
+    assert q.truncated
+    assert not s.nfdump_running()
+    assert time.time() - start < 10
+
+@raises(QueryTimeout)
+def test_timeout():
+    try:
+        list(s.dumper().search(timeout=0.5))
+    finally:
+        assert not s.nfdump_running()
+
+@raises(QueryTimeout)
+def test_export_timeout():
+    try:
+        s.dumper().export('csv', ['srcip'], StringIO(), timeout=0.5)
+    finally:
+        assert not s.nfdump_running()
+
+def test_export_max_bytes():
+    f = StringIO()
+    assert s.dumper().export('csv', ['srcip'], f, max_bytes=1) == 0
+    assert not s.nfdump_running()
+
+@raises(QueryTimeout)
+def test_heavy_hitters_timeout():
+    try:
+        s.dumper().heavy_hitters('srcip', timeout=0.5)
+    finally:
+        assert not s.nfdump_running()
+
+def test_cancel_from_thread():
+    q = s.dumper().search(handle=True)
+    threading.Timer(0.5, q.cancel).start()
+    assert len(list(q)) == 5
+    assert q.cancelled
+    assert not s.nfdump_running()
+
+def test_context_manager():
+    with s.dumper().search(handle=True) as q:
+        for rec in q:
+            break
+    assert not s.nfdump_running()
+
+def test_generator_close_kills():
+    records = s.dumper().search()
+    records.next()
+    start = time.time()
+    records.close()
+    assert time.time() - start < 10
+    assert not s.nfdump_running()
+
+def test_remote_killed():
+    q = s.dumper(remote=True).search(handle=True)
+    assert q.next().dstport == 80
+    q.close()
+    assert not s.nfdump_running()
@@ -0,0 +1,60 @@
+import os
+import datetime
+
+import pynfdump
+from pynfdump.rollup import RollupIndex
+
+from fakes import Fakes, Fixture
+
+class Setup(Fakes):
+    def __init__(self):
+        Fakes.__init__(self)
+        self.nfdump(["Ident: test", "Flows: 10", "Flows_tcp: 6", "Bytes: 1000", "First: 1235500152"])
+        self.src = self.path("live", "src")
+        for m in range(0, 60, 5):
+            self.add("nfcapd.2009032310%02d" % m)
+        self.index = RollupIndex(self.path("rollup.db"))
+
+    def add(self, name):
+        self.write(os.path.join("live", "src", name), "data")
+
+    def dumper(self):
+        return Fakes.dumper(self, self.dir, sources=['src'], rollup=self.index)
+
+s = Fixture(Setup)
+setup, teardown = s.setup, s.teardown
+
+def test_timeseries():
+    d = s.dumper()
+    series = d.timeseries("2009-03-23 10:00", "2009-03-23 10:55", 1800)
+    assert len(s.calls()) == 12
+    assert len(series) == 2
+    when, totals = series[0]
+    assert when == datetime.datetime(2009, 3, 23, 10, 0)
+    assert totals == {'flows': 60, 'flows_tcp': 36, 'bytes': 6000}
+    assert series[1][0] == datetime.datetime(2009, 3, 23, 10, 30)
+
+    #covered ranges don't run nfdump again
+    again = d.timeseries("2009-03-23 10:00", "2009-03-23 10:55", 1800)
+    assert again == series
+    assert len(s.calls()) == 12
+
+    #new files are filled in
+    s.add("nfcapd.200903231100")
+    series = d.timeseries("2009-03-23 10:00", "2009-03-23 11:00", 3600)
+    assert len(s.calls()) == 13
+    assert [t['flows'] for when, t in series] == [120, 10]
+
+def test_empty_buckets():
+    d = s.dumper()
+    series = d.timeseries("2009-03-23 09:00", "2009-03-23 10:00", 1800)
+    assert [t['flows'] for when, t in series] == [0, 0, 10]
+
+def test_requires_index():
+    d = pynfdump.Dumper(s.dir, sources=['src'], executable_path=s.exe)
+    try:
+        d.timeseries("2009-03-23 10:00", "2009-03-23 10:55")
+    except pynfdump.NFDumpError:
+        pass
+    else:
+        assert False, "expected NFDumpError"
@@ -0,0 +1,260 @@
+import random
+
+import pynfdump
+from pynfdump import sketch
+from pynfdump.sketch import CountMinSketch, SpaceSaving, HeavyHitters, fingerprint, fingerprints
+from pynfdump.nfdump import NFDumpError
+
+from fakes import Fakes
+
+import numpy
+from nose.tools import raises
+
+def zipf_stream(n, keys, seed):
+    r = random.Random(seed)
+    weights = [1.0 / (i + 1) for i in range(keys)]
+    total = sum(weights)
+    cum = []
+    c = 0
+    for w in weights:
+        c += w / total
+        cum.append(c)
+    import bisect
+    return [min(bisect.bisect(cum, r.random()), keys - 1) for i in range(n)]
+
+def exact(stream):
+    counts = {}
+    for k in stream:
+        counts[k] = counts.get(k, 0) + 1
+    return counts
+
+def test_fingerprints_match():
+    cols = [numpy.array([1, 2, 3], dtype=numpy.uint64), numpy.array([2**63, 5, 0], dtype=numpy.uint64)]
+    assert fingerprints(cols).tolist() == [fingerprint((1, 2**63)), fingerprint((2, 5)), fingerprint((3, 0))]
+
+def test_count_min_bounds():
+    stream = zipf_stream(20000, 5000, 1)
+    cms = CountMinSketch(width=1024, depth=4)
+    for k in stream:
+        cms.add(fingerprint((k,)))
+    bound = cms.error_bound()
+    assert bound == cms.epsilon * 20000
+    for k, c in exact(stream).items():
+        est = cms.estimate(fingerprint((k,)))
+        assert c <= est <= c + bound, (k, c, est)
+
+def test_count_min_vectorized():
+    stream = zipf_stream(5000, 1000, 2)
+    a = CountMinSketch(width=256)
+    for k in stream:
+        a.add(fingerprint((k,)), 3)
+    b = CountMinSketch(width=256)
+    b.add_many(fingerprints([numpy.array(stream, dtype=numpy.uint64)]), [3] * len(stream))
+    assert (a.table == b.table).all()
+    assert a.total == b.total == 15000
+
+@raises(NFDumpError)
+def test_count_min_merge_mismatch():
+    CountMinSketch(width=256).merge(CountMinSketch(width=512))
+
+def check_space_saving(ss, counts):
+    total = sum(counts.values())
+    for k, count, error in ss.top(len(ss)):
+        assert count - error <= counts.get(k, 0) <= count, (k, count, error, counts.get(k))
+    #every key above total / capacity is tracked
+    for k, c in counts.items():
+        if c > total / float(ss.capacity):
+            assert k in ss.counters, k
+
+def test_space_saving():
+    stream = zipf_stream(20000, 5000, 3)
+    ss = SpaceSaving(100)
+    for k in stream:
+        ss.add(k)
+    assert len(ss) == 100
+    counts = exact(stream)
+    check_space_saving(ss, counts)
+    assert [k for k, count, error in ss.top(3)] == [0, 1, 2]
+
+def test_space_saving_merge():
+    a_stream = zipf_stream(10000, 5000, 4)
+    b_stream = zipf_stream(10000, 5000, 5)
+    a = SpaceSaving(100)
+    b = SpaceSaving(100)
+    for k in a_stream:
+        a.add(k)
+    for k in b_stream:
+        b.add(k)
+    a.merge(b)
+    assert a.total == 20000
+    assert len(a) == 100
+    check_space_saving(a, exact(a_stream + b_stream))
+
+LINES = [
+    "2|1000|0|1010|0|6|0|0|0|1|1234|0|0|0|2|80|0|0|0|0|18|0|10|1000",
+    "2|1000|0|1010|0|6|0|0|0|1|1234|0|0|0|3|80|0|0|0|0|18|0|10|500",
+    "2|1000|0|1010|0|17|0|0|0|4|53|0|0|0|4|53|0|0|0|0|0|0|1|100",
+    "10|1000|0|1010|0|6|536939960|0|0|1|1234|0|0|0|2|443|0|0|0|0|18|0|5|5000",
+]
+
+def records():
+    return list(pynfdump.Dumper().parse_search(LINES))
+
+def batch():
+    return pynfdump.nfdump.FlowBatch.from_lines(LINES)
+
+def test_heavy_hitters_records():
+    hh = HeavyHitters('ip', 'bytes')
+    hh.update(records())
+    top = [(str(k), est, err) for k, est, err in hh.top(4)]
+    assert sorted(top[:2]) == [('2001:db8::1', 5000, 0), ('::2', 5000, 0)]
+    assert top[2:] == [('0.0.0.1', 1500, 0), ('0.0.0.2', 1000, 0)]
+    #a flow from an address to itself counts once
+    key = [k for k, est, err in hh.top(10) if str(k) == '0.0.0.4'][0]
+    assert hh.estimate(key) == (100, 0)
+
+def test_heavy_hitters_batches_match_records():
+    for stat in ['ip', 'dstport', 'port', 'proto']:
+        for order in ['flows', 'packets', 'bytes']:
+            a = HeavyHitters(stat, order)
+            a.update(records())
+            b = HeavyHitters(stat, order)
+            b.add_batch(batch())
+            assert sorted(a.top(10)) == sorted(b.top(10)), (stat, order)
+            assert (a.sketch.table == b.sketch.table).all()
+
+def test_heavy_hitters_merge():
+    a = HeavyHitters('dstport', 'flows')
+    a.update(records()[:2])
+    b = HeavyHitters('dstport', 'flows')
+    b.update(records()[2:])
+    a.merge(b)
+    assert [(k, est) for k, est, err in a.top(1)] == [(80, 2)]
+
+@raises(NFDumpError)
+def test_heavy_hitters_bad_statistic():
+    HeavyHitters('color')
+
+def fake_dumper(s):
+    s.nfdump(["2|1000|0|1010|0|6|0|0|0|1|1234|0|0|0|2|80|0|0|0|0|18|0|10|1000",
+              "2|1000|0|1010|0|6|0|0|0|1|1234|0|0|0|3|22|0|0|0|0|18|0|10|500"])
+    dumper = s.dumper(s.dir, sources=['src'])
+    dumper.set_where("2009-03-23 10:00", "2009-03-23 12:55")
+    return dumper
+
+def test_dumper_heavy_hitters():
+    s = Fakes()
+    try:
+        top = fake_dumper(s).heavy_hitters('dstport', 'bytes', n=2, workers=2)
+        assert top == [(80, 3000, 0), (22, 1500, 0)]
+        assert len(s.calls()) == 3
+    finally:
+        s.cleanup()
+
+def test_heavy_hitters_batch_over_capacity():
+    ports = zipf_stream(3000, 200, 6)
+    lines = ["2|1000|0|1010|0|6|0|0|0|1|1234|0|0|0|2|%d|0|0|0|0|18|0|1|100" % p for p in ports]
+    hh = HeavyHitters('dstport', 'flows', capacity=20)
+    for i in range(0, len(lines), 1000):
+        hh.add_batch(pynfdump.nfdump.FlowBatch.from_lines(lines[i:i+1000]))
+    assert hh.total == 3000
+    counts = exact(ports)
+    check_space_saving(hh.summary, counts)
+    for key, est, err in hh.top(5):
+        assert est - err <= counts[key] <= est
+    assert hh.top(1)[0].key == 0
+
+from pynfdump.sketch import HyperLogLog, DistinctCounter
+import pickle
+
+def test_hyperloglog_accuracy():
+    for n in [10, 1000, 50000]:
+        h = HyperLogLog(12)
+        for i in range(n):
+            h.add(fingerprint((i,)))
+        assert abs(h.estimate() - n) < n * 0.05 + 1, (n, h.estimate())
+
+def test_hyperloglog_vectorized_matches():
+    values = numpy.arange(20000, dtype=numpy.uint64) * 7
+    a = HyperLogLog(10)
+    for v in values.tolist():
+        a.add(fingerprint((v,)))
+    b = HyperLogLog(10)
+    b.add_many(fingerprints([values]))
+    assert a.registers == b.registers
+    assert abs(len(a) - 20000) < 20000 * 0.1
+
+def test_hyperloglog_merge_and_serialize():
+    a = HyperLogLog(10)
+    b = HyperLogLog(10)
+    for i in range(5000):
+        a.add(fingerprint((i,)))
+        b.add(fingerprint((i + 2500,)))
+    small = HyperLogLog(10)
+    for i in range(5):
+        small.add(fingerprint((i,)))
+    assert small.registers is None
+    for h in [a, small]:
+        copy = HyperLogLog.from_bytes(h.to_bytes())
+        assert copy.estimate() == h.estimate()
+        assert pickle.loads(pickle.dumps(h)).estimate() == h.estimate()
+    assert len(small) == 5
+    a.merge(b)
+    assert abs(len(a) - 7500) < 7500 * 0.1
+    a.merge(small)
+    assert abs(len(a) - 7500) < 7500 * 0.1
+
+def test_hyperloglog_small_alpha():
+    from pynfdump.sketch import _alpha
+    assert [_alpha(HyperLogLog(p).m) for p in (4, 5, 6)] == [0.673, 0.697, 0.709]
+    assert abs(_alpha(1 << 7) - 0.7213 / (1 + 1.079 / 128)) < 1e-12
+
+@raises(NFDumpError)
+def test_hyperloglog_merge_mismatch():
+    HyperLogLog(10).merge(HyperLogLog(11))
+
+def scan_lines():
+    #source 1 scans 300 addresses, source 2 talks to 3, over port 80 and 22
+    lines = []
+    for i in range(300):
+        lines.append("2|1000|0|1010|0|6|0|0|0|1|1234|0|0|0|%d|%d|0|0|0|0|2|0|1|40" % (1000 + i, 80 + (i % 2) * -58))
+    for i in range(30):
+        lines.append("2|1000|0|1010|0|6|0|0|0|2|1234|0|0|0|%d|443|0|0|0|0|18|0|10|1000" % (i % 3))
+    return lines
+
+def test_distinct_counter():
+    lines = scan_lines()
+    a = DistinctCounter('srcip', 'dstip')
+    a.update(pynfdump.Dumper().parse_search(lines))
+    (k1, c1), (k2, c2) = a.top(2)
+    assert (str(k1), str(k2)) == ('0.0.0.1', '0.0.0.2')
+    assert abs(c1 - 300) < 15
+    assert c2 == 3
+
+    b = DistinctCounter('srcip', 'dstip')
+    b.add_batch(pynfdump.nfdump.FlowBatch.from_lines(lines))
+    assert a.top(2) == b.top(2)
+    for k in a.groups:
+        assert a.groups[k].to_bytes() == b.groups[k].to_bytes()
+
+def test_distinct_counter_tuple_and_merge():
+    lines = scan_lines()
+    a = DistinctCounter(['srcip', 'dstport'], 'dstip')
+    a.add_batch(pynfdump.nfdump.FlowBatch.from_lines(lines[:150]))
+    b = DistinctCounter(['srcip', 'dstport'], 'dstip')
+    b.add_batch(pynfdump.nfdump.FlowBatch.from_lines(lines[150:]))
+    b = pickle.loads(pickle.dumps(b))
+    a.merge(b)
+    top = a.top(3)
+    assert sorted((str(k[0]), k[1]) for k, c in top[:2]) == [('0.0.0.1', 22), ('0.0.0.1', 80)]
+    assert all(abs(c - 150) < 8 for k, c in top[:2])
+    assert (str(top[2][0][0]), top[2][0][1], top[2][1]) == ('0.0.0.2', 443, 3)
+
+def test_dumper_distinct_count():
+    s = Fakes()
+    try:
+        top = fake_dumper(s).distinct_count('srcip', 'dstport', workers=2)
+        assert [(str(k), c) for k, c in top] == [('0.0.0.1', 2)]
+        assert len(s.calls()) == 3
+    finally:
+        s.cleanup()
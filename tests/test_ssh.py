@@ -0,0 +1,102 @@
+import os
+import time
+import threading
+
+import pynfdump
+from pynfdump.ssh import SSHPool
+
+from fakes import Fakes, MASTER_SSH
+
+class Setup(Fakes):
+    def __init__(self):
+        Fakes.__init__(self, MASTER_SSH)
+
+    def calls(self):
+        return [l.split() for l in self.ssh_calls()]
+
+    def masters(self, host):
+        return [c for c in self.calls() if "ControlMaster=yes" in c and host in c]
+
+def control_path(cmd):
+    for arg in cmd:
+        if arg.startswith("ControlPath="):
+            return arg.split("=", 1)[1]
+
+def test_master_reused():
+    s = Setup()
+    try:
+        pool = SSHPool(ssh=s.ssh, socket_dir=s.dir)
+        for x in range(3):
+            cmd = pool.command("collector")
+            assert list(pynfdump.nfdump.run(cmd + ["echo", "hi"])) == ["hi\n"]
+        masters = [c for c in s.calls() if "ControlMaster=yes" in c]
+        assert len(masters) == 1
+        assert "ControlMaster=no" in cmd
+        pool.close()
+        assert not os.path.exists(control_path(cmd))
+    finally:
+        s.cleanup()
+
+def test_dead_master_restarted():
+    s = Setup()
+    try:
+        pool = SSHPool(ssh=s.ssh, socket_dir=s.dir, check_interval=0)
+        cmd = pool.command("collector")
+        os.unlink(control_path(cmd))
+        pool.command("collector")
+        masters = [c for c in s.calls() if "ControlMaster=yes" in c]
+        assert len(masters) == 2
+    finally:
+        s.cleanup()
+
+def test_dumper_uses_pool():
+    s = Setup()
+    try:
+        pool = SSHPool(ssh=s.ssh, socket_dir=s.dir)
+        d = pynfdump.Dumper(remote_host="collector", ssh_pool=pool)
+        cmd = d._base_cmd()
+        assert cmd[0] == s.ssh
+        assert "ControlMaster=no" in cmd
+        assert "collector" in cmd
+    finally:
+        s.cleanup()
+
+def test_batch_mode():
+    s = Setup()
+    try:
+        pool = SSHPool(ssh=s.ssh, socket_dir=s.dir, connect_timeout=5)
+        cmd = pool.command("collector")
+        assert "BatchMode=yes" in cmd
+        assert "ConnectTimeout=5" in cmd
+        assert "BatchMode=yes" in s.masters("collector")[0]
+    finally:
+        s.cleanup()
+
+def test_failed_master_backoff():
+    s = Setup()
+    try:
+        pool = SSHPool(ssh=s.ssh, socket_dir=s.dir, check_interval=0, retry_interval=60)
+        for x in range(3):
+            cmd = pool.command("down")
+            assert control_path(cmd) is None
+        assert len(s.masters("down")) == 1
+        pool.retry_interval = 0
+        pool.masters["down"][0].retry_at = 0
+        pool.command("down")
+        assert len(s.masters("down")) == 2
+    finally:
+        s.cleanup()
+
+def test_slow_host_does_not_block_others():
+    s = Setup()
+    try:
+        pool = SSHPool(ssh=s.ssh, socket_dir=s.dir)
+        t = threading.Thread(target=pool.command, args=("slow",))
+        t.start()
+        time.sleep(0.2)
+        start = time.time()
+        pool.command("collector")
+        assert time.time() - start < 0.7
+        t.join()
+    finally:
+        s.cleanup()
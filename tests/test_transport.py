@@ -0,0 +1,109 @@
+import gzip
+from StringIO import StringIO
+
+import pynfdump
+from pynfdump import transport
+from pynfdump.nfdump import NFDumpError
+
+from fakes import Fakes, Fixture, Error, nfcapd, block, records, check_records
+
+from nose.tools import raises
+
+LINE = "2|1000|100|1010|200|6|0|0|0|16909060|1234|0|0|0|84281096|80|3|4|0|0|18|0|10|1000"
+
+class Setup(Fakes):
+    def dumper(self, binary, host):
+        """Return a Dumper for a host whose nfdump writes nfcapd data for
+        -w -, or fails like an old nfdump"""
+        if binary:
+            output = nfcapd([block(records())])
+        else:
+            output = Error("nfdump: invalid option -- w")
+        self.nfdump([LINE], cases=[('*"-w -"*', output)])
+        d = Fakes.dumper(self, remote_host=host, transport='binary')
+        d.set_where(filename="nfcapd.200903231000")
+        return d
+
+    def calls(self):
+        calls = Fakes.calls(self)
+        self.reset()
+        return calls
+
+    def cleanup(self):
+        Fakes.cleanup(self)
+        transport.forget()
+
+s = Fixture(Setup)
+setup, teardown = s.setup, s.teardown
+
+def gzipped(data):
+    out = StringIO()
+    f = gzip.GzipFile(fileobj=out, mode='wb')
+    f.write(data)
+    f.close()
+    return out.getvalue()
+
+def test_gunzip_reader():
+    data = gzipped("x" * 10000)
+    chunks = [data[i:i+7] for i in range(0, len(data), 7)]
+    r = transport.GunzipReader(chunks)
+    assert r.read(3) == "xxx"
+    assert r.read(20000) == "x" * 9997
+    assert r.read(1) == ""
+
+@raises(NFDumpError)
+def test_gunzip_reader_garbage():
+    transport.GunzipReader(["not gzip data"]).read(10)
+
+def test_binary_transport():
+    d = s.dumper(binary=True, host='new')
+    check_records(list(d.search()))
+    calls = s.calls()
+    assert len(calls) == 1
+    assert '-w -' in calls[0]
+    assert transport.supported('new') is True
+
+def test_fallback_to_pipe():
+    d = s.dumper(binary=False, host='old')
+    recs = list(d.search())
+    assert len(recs) == 1
+    assert str(recs[0]['srcip']) == '1.2.3.4'
+    assert recs[0].dstport == 80
+    assert transport.supported('old') is False
+    assert len(s.calls()) == 2
+
+    #the host is remembered, so the next search goes straight to the pipe
+    assert len(list(d.search())) == 1
+    calls = s.calls()
+    assert len(calls) == 1
+    assert '-o pipe' in calls[0]
+
+def test_query_error_keeps_transport():
+    d = s.dumper(binary=True, host='typo')
+    list(d.search())
+    assert transport.supported('typo') is True
+    s.nfdump(Error("Syntax error"))
+    for host in ('typo', 'fresh'):
+        d.remote_host = host
+        try:
+            list(d.search("proto bogus"))
+        except NFDumpError, e:
+            assert "Syntax error" in str(e)
+        else:
+            assert False, "expected NFDumpError"
+    assert transport.supported('typo') is True
+    assert transport.supported('fresh') is None
+    s.reset()
+
+def test_statistics_use_pipe():
+    d = s.dumper(binary=True, host='stats')
+    try:
+        list(d.search(statistics='srcip'))
+    except Exception:
+        pass
+    assert '-o pipe' in s.calls()[0]
+    assert transport.supported('stats') is None
+
+@raises(NFDumpError)
+def test_unknown_transport():
+    pynfdump.Dumper(transport='carrier pigeon')